@@ -0,0 +1,167 @@
+"""
+Frame times of MappingView (matplotlib) and SceneMappingView (QGraphicsScene)
+for a molecule of N atoms: showing the whole molecule, zoomed in on a
+corner, panning the zoomed in view, and mapping one more atom.
+
+    python benchmarks/canvas_frames.py [N ...]
+"""
+from abc import ABC, abstractmethod
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ.setdefault('PYCGBUILDER_CACHE', 'off')
+
+from matplotlib.figure import Figure
+import networkx as nx
+import numpy as np
+from PyQt5.QtCore import QItemSelectionModel, QRectF, Qt
+from PyQt5.QtWidgets import QApplication
+
+from pycgbuilder.embedding import Embedding
+from pycgbuilder.mapping_widget import MappingModel, MappingView
+from pycgbuilder.scene_view import SCALE, SceneMappingView
+
+ATOMS_PER_BEAD = 4
+# Width of the zoomed in view, in bonds
+ZOOMED = 8
+REPEATS = 3
+
+
+def make_molecule(n_atoms):
+    """
+    A square grid of carbons, each with a hydrogen, and its positions.
+    """
+    side = int(np.ceil(np.sqrt(n_atoms / 2)))
+    graph = nx.Graph()
+    positions = []
+    for x in range(side):
+        for y in range(side):
+            carbon, hydrogen = len(graph), len(graph) + 1
+            graph.add_node(carbon, element='C', atomname='C{}'.format(carbon))
+            graph.add_node(hydrogen, element='H', atomname='H{}'.format(hydrogen))
+            graph.add_edge(carbon, hydrogen)
+            positions.extend([(x, y), (x + 0.35, y + 0.35)])
+            if x:
+                graph.add_edge(carbon - 2 * side, carbon)
+            if y:
+                graph.add_edge(carbon - 2, carbon)
+    return graph, Embedding(list(graph), positions)
+
+
+class Canvas(ABC):
+    """
+    Sets the view of either kind of canvas, and draws a frame.
+    """
+    def __init__(self, view, app):
+        self.view = view
+        self.app = app
+
+    @abstractmethod
+    def frame(self):
+        """
+        Draws the canvas and shows it.
+        """
+
+    @abstractmethod
+    def show(self, low, high):
+        """
+        Shows the part of the molecule between corners `low` and `high`.
+        """
+
+    def timed(self, action=None):
+        durations = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            if action is not None:
+                action()
+            self.view.redraw()
+            self.frame()
+            durations.append(time.perf_counter() - start)
+        return 1000 * min(durations)
+
+
+class MatplotlibCanvas(Canvas):
+    def frame(self):
+        self.view.draw()
+        self.view.repaint()
+
+    def show(self, low, high):
+        self.view.ax.set_xlim(low[0], high[0])
+        self.view.ax.set_ylim(low[1], high[1])
+
+
+class SceneCanvas(Canvas):
+    def frame(self):
+        self.view.viewport().repaint()
+
+    def show(self, low, high):
+        self.view.fitInView(QRectF(low[0] * SCALE, -high[1] * SCALE,
+                                   (high[0] - low[0]) * SCALE, (high[1] - low[1]) * SCALE),
+                            Qt.KeepAspectRatio)
+
+
+def make_canvas(kind, app, graph, embedding):
+    if kind == 'matplotlib':
+        canvas = MatplotlibCanvas(MappingView(Figure()), app)
+    else:
+        canvas = SceneCanvas(SceneMappingView(), app)
+    view = canvas.view
+    view.resize(800, 800)
+    nodes = list(graph)
+    mapping = [nodes[start:start + ATOMS_PER_BEAD]
+               for start in range(0, len(nodes) - 1, ATOMS_PER_BEAD)]
+    model = MappingModel(graph, mapping=mapping, names=['B{}'.format(idx) for idx in range(len(mapping))],
+                         types=['P1'] * len(mapping))
+    view.setModel(model)
+    view.setSelectionModel(QItemSelectionModel(model))
+    # Use the given positions instead of computing a layout
+    view._embeddings['VSEPR'] = embedding
+    view.current_embedding = 'VSEPR'
+    view.show()
+    app.processEvents()
+    return canvas
+
+
+def measure(canvas, embedding):
+    low = embedding.positions.min(axis=0) - 1
+    high = embedding.positions.max(axis=0) + 1
+    times = {}
+    canvas.show(low, high)
+    times['whole'] = canvas.timed()
+    canvas.show(low, low + ZOOMED)
+    times['zoomed'] = canvas.timed()
+    step = np.array([0, 0.])
+
+    def pan():
+        step[0] += 1
+        canvas.show(low + step, low + step + ZOOMED)
+    times['pan'] = canvas.timed(pan)
+    model = canvas.view.model
+    atoms = iter(range(len(embedding)))
+
+    def map_atom():
+        model.setData(model.index(0, 2), next(atoms), Qt.UserRole)
+    times['map atom'] = canvas.timed(map_atom)
+    return times
+
+
+def main(sizes):
+    app = QApplication.instance() or QApplication(sys.argv)
+    kinds = ('matplotlib', 'scene')
+    print('{:>8} {:>10} {:>14} {:>14}'.format('atoms', 'frame', 'matplotlib/ms', 'scene/ms'))
+    for n_atoms in sizes:
+        graph, embedding = make_molecule(n_atoms)
+        results = {}
+        for kind in kinds:
+            canvas = make_canvas(kind, app, graph, embedding)
+            results[kind] = measure(canvas, embedding)
+            canvas.view.close()
+        for frame in results['scene']:
+            print('{:>8} {:>10} {:>14.1f} {:>14.1f}'.format(
+                len(graph), frame, *(results[kind][frame] for kind in kinds)))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000])
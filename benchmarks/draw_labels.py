@@ -0,0 +1,87 @@
+"""
+Time to draw the atom labels of a molecule of N atoms, zoomed out to the
+whole molecule and zoomed in on a corner: one ``ax.text`` per atom, as
+draw_molecule used to do, against AtomLabels.
+
+    python benchmarks/draw_labels.py [N ...]
+"""
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import networkx as nx
+import numpy as np
+
+from pycgbuilder.atom_labels import AtomLabels
+from pycgbuilder.embedding import Embedding
+
+# Width of the zoomed in view, in bonds
+ZOOMED = 8
+
+
+def make_molecule(n_atoms):
+    """
+    A square grid of carbons, each with a hydrogen.
+    """
+    side = int(np.ceil(np.sqrt(n_atoms / 2)))
+    graph = nx.Graph()
+    positions = {}
+    for x in range(side):
+        for y in range(side):
+            graph.add_node((x, y), element='C')
+            graph.add_node((x, y, 'H'), element='H')
+            graph.add_edge((x, y), (x, y, 'H'))
+            positions[(x, y)] = (x, y)
+            positions[(x, y, 'H')] = (x + 0.35, y + 0.35)
+            if x:
+                graph.add_edge((x - 1, y), (x, y))
+            if y:
+                graph.add_edge((x, y - 1), (x, y))
+    labels = {node: '${}_{{{}}}$'.format(element, idx)
+              for idx, (node, element) in enumerate(graph.nodes(data='element'))}
+    return graph, Embedding.from_dict(positions), labels
+
+
+def per_atom(ax, graph, pos, labels):
+    for node, label in labels.items():
+        x, y = pos[node]
+        ax.text(x, y, label, verticalalignment='center_baseline', horizontalalignment='center')
+
+
+def level_of_detail(ax, graph, pos, labels):
+    hydrogens = [node for node in graph if graph.nodes[node]['element'] == 'H']
+    ax.add_artist(AtomLabels(pos, labels, hydrogens))
+
+
+def timed(method, graph, pos, labels, zoom):
+    fig = plt.figure(figsize=(8, 8))
+    ax = fig.add_subplot()
+    ax.set_aspect(1)
+    method(ax, graph, pos, labels)
+    low = pos.positions.min(axis=0) - 1
+    high = pos.positions.max(axis=0) + 1 if not zoom else low + ZOOMED
+    ax.set_xlim(low[0], high[0])
+    ax.set_ylim(low[1], high[1])
+    # The first draw also parses all mathtext, which is cached after.
+    fig.canvas.draw()
+    start = time.perf_counter()
+    fig.canvas.draw()
+    duration = time.perf_counter() - start
+    plt.close(fig)
+    return duration
+
+
+def main(sizes):
+    print('{:>8} {:>24} {:>24}'.format('atoms', 'ax.text (out/in)', 'AtomLabels (out/in)'))
+    for n_atoms in sizes:
+        molecule = make_molecule(n_atoms)
+        old = [timed(per_atom, *molecule, zoom) for zoom in (False, True)]
+        new = [timed(level_of_detail, *molecule, zoom) for zoom in (False, True)]
+        print('{:>8} {:>24} {:>24}'.format(len(molecule[0]), '{:9.3f}s /{:8.3f}s'.format(*old),
+                                           '{:9.3f}s /{:8.3f}s'.format(*new)))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000])
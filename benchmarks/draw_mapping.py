@@ -0,0 +1,76 @@
+"""
+Time to draw the mapping pies for N atoms: one ``ax.pie`` per atom, as
+MappingView used to do, against a single PolyCollection.
+
+    python benchmarks/draw_mapping.py [N ...]
+"""
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from pycgbuilder.draw_mol import draw_pies
+
+N_BEADS = 20
+# Drawing one pie per atom gets too slow to wait for beyond this.
+MAX_PER_ATOM = 3000
+
+
+def make_mapping(n_atoms, seed=0):
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_atoms)))
+    centers = np.column_stack([np.arange(n_atoms) % side, np.arange(n_atoms) // side])
+    sizes = np.zeros((n_atoms, N_BEADS))
+    sizes[np.arange(n_atoms), rng.integers(N_BEADS, size=n_atoms)] = 1
+    # A third of the atoms is shared between two beads
+    shared = rng.random(n_atoms) < 1 / 3
+    sizes[np.nonzero(shared)[0], rng.integers(N_BEADS, size=shared.sum())] += 1
+    return centers, sizes
+
+
+def per_atom(ax, centers, sizes, colors):
+    for center, size in zip(centers, sizes):
+        used = np.nonzero(size)[0]
+        pie = ax.pie(size[used], center=center, radius=0.45, colors=colors[used])
+        for bd_idx, wedge in zip(used, pie[0]):
+            if bd_idx == 0:
+                wedge.set_linewidth(1)
+                wedge.set_edgecolor('black')
+
+
+def batched(ax, centers, sizes, colors):
+    draw_pies(ax, centers, sizes, colors, radius=0.45, highlight=0)
+
+
+def timed(method, centers, sizes, colors):
+    fig = plt.figure(figsize=(8, 8))
+    ax = fig.add_subplot()
+    start = time.perf_counter()
+    method(ax, centers, sizes, colors)
+    build = time.perf_counter() - start
+    ax.set_xlim(centers[:, 0].min() - 1, centers[:, 0].max() + 1)
+    ax.set_ylim(centers[:, 1].min() - 1, centers[:, 1].max() + 1)
+    fig.canvas.draw()
+    total = time.perf_counter() - start
+    plt.close(fig)
+    return build, total
+
+
+def main(sizes):
+    colors = np.array([plt.get_cmap('tab20')(idx % 20) for idx in range(N_BEADS)])
+    print('{:>8} {:>22} {:>22}'.format('atoms', 'ax.pie (build/total)', 'collection (build/total)'))
+    for n_atoms in sizes:
+        centers, bead_sizes = make_mapping(n_atoms)
+        if n_atoms <= MAX_PER_ATOM:
+            old = '{:9.3f}s /{:8.3f}s'.format(*timed(per_atom, centers, bead_sizes, colors))
+        else:
+            old = '-'
+        new = '{:9.3f}s /{:8.3f}s'.format(*timed(batched, centers, bead_sizes, colors))
+        print('{:>8} {:>22} {:>22}'.format(n_atoms, old, new))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 3000, 10000, 50000])
@@ -0,0 +1,66 @@
+"""
+Time to guess the bonds of a box of N water molecules, as load_pdb does for
+PDB files without CONECT records: vermouth's MakeBonds(allow_name=False), as
+load_pdb used to do, against guess_bonds. Also checks that both find the
+same bonds.
+
+    python benchmarks/guess_bonds.py [N ...]
+"""
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+from vermouth.molecule import Molecule
+from vermouth.processors import MakeBonds
+from vermouth.system import System
+
+from pycgbuilder.bonds import guess_bonds
+
+# Distance between water molecules, and their geometry, in nm.
+SPACING = 0.31
+WATER = np.array([[0, 0, 0], [0.0957, 0, 0], [-0.024, 0.0927, 0]])
+
+
+def make_water_box(n_waters, seed=0):
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(n_waters ** (1 / 3)))
+    molecule = Molecule()
+    for resid in range(n_waters):
+        origin = np.unravel_index(resid, (side, side, side)) * np.full(3, SPACING)
+        rotation, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        for name, element, position in zip(('OW', 'HW1', 'HW2'), 'OHH', WATER @ rotation):
+            molecule.add_node(len(molecule), atomname=name, element=element, resname='SOL',
+                              resid=resid, chain='A', insertion_code='',
+                              position=origin + position)
+    return molecule
+
+
+def make_bonds(molecule):
+    system = System()
+    system.add_molecule(molecule)
+    MakeBonds(allow_name=False).run_system(system)
+    return nx.union_all(system.molecules)
+
+
+def timed(func, molecule):
+    start = time.perf_counter()
+    result = func(molecule)
+    return time.perf_counter() - start, result
+
+
+def main(sizes):
+    print('{:>8} {:>8} {:>12} {:>12} {:>6}'.format('atoms', 'bonds', 'MakeBonds', 'guess_bonds',
+                                                    'same'))
+    for n_waters in sizes:
+        molecule = make_water_box(n_waters)
+        old_time, old = timed(make_bonds, molecule.copy())
+        new = molecule.copy()
+        new_time, _ = timed(guess_bonds, new)
+        same = set(map(frozenset, old.edges)) == set(map(frozenset, new.edges))
+        print('{:>8} {:>8} {:>11.3f}s {:>11.3f}s {:>6}'.format(
+            len(molecule), len(new.edges), old_time, new_time, str(same)))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 30000])
@@ -0,0 +1,89 @@
+"""
+Time to match the atoms of a molecule to a copy with its atoms in random
+order, as merge_molecules does for a PDB file and a SMILES string: networkx'
+VF2 GraphMatcher with an element matcher, as merge_molecules used to do,
+against find_isomorphism. VF2 is given up on after TIME_LIMIT seconds.
+
+    python benchmarks/match_molecules.py [REPEATS ...]
+"""
+import random
+import sys
+import time
+
+import networkx as nx
+from pysmiles import add_explicit_hydrogens, read_smiles
+
+from pycgbuilder.matching import find_isomorphism
+
+TIME_LIMIT = 30
+MOLECULES = {
+    'POPC': 'CCCCCCCCC=CCCCCCCCC(=O)OCC(COP(=O)([O-])OCC[N+](C)(C)C)OC(=O)CCCCCCCCCCCCCCC',
+    'C60': 'c12c3c4c5c1c6c7c8c2c9c1c3c2c3c4c4c%10c5c5c6c6c7c7c%11c8c9c8c9c1c2c1c2c3c3c4c4'
+           'c%10c5c5c6c6c7c7c%11c8c8c9c1c1c2c3c2c4c5c6c3c7c8c1c23',
+}
+# Start and repeating unit of polymers
+POLYMERS = {
+    'PEG': ('O', 'CCO'),
+    'PP': ('C', 'C(C)C'),
+}
+
+
+class TimedOut(Exception):
+    pass
+
+
+class LimitedMatcher(nx.isomorphism.GraphMatcher):
+    def __init__(self, *args, deadline, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deadline = deadline
+
+    def semantic_feasibility(self, G1_node, G2_node):
+        if time.perf_counter() > self.deadline:
+            raise TimedOut
+        return super().semantic_feasibility(G1_node, G2_node)
+
+
+def shuffled(graph, seed=0):
+    rng = random.Random(seed)
+    nodes = list(graph)
+    rng.shuffle(nodes)
+    edges = list(graph.edges)
+    rng.shuffle(edges)
+    copy = nx.Graph()
+    copy.add_nodes_from((node, graph.nodes[node]) for node in nodes)
+    copy.add_edges_from(edges)
+    return copy
+
+
+def vf2(graph1, graph2):
+    matcher = LimitedMatcher(graph1, graph2, nx.isomorphism.categorical_node_match('element', None),
+                             deadline=time.perf_counter() + TIME_LIMIT)
+    return next(matcher.isomorphisms_iter())
+
+
+def timed(method, graph1, graph2):
+    start = time.perf_counter()
+    try:
+        method(graph1, graph2)
+    except TimedOut:
+        return float('inf')
+    return time.perf_counter() - start
+
+
+def main(repeats):
+    print('{:>10} {:>8} {:>12} {:>18}'.format('molecule', 'atoms', 'VF2', 'find_isomorphism'))
+    molecules = dict(MOLECULES)
+    for name, (start, unit) in POLYMERS.items():
+        for n_repeats in repeats:
+            molecules['{}{}'.format(name, n_repeats)] = start + unit * n_repeats
+    for name, smiles in molecules.items():
+        smiles_mol = read_smiles(smiles)
+        add_explicit_hydrogens(smiles_mol)
+        pdb_mol = shuffled(smiles_mol)
+        print('{:>10} {:>8} {:>11.3f}s {:>17.3f}s'.format(
+            name, len(smiles_mol), timed(vf2, pdb_mol, smiles_mol),
+            timed(find_isomorphism, pdb_mol, smiles_mol)))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000])
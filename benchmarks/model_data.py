@@ -0,0 +1,76 @@
+"""
+Calls per second of MappingModel.data for the roles a QTableView asks for
+while scrolling, with and without the cached colours and atom names.
+
+    python benchmarks/model_data.py [N_BEADS ...]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import networkx as nx
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QApplication
+
+from pycgbuilder.draw_mol import colormap
+from pycgbuilder.mapping_widget import MappingModel
+
+ATOMS_PER_BEAD = 4
+ROLES = [('display', Qt.DisplayRole), ('background', Qt.BackgroundRole),
+         ('decoration', Qt.DecorationRole)]
+
+
+class UncachedModel(MappingModel):
+    """
+    MappingModel.data as it was before colours and atom names were cached.
+    """
+    def data(self, index, role):
+        row = index.row()
+        if role == Qt.DisplayRole and index.column() == 2:
+            return ' '.join(self.molecule.nodes[idx]['atomname']
+                            for idx in sorted(self._members[row]))
+        elif role == Qt.BackgroundRole:
+            cmap = colormap('tab20')
+            return QColor.fromRgbF(*cmap.colors[(row*2 + 1) % cmap.N])
+        elif role == Qt.DecorationRole and index.column() == 0:
+            cmap = colormap('tab10')
+            return QColor.fromRgbF(*cmap.colors[row % cmap.N])
+        return super().data(index, role)
+
+
+def make_model(model_class, n_beads):
+    molecule = nx.path_graph(n_beads * ATOMS_PER_BEAD)
+    for idx in molecule:
+        molecule.nodes[idx]['atomname'] = 'C{}'.format(idx)
+    mapping = [list(range(bd_idx * ATOMS_PER_BEAD, (bd_idx + 1) * ATOMS_PER_BEAD))
+               for bd_idx in range(n_beads)]
+    return model_class(molecule, mapping=mapping, names=['B{}'.format(idx) for idx in range(n_beads)],
+                       types=['P1'] * n_beads)
+
+
+def calls_per_second(model, role, repeats=5):
+    indices = [model.index(row, col) for row in range(model.rowCount(None) - 1)
+               for col in range(model.columnCount(None))]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for index in indices:
+            model.data(index, role)
+    return repeats * len(indices) / (time.perf_counter() - start)
+
+
+def main(sizes):
+    app = QApplication.instance() or QApplication(sys.argv)
+    print('{:>6} {:>11} {:>14} {:>14}'.format('beads', 'role', 'uncached/s', 'cached/s'))
+    for n_beads in sizes:
+        old = make_model(UncachedModel, n_beads)
+        new = make_model(MappingModel, n_beads)
+        for name, role in ROLES:
+            print('{:>6} {:>11} {:>14.0f} {:>14.0f}'.format(
+                n_beads, name, calls_per_second(old, role), calls_per_second(new, role)))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000])
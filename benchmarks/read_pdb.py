@@ -0,0 +1,66 @@
+"""
+Time to read the first molecule of a PDB file with N_MODELS models of
+N_ATOMS atoms each, in chains of 1000 atoms, with CONECT records:
+``vermouth.pdb.read_pdb(filename)[0]``, as load_pdb used to do, against
+read_pdb_molecule. Also times selecting a single chain of the first model.
+
+    python benchmarks/read_pdb.py [N_ATOMS [N_MODELS]]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from vermouth.pdb import read_pdb
+
+from pycgbuilder.pdb_reader import read_pdb_molecule
+
+CHAIN_SIZE = 1000
+ATOM = 'ATOM  {:5d} {:<4} {:<4}{:1}{:4d}    {:8.3f}{:8.3f}{:8.3f}  1.00  0.00          {:>2}  \n'
+
+
+def write_pdb(filename, n_atoms, n_models, seed=0):
+    rng = np.random.default_rng(seed)
+    chains = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    with open(filename, 'w') as file_out:
+        for model in range(1, n_models + 1):
+            file_out.write('MODEL     {:4d}\n'.format(model))
+            positions = rng.random((n_atoms, 3)) * 100
+            for idx, position in enumerate(positions):
+                chain = chains[(idx // CHAIN_SIZE) % len(chains)]
+                file_out.write(ATOM.format(idx % 99999 + 1, 'C', 'ALK', chain,
+                                           (idx % CHAIN_SIZE) // 10 + 1, *position, 'C'))
+                if idx % CHAIN_SIZE == CHAIN_SIZE - 1:
+                    file_out.write('TER\n')
+            file_out.write('ENDMDL\n')
+        for idx in range(1, min(n_atoms, 99999)):
+            if idx % CHAIN_SIZE:
+                file_out.write('CONECT{:5d}{:5d}\n'.format(idx, idx + 1))
+        file_out.write('END\n')
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(n_atoms, n_models):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'big.pdb')
+        write_pdb(filename, n_atoms, n_models)
+        size = os.path.getsize(filename) / 1e6
+        print('{} models of {} atoms, {:.0f} MB'.format(n_models, n_atoms, size))
+        old_time, old = timed(lambda: read_pdb(filename)[0])
+        new_time, new = timed(read_pdb_molecule, filename)
+        print('first molecule: read_pdb {:.3f}s, read_pdb_molecule {:.3f}s ({} and {} atoms)'.format(
+            old_time, new_time, len(old), len(new)))
+        chain_time, chain = timed(read_pdb_molecule, filename, chain='B')
+        print('chain B: read_pdb_molecule {:.3f}s ({} atoms, {} bonds)'.format(
+            chain_time, len(chain), len(chain.edges)))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [50000, 10][len(args):]))
@@ -4,6 +4,29 @@ __author__ = 'Peter C Kroon'
 __email__ = 'p.c.kroon@rug.nl'
 __version__ = '0.1.0'
 
-from .interface import CGBuilder
+from importlib import import_module
 
-__all__ = ['CGBuilder']
+# Everything is imported on first access, so that e.g. `make_cg_mol` can be
+# used without loading PyQt5 and matplotlib.
+_LAZY_ATTRIBUTES = {
+    'CGBuilder': '.interface',
+    'make_cg_mol': '.writers',
+    'WRITERS': '.writers',
+    'read_molecule': '.molecule',
+    'EMBEDDINGS': '.embed_molecule',
+    'draw_molecule': '.draw_mol',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
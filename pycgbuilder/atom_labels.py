@@ -0,0 +1,112 @@
+"""
+Atom labels drawn with a level of detail that depends on the zoom. Laying out
+text, and mathtext in particular, is one of the slowest things matplotlib
+does, so only labels that are inside the view and large enough to read are
+drawn. The cost of a draw scales with what is visible, not with the size of
+the molecule.
+"""
+from matplotlib.artist import Artist, allow_rasterization
+from matplotlib.text import Text
+import numpy as np
+
+from .embedding import Embedding
+
+# On-screen bond lengths, in pixels, below which hydrogen labels and all
+# labels are left out.
+HYDROGEN_PIXELS = 20
+MIN_PIXELS = 10
+
+
+class AtomLabels(Artist):
+    """
+    A single artist for the `labels` (a dict) of the atoms at `pos`. What is
+    drawn depends on how many pixels a bond of `bond_length` is on screen:
+
+    - below `min_pixels`, no labels at all;
+    - below `hydrogen_pixels`, hydrogens are collapsed into their heavy
+      atom, i.e. the labels of the atoms in `hydrogens` are left out;
+    - otherwise all labels.
+
+    Only labels within the view limits are drawn. If that would be more than
+    `max_labels`, hydrogens are left out, and the rest is thinned to one
+    label per cell of a grid over the view, so that at most `max_labels` are
+    drawn. Other keyword arguments are passed to every Text.
+    """
+    zorder = 3
+
+    def __init__(self, pos, labels, hydrogens=(), bond_length=1, min_pixels=MIN_PIXELS,
+                 hydrogen_pixels=HYDROGEN_PIXELS, max_labels=1000, **text_kwargs):
+        super().__init__()
+        pos = Embedding.from_dict(pos)
+        nodes = [node for node in labels if node in pos]
+        self._pos = Embedding(nodes, pos.positions[pos.rows(nodes)])
+        self._labels = labels
+        hydrogens = set(hydrogens)
+        self._is_hydrogen = np.array([node in hydrogens for node in nodes], dtype=bool)
+        self.bond_length = bond_length
+        self.min_pixels = min_pixels
+        self.hydrogen_pixels = hydrogen_pixels
+        self.max_labels = max_labels
+        self._text_kwargs = dict(verticalalignment='center_baseline', horizontalalignment='center')
+        self._text_kwargs.update(text_kwargs)
+        # Texts are made the first time they are visible, and reused after.
+        self._texts = {}
+
+    def _bond_pixels(self):
+        origin, end = self.get_transform().transform([[0, 0], [self.bond_length, 0]])
+        return np.hypot(*(end - origin))
+
+    def visible_labels(self):
+        """
+        The atoms whose labels are drawn at the current view limits.
+        """
+        if not len(self._pos) or self.axes is None:
+            return []
+        pixels = self._bond_pixels()
+        if pixels < self.min_pixels:
+            return []
+        # Atoms just outside the view can have their labels partially inside.
+        margin = self.bond_length / 2
+        x_low, x_high = sorted(self.axes.get_xlim())
+        y_low, y_high = sorted(self.axes.get_ylim())
+        rows = self._pos.rows_in_box((x_low - margin, y_low - margin),
+                                     (x_high + margin, y_high + margin))
+        if pixels < self.hydrogen_pixels:
+            rows = rows[~self._is_hydrogen[rows]]
+        if len(rows) > self.max_labels:
+            rows = self._thin(rows[~self._is_hydrogen[rows]], (x_low, y_low), (x_high, y_high))
+        return [self._pos.nodes[row] for row in rows]
+
+    def _thin(self, rows, low, high):
+        """
+        At most `max_labels` of `rows`, spread over the box from `low` to
+        `high`: the first atom in every cell of a grid with about
+        `max_labels` cells.
+        """
+        if len(rows) <= self.max_labels:
+            return rows
+        cell_size = np.sqrt(np.prod(np.subtract(high, low)) / max(self.max_labels, 1))
+        if cell_size > 0:
+            cells = np.floor((self._pos.positions[rows] - low) / cell_size).astype(int)
+            _, first = np.unique(cells, axis=0, return_index=True)
+            rows = rows[np.sort(first)]
+        return rows[:self.max_labels]
+
+    def _text(self, node):
+        if node not in self._texts:
+            x, y = self._pos[node]
+            text = Text(x, y, self._labels[node], **self._text_kwargs)
+            text.set_transform(self.get_transform())
+            text.set_figure(self.figure)
+            self._texts[node] = text
+        return self._texts[node]
+
+    @allow_rasterization
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        renderer.open_group('atom_labels', gid=self.get_gid())
+        for node in self.visible_labels():
+            self._text(node).draw(renderer)
+        renderer.close_group('atom_labels')
+        self.stale = False
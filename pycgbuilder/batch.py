@@ -0,0 +1,320 @@
+"""
+Headless batch builder. Reads a JSON manifest describing many molecules and
+their mappings, and writes the CG output files for every one of them using a
+pool of worker processes.
+
+The manifest is either a list of entries, or an object with a "molecules" key
+holding that list. Every entry looks like::
+
+    {
+        "name": "ethanol",               # optional, used for file names
+        "smiles": "CCO",                 # SMILES and/or PDB
+        "pdb": "ethanol.pdb",            # relative to the manifest
+        "hydrogens": false,              # keep hydrogen atoms
+        "beads": [
+            {"name": "B1", "type": "P1", "atoms": ["C0", "C1", "O2"]}
+        ]
+    }
+
+Bead members can be given as atom names, atom indices, or as a single
+whitespace separated string of atom names.
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+from pathlib import Path
+import re
+import sys
+import time
+import traceback
+
+from .molecule import read_molecule, set_default_atomnames
+from .writers import make_cg_mol, flush_files, discard_files, WRITERS
+
+# Path separators, and characters Windows does not allow in file names.
+RESERVED_CHARACTERS = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+
+def read_manifest(filename):
+    filename = Path(filename)
+    with open(str(filename)) as file_in:
+        manifest = json.load(file_in)
+    if isinstance(manifest, dict):
+        manifest = manifest['molecules']
+    entries = []
+    for idx, entry in enumerate(manifest):
+        entry = dict(entry)
+        if entry.get('pdb'):
+            entry['pdb'] = str(filename.parent / entry['pdb'])
+        entry.setdefault('name', None)
+        entry.setdefault('index', idx)
+        entries.append(entry)
+    return entries
+
+
+def parse_beads(molecule, beads):
+    name_to_idx = {}
+    for idx in molecule:
+        name_to_idx.setdefault(molecule.nodes[idx]['atomname'], []).append(idx)
+
+    names = []
+    types = []
+    mapping = []
+    for bd_idx, bead in enumerate(beads):
+        names.append(bead.get('name', 'BD{}'.format(bd_idx)))
+        types.append(bead.get('type', '__'))
+        atoms = bead.get('atoms', [])
+        if isinstance(atoms, str):
+            atoms = atoms.split()
+        idxs = []
+        for atom in atoms:
+            if isinstance(atom, int):
+                if atom not in molecule:
+                    raise KeyError('Atom with index {} not found'.format(atom))
+                idxs.append(atom)
+                continue
+            if atom not in name_to_idx:
+                raise KeyError('Atom with name {} not found'.format(atom))
+            if len(name_to_idx[atom]) != 1:
+                raise ValueError('Atom name {} is not unique'.format(atom))
+            idxs.extend(name_to_idx[atom])
+        mapping.append(sorted(idxs))
+    return names, types, mapping
+
+
+def default_name(entry):
+    """
+    The name of a manifest entry without one: the name of its PDB file, or
+    else its SMILES string, like read_molecule names the molecule.
+    """
+    if entry.get('pdb'):
+        return Path(entry['pdb']).stem
+    return entry.get('smiles')
+
+
+def file_stem(name):
+    """
+    `name` with all characters that can not be in a file name replaced by
+    underscores.
+    """
+    stem = RESERVED_CHARACTERS.sub('_', str(name or '')).strip(' .')
+    return stem or 'molecule'
+
+
+def unique_stems(entries):
+    """
+    The stem of the output files of every entry: its name as file name, with
+    the manifest index appended if other entries would get the same files,
+    or the next free number if that is the name of another entry. Names that
+    only differ in case are the same file on some file systems.
+    """
+    stems = [file_stem(entry['name'] or default_name(entry)) for entry in entries]
+    counts = Counter(stem.lower() for stem in stems)
+    taken = {stem.lower() for stem in stems if counts[stem.lower()] == 1}
+    unique = []
+    for stem, entry in zip(stems, entries):
+        if counts[stem.lower()] == 1:
+            unique.append(stem)
+            continue
+        number = entry['index']
+        while '{}_{}'.format(stem, number).lower() in taken:
+            number += 1
+        unique.append('{}_{}'.format(stem, number))
+        taken.add(unique[-1].lower())
+    return unique
+
+
+def has_positions(molecule):
+    return any('position' in molecule.nodes[idx] for idx in molecule)
+
+
+def read_entry(entry):
+    """
+    The molecule of a manifest entry, with default names for unnamed atoms.
+    """
+    molecule = read_molecule(entry.get('pdb'), entry.get('smiles'),
+                             entry.get('hydrogens', False))
+    set_default_atomnames(molecule)
+    return molecule
+
+
+def output_path(entry, out_dir, ext):
+    """
+    The output file with extension `ext` of a manifest entry, named after its
+    'stem' as set by run_entries.
+    """
+    stem = entry.get('stem') or file_stem(entry['name'] or default_name(entry))
+    return str(Path(out_dir) / '{}.{}'.format(stem, ext))
+
+
+def new_result(entry, fields=()):
+    """
+    The result of a manifest entry, before anything is done with it. `fields`
+    are copied from the entry.
+    """
+    result = {'index': entry['index'], 'name': entry['name'] or default_name(entry),
+              'status': 'ok', 'error': None, 'traceback': None, 'files': [], 'skipped': [],
+              'timings': {}}
+    result.update((field, entry.get(field)) for field in fields)
+    return result
+
+
+def set_failed(result, stage, err):
+    """
+    Marks `result` as failed in `stage` with the exception being handled.
+    """
+    result['status'] = 'failed'
+    result['error'] = '{}: {}: {}'.format(stage, type(err).__name__, err)
+    result['traceback'] = traceback.format_exc()
+    result['files'] = []
+
+
+def lap(timings, stage, tick):
+    """
+    Records the time since `tick` as that of `stage`, and returns the time
+    now, from which the next stage is timed.
+    """
+    now = time.perf_counter()
+    timings[stage] = now - tick
+    return now
+
+
+def build_entry(entry, out_dir, formats):
+    """
+    Reads, maps and writes a single manifest entry. Never raises; errors are
+    reported in the returned result instead so that one bad molecule does not
+    take the rest of the batch with it.
+    """
+    result = new_result(entry)
+    timings = result['timings']
+    start = tick = time.perf_counter()
+    stage = 'read'
+    try:
+        molecule = read_entry(entry)
+        tick = lap(timings, stage, tick)
+
+        stage = 'map'
+        names, types, mapping = parse_beads(molecule, entry.get('beads', []))
+        cg_mol = make_cg_mol(molecule, mapping, names, types)
+        tick = lap(timings, stage, tick)
+
+        stage = 'write'
+        for ext in formats:
+            if ext == 'pdb' and not has_positions(molecule):
+                result['skipped'].append(ext)
+                continue
+            path = output_path(entry, out_dir, ext)
+            WRITERS[ext](path, cg_mol)
+            result['files'].append(path)
+        flush_files()
+        lap(timings, stage, tick)
+    except Exception as err:
+        # Throw away whatever this molecule managed to write so far.
+        discard_files()
+        set_failed(result, stage, err)
+    timings['total'] = time.perf_counter() - start
+    return result
+
+
+def run_entries(func, entries, out_dir, args=(), jobs=None, progress=None, fields=(),
+                initializer=None, initargs=()):
+    """
+    Calls ``func(entry, out_dir, *args)`` for all `entries` using `jobs` worker
+    processes, each set up with ``initializer(*initargs)``. If jobs is 1,
+    everything runs in the current process. Every entry gets a unique file
+    'stem' first. `func` returns the result of its entry, see new_result,
+    with `fields` of the entry. `progress` is called with every result as it
+    comes in. Returns the list of results in manifest order.
+    """
+    os.makedirs(str(out_dir), exist_ok=True)
+    entries = [dict(entry, stem=stem) for entry, stem in zip(entries, unique_stems(entries))]
+    results = []
+    if jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for entry in entries:
+            result = func(entry, out_dir, *args)
+            results.append(result)
+            if progress:
+                progress(result)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer,
+                                 initargs=initargs) as executor:
+            futures = {executor.submit(func, entry, out_dir, *args): entry for entry in entries}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # The worker itself died, e.g. BrokenProcessPool
+                    result = new_result(futures[future], fields)
+                    set_failed(result, 'worker', err)
+                results.append(result)
+                if progress:
+                    progress(result)
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def run_batch(entries, out_dir, formats=None, jobs=None, progress=None):
+    """
+    Builds all `entries` using `jobs` worker processes, see run_entries.
+    """
+    formats = list(formats or WRITERS)
+    return run_entries(build_entry, entries, out_dir, (formats,), jobs, progress)
+
+
+def summarize(results, wall_time, file_out=None, slowest=5,
+              stages=('read', 'map', 'write', 'total')):
+    failed = [result for result in results if result['status'] != 'ok']
+    # Looked up now rather than at import, so redirecting stdout works
+    write = (file_out or sys.stdout).write
+    write('Built {} of {} molecules in {:.2f} s wall time\n'.format(
+        len(results) - len(failed), len(results), wall_time))
+    for stage in stages:
+        times = [result['timings'][stage] for result in results
+                 if stage in result['timings']]
+        if times:
+            write('  {:<6} total {:9.3f} s, mean {:8.4f} s, max {:8.4f} s\n'.format(
+                stage, sum(times), sum(times) / len(times), max(times)))
+    by_time = sorted(results, key=lambda result: result['timings'].get('total', 0), reverse=True)
+    if by_time and slowest:
+        write('Slowest molecules:\n')
+        for result in by_time[:slowest]:
+            write('  {:8.4f} s  {}\n'.format(result['timings'].get('total', 0), result['name']))
+    if failed:
+        write('Failures:\n')
+        for result in failed:
+            write('  [{}] {}: {}\n'.format(result['index'], result['name'], result['error']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pycgbuilder-batch',
+        description='Build CG mappings for a manifest of molecules without the GUI.'
+    )
+    parser.add_argument('manifest', help='JSON file describing the molecules and their mappings')
+    parser.add_argument('-o', '--output', default='.', help='Output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes. Defaults to the number of CPUs')
+    parser.add_argument('-f', '--formats', nargs='+', choices=list(WRITERS),
+                        default=list(WRITERS), help='Which files to write')
+    parser.add_argument('-r', '--report', default=None,
+                        help='Write the per-molecule timings and errors to this JSON file')
+    args = parser.parse_args(argv)
+
+    entries = read_manifest(args.manifest)
+    start = time.perf_counter()
+    results = run_batch(entries, args.output, args.formats, args.jobs)
+    wall_time = time.perf_counter() - start
+
+    summarize(results, wall_time)
+    if args.report:
+        with open(args.report, 'w') as file_out:
+            json.dump({'wall_time': wall_time, 'results': results}, file_out, indent=2)
+    return int(any(result['status'] != 'ok' for result in results))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
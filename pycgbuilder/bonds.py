@@ -0,0 +1,113 @@
+"""
+Guessing bonds from distances for PDB files without CONECT records. Adds the
+same edges as vermouth's ``MakeBonds(allow_name=False)``, but finds the pairs
+of nearby atoms with a cell list and checks all their distances at once with
+NumPy, instead of one pair at a time in Python.
+"""
+import numpy as np
+
+# Both cells themselves, and the 13 neighbouring cells in the upper half
+# shell, so that every pair of neighbouring cells is visited once.
+CELL_OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                         for dz in (-1, 0, 1) if (dx, dy, dz) >= (0, 0, 0)])
+RESIDUE_ATTRIBUTES = ('chain', 'resid', 'resname', 'insertion_code')
+
+
+def _cell_pairs(counts, starts, first, second):
+    """
+    All pairs of rows of the atoms in cells `first` and `second`, where cell
+    `i` has `counts[i]` atoms from row `starts[i]`.
+    """
+    sizes = counts[first] * counts[second]
+    pair_cells = np.repeat(np.arange(len(first)), sizes)
+    within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    n_second = counts[second][pair_cells]
+    rows1 = starts[first][pair_cells] + within // n_second
+    rows2 = starts[second][pair_cells] + within % n_second
+    return rows1, rows2
+
+
+def close_pairs(positions, cutoff):
+    """
+    All pairs of rows of `positions` at most `cutoff` apart, as two arrays
+    with the first row smaller than the second, and their distances. Atoms
+    are binned in cubic cells of size `cutoff`, so only the atoms in the same
+    and neighbouring cells are compared.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    empty = np.zeros(0, dtype=int)
+    if len(positions) < 2 or not cutoff > 0:
+        return empty, empty, np.zeros(0)
+    # Cells are numbered with an empty layer around them, so that the
+    # neighbours of cells at the edge never wrap around to another cell.
+    cells = np.floor((positions - positions.min(axis=0)) / cutoff).astype(np.int64) + 1
+    shape = cells.max(axis=0) + 2
+    keys = np.ravel_multi_index(cells.T, shape)
+    order = np.argsort(keys, kind='stable')
+    cell_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    sorted_positions = positions[order]
+
+    found = []
+    for offset in CELL_OFFSETS:
+        shift = np.ravel_multi_index(offset + 1, shape) - np.ravel_multi_index((1, 1, 1), shape)
+        neighbours = np.searchsorted(cell_keys, cell_keys + shift)
+        neighbours[neighbours == len(cell_keys)] = 0
+        first = np.flatnonzero(cell_keys[neighbours] == cell_keys + shift)
+        rows1, rows2 = _cell_pairs(counts, starts, first, neighbours[first])
+        if not shift:
+            keep = rows1 < rows2
+            rows1, rows2 = rows1[keep], rows2[keep]
+        distances = np.linalg.norm(sorted_positions[rows1] - sorted_positions[rows2], axis=1)
+        close = distances <= cutoff
+        found.append((order[rows1[close]], order[rows2[close]], distances[close]))
+    rows1, rows2, distances = (np.concatenate(arrays) for arrays in zip(*found))
+    swap = rows1 > rows2
+    rows1[swap], rows2[swap] = rows2[swap], rows1[swap]
+    return rows1, rows2, distances
+
+
+def guess_bonds(molecule, fudge=1.2):
+    """
+    Adds edges between the atoms of `molecule` that are closer than the mean
+    of their Van der Waals radii times `fudge`, like vermouth's
+    ``MakeBonds(allow_name=False)``: hydrogens are not bonded to each other
+    nor to atoms in other residues, and atoms of elements without a known
+    radius are not bonded at all. Atoms need a 'position'. Edges get the
+    'distance' between their atoms.
+    """
+    # The exact radii MakeBonds uses, including its quirks
+    from vermouth.processors.make_bonds import VDW_RADII
+
+    nodes = []
+    elements = []
+    residues = []
+    positions = []
+    residue_ids = {}
+    for node, attrs in molecule.nodes(data=True):
+        element = attrs.get('element')
+        if element not in VDW_RADII:
+            continue
+        nodes.append(node)
+        elements.append(element)
+        residue = tuple(attrs.get(attr) for attr in RESIDUE_ATTRIBUTES)
+        residues.append(residue_ids.setdefault(residue, len(residue_ids)))
+        positions.append(attrs['position'])
+    if not nodes:
+        return
+    radii = np.array([VDW_RADII[element] for element in elements])
+    hydrogen = np.array([element == 'H' for element in elements])
+    residues = np.array(residues)
+
+    rows1, rows2, distances = close_pairs(np.array(positions, dtype=float), radii.max() * fudge)
+    bonded = distances <= 0.5 * (radii[rows1] + radii[rows2]) * fudge
+    with_hydrogen = hydrogen[rows1] | hydrogen[rows2]
+    bonded &= ~(hydrogen[rows1] & hydrogen[rows2])
+    bonded &= ~(with_hydrogen & (residues[rows1] != residues[rows2]))
+    rows1, rows2, distances = rows1[bonded], rows2[bonded], distances[bonded]
+    order = np.lexsort((rows2, rows1))
+    molecule.add_edges_from(
+        (nodes[row1], nodes[row2], {'distance': distance})
+        for row1, row2, distance in zip(rows1[order].tolist(), rows2[order].tolist(),
+                                        distances[order].tolist())
+        if not molecule.has_edge(nodes[row1], nodes[row2])
+    )
@@ -1,46 +1,170 @@
 
-import matplotlib.pyplot as plt
-from matplotlib.collections import LineCollection
-
-import math
 import networkx as nx
+import numpy as np
+
+from .embedding import Embedding
+
 
+def bond_segments(positions, starts, ends, orders, spacing=0.1, sep=0.2):
+    """
+    The line segments of all bonds at once. `positions` is an (N, 2) array,
+    and `starts`, `ends` and `orders` are (E,) arrays with the rows of both
+    atoms and the order of every bond. A bond of order n is n parallel lines
+    `spacing` apart, that stop short of the atoms by `sep` or, for bonds
+    shorter than 1, `sep` times the bond length. Aromatic bonds (order 1.5)
+    are a full and a dotted line.
 
-def rot(x, y, theta):
-    return x*math.cos(theta) - y*math.sin(theta), x*math.sin(theta) + y*math.cos(theta)
+    Returns the (S, 2, 2) segments, ordered by bond and from right to left
+    when looking from start to end, and a mask of the dotted aromatic
+    segments.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    starts = np.asarray(starts, dtype=int)
+    ends = np.asarray(ends, dtype=int)
+    orders = np.asarray(orders, dtype=float)
+    aromatic = orders == 1.5
+    n_lines = np.where(aromatic, 2, orders).astype(int)
+    bonds = np.repeat(np.arange(len(starts)), n_lines)
+    # Which line of its bond every segment is
+    first = np.cumsum(n_lines) - n_lines
+    line = np.arange(len(bonds)) - np.repeat(first, n_lines)
+
+    p0 = positions[starts]
+    delta = positions[ends] - p0
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    theta = np.arctan2(delta[:, 1], delta[:, 0])
+    along = np.column_stack([np.cos(theta), np.sin(theta)])
+    across = np.column_stack([-along[:, 1], along[:, 0]])
+    gap = np.minimum(sep * length, sep)
+
+    offset = spacing * ((1 - n_lines[bonds]) / 2 + line)
+    shift = p0[bonds] + offset[:, None] * across[bonds]
+    segments = np.stack([shift + gap[bonds, None] * along[bonds],
+                         shift + (length - gap)[bonds, None] * along[bonds]], axis=1)
+    return segments, aromatic[bonds] & (line == 0)
 
 
 def make_edge(p0, p1, order, spacing=0.1, sep=0.2):
-    # Step 1: Make a horizontal line from sep to bond_length - sep, and figure
-    #         out how far we'll need to rotate it. This line is (x0p, x1p)
-    x0, y0 = p0
-    x1, y1 = p1
-    bond_length = math.sqrt((x0 - x1)**2 + (y0-y1)**2)
-    sep = min(sep * bond_length, sep)
-    x0p = sep
-    x1p = bond_length - sep
-    theta = math.atan2((y1 - y0), (x1 - x0))
-
-    # Step 2: Split the line (if needed) in multiple copies (let's say 2). 1 up,
-    #         1 down. This results in horizontal line(s) ((x0p, y0p), (x1p, y1p)).
-    #         These we then rotate , resulting in ((x0pp, y0pp), (x1pp, y1pp)).
-    #         Finally, translate them from the origin to (x0, y0)
-    out = []
-    for f in range(order):
-        y0p = y1p = spacing * ((1-order)/2 + f)
-        x0pp, y0pp = rot(x0p, y0p, theta)
-        x1pp, y1pp = rot(x1p, y1p, theta)
-        x0pp += x0
-        y0pp += y0
-        x1pp += x0
-        y1pp += y0
-        out.append([[x0pp, y0pp], [x1pp, y1pp]])
-
-    return out
+    """
+    The `order` line segments of a single bond from `p0` to `p1`, as a list.
+    See `bond_segments`.
+    """
+    segments, _ = bond_segments([p0, p1], [0], [1], [order], spacing, sep)
+    return segments.tolist()
+
+
+def colormap(name):
+    """
+    The matplotlib colormap called `name`.
+    """
+    try:
+        from matplotlib import colormaps
+    except ImportError:  # matplotlib < 3.5
+        from matplotlib.cm import get_cmap
+        return get_cmap(name)
+    return colormaps[name]
+
+
+def bead_colors(n_beads):
+    """
+    The RGBA colours of the first `n_beads` beads, as MappingView shows them.
+    """
+    from matplotlib.colors import to_rgba_array
+
+    colors = colormap('tab10').colors
+    return to_rgba_array([colors[idx % len(colors)] for idx in range(n_beads)])
+
+
+def pie_wedges(centers, sizes, radius=0.45, resolution=24):
+    """
+    Polygons for a pie chart around every center, like ``ax.pie``. `sizes` is
+    an (N, K) array with the size of every slice of every pie; slices of size
+    0 are left out. Returns the (W, resolution + 2, 2) vertices of all wedges,
+    and for every wedge the index of its pie and slice.
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    sizes = np.asarray(sizes, dtype=float).reshape(len(centers), -1)
+    totals = sizes.sum(axis=1, keepdims=True)
+    fractions = np.divide(sizes, totals, out=np.zeros_like(sizes), where=totals > 0)
+    ends = np.cumsum(fractions, axis=1)
+    pies, slices = np.nonzero(sizes > 0)
+    theta2 = 2 * np.pi * ends[pies, slices]
+    theta1 = theta2 - 2 * np.pi * fractions[pies, slices]
+    steps = np.linspace(0, 1, resolution + 1)
+    angles = theta1[:, None] + (theta2 - theta1)[:, None] * steps
+    arcs = centers[pies][:, None, :] + radius * np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+    # Wedges are closed through the center, except full circles.
+    first = np.where((fractions[pies, slices] > 1 - 1e-9)[:, None], arcs[:, 0], centers[pies])
+    vertices = np.concatenate([first[:, None, :], arcs], axis=1)
+    return vertices, pies, slices
+
+
+def wedge_paths(vertices):
+    """
+    Closed matplotlib Paths for the (W, K, 2) wedge `vertices` from
+    `pie_wedges`.
+    """
+    from matplotlib.path import Path
+
+    if not len(vertices):
+        return []
+    n_vertices = vertices.shape[1]
+    codes = np.full(n_vertices + 1, Path.LINETO, dtype=Path.code_type)
+    codes[0] = Path.MOVETO
+    codes[-1] = Path.CLOSEPOLY
+    closed = np.concatenate([vertices, vertices[:, :1]], axis=1)
+    return [Path(wedge, codes) for wedge in closed]
+
+
+def draw_pies(ax, centers, sizes, colors, radius=0.45, highlight=None, resolution=24):
+    """
+    Draws a pie chart around every center as a single PolyCollection.
+    Slice k is drawn in colors[k], and slice `highlight` gets a black edge.
+    Returns the collection.
+    """
+    from matplotlib.collections import PolyCollection
+
+    vertices, _, slices = pie_wedges(centers, sizes, radius, resolution)
+    colors = np.asarray(colors, dtype=float).reshape(-1, 4)
+    edgecolors = np.zeros((len(slices), 4))
+    linewidths = np.zeros(len(slices))
+    if highlight is not None:
+        selected = slices == highlight
+        edgecolors[selected] = (0, 0, 0, 1)
+        linewidths[selected] = 1
+    collection = PolyCollection(vertices, facecolors=colors[slices], edgecolors=edgecolors,
+                                linewidths=linewidths, closed=True)
+    ax.add_collection(collection)
+    return collection
+
+
+def bond_length(graph, pos):
+    """
+    The median length of the bonds in `graph` at positions `pos`, or 1 if
+    there are none.
+    """
+    pos = Embedding.from_dict(pos)
+    graph = graph.subgraph(pos.nodes) if len(pos) != len(graph) else graph
+    edges = pos.edge_rows(graph)
+    if not len(edges):
+        return 1
+    lengths = np.linalg.norm(pos.positions[edges[:, 0]] - pos.positions[edges[:, 1]], axis=1)
+    median = np.median(lengths)
+    return median if median > 0 else 1
 
 
 def draw_molecule(graph, clusters=None, labels=None, edge_widths=None, pos=None, ax=None):
+    """
+    Draws `graph` at positions `pos`, with `labels` for the atoms. Returns a
+    list of all artists that were added. Labels are drawn with a level of
+    detail that depends on the zoom, see `AtomLabels`.
+    """
+    # Imported here so that importing this module does not drag in matplotlib
+    # or pick a backend. Pyplot is only needed without `ax`.
+    from matplotlib.collections import LineCollection
+
     if not ax:
+        import matplotlib.pyplot as plt
         ax = plt.gca()
 
     if labels is None:
@@ -51,28 +175,30 @@ def draw_molecule(graph, clusters=None, labels=None, edge_widths=None, pos=None,
 
     if not pos:
         pos = nx.kamada_kawai_layout(graph)
+    pos = Embedding.from_dict(pos)
 
-    for idx, label in labels.items():
-        x, y = pos[idx]
-        ax.text(x, y, label, verticalalignment='center_baseline', horizontalalignment='center')
-
-    edges = []
-    arom_edges = []
-    for idx, jdx, order in graph.edges(data='order'):
-        if not order:
-            order = 1
-        if order == 1.5:
-            tmp = make_edge(pos[idx], pos[jdx], 2)
-            arom_edges.append(tmp[0])
-            edges.append(tmp[1])
-        else:
-            edges.extend(make_edge(pos[idx], pos[jdx], order))
-    ax.add_collection(LineCollection(edges, color='black', linewidths=edge_widths))
-    ax.add_collection(LineCollection(arom_edges, color='black', linestyle='dotted', linewidths=edge_widths))
+    artists = []
+    if labels:
+        from .atom_labels import AtomLabels
+
+        hydrogens = [idx for idx in labels if graph.nodes[idx].get('element') == 'H']
+        artists.append(ax.add_artist(AtomLabels(pos, labels, hydrogens,
+                                                bond_length=bond_length(graph, pos))))
+
+    rows = pos.edge_rows(graph)
+    orders = np.fromiter((order or 1 for _, _, order in graph.edges(data='order')),
+                         dtype=float, count=len(rows))
+    segments, aromatic = bond_segments(pos.positions, rows[:, 0], rows[:, 1], orders)
+    artists.append(ax.add_collection(LineCollection(segments[~aromatic], color='black', linewidths=edge_widths)))
+    artists.append(ax.add_collection(LineCollection(segments[aromatic], color='black', linestyle='dotted', linewidths=edge_widths)))
 
     if clusters is not None:
-        cmap = plt.get_cmap('tab10')
-        for idx, position in pos.items():
-            member = clusters[idx]
-            ax.pie(member, center=position, radius=0.45,
-                    colors=[cmap.colors[idx%cmap.N] for idx in range(len(member))])
+        nodes = list(pos)
+        n_slices = max((len(clusters[idx]) for idx in nodes), default=0)
+        sizes = np.zeros((len(nodes), n_slices))
+        for row, idx in enumerate(nodes):
+            sizes[row, :len(clusters[idx])] = clusters[idx]
+        colors = bead_colors(n_slices)
+        artists.append(draw_pies(ax, pos.positions[pos.rows(nodes)], sizes, colors, radius=0.45))
+
+    return artists
@@ -1,54 +1,395 @@
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from functools import wraps
+import inspect
+import math
+import multiprocessing
+import os
+import warnings
+
 import networkx as nx
 import numpy as np
-import math
 
+from .embedding import Embedding
+from .incremental_layout import warm_start_layout
+from .layout_quality import layout_quality
+from .multilevel_layout import multilevel_layout
+from .projection_layout import has_coordinates, projection_layout as _projection_layout
+from .stress_layout import stress_layout, vsepr_distances
 
-def rescale_bondlengths(graph, embedding, scale=1, reductor=np.median):
-    keys = list(embedding)
-    positions = [embedding[key] for key in keys]
-    positions = np.array(positions)
-    bonds = []
-    for idx, jdx in graph.edges:
-        length = np.linalg.norm(positions[keys.index(idx)] - positions[keys.index(jdx)])
-        bonds.append(length)
-    min_len = reductor(bonds)
+# Components with more atoms than this are not checked for duplicates.
+DEDUPLICATE_SIZE = 200
+# Total number of atoms to lay out before components are distributed over
+# multiple processes.
+PARALLEL_THRESHOLD = 5000
+# Layouts that scale badly are not tried automatically on molecules with more
+# atoms than this.
+SURVEY_MAX_ATOMS = {
+    'Kamada Kawai': 500,
+    'Spring': 2000,
+}
+# Seconds between calls to the survey callback while waiting for layouts.
+SURVEY_POLL_INTERVAL = 0.1
+
+
+class LayoutCancelled(Exception):
+    """
+    Raised from a layout callback to stop the layout.
+    """
+
+
+def _rescale(positions, edges, scale=1, reductor=np.median):
+    positions = positions.copy()
+    if not len(positions) or not len(edges):
+        return positions
+    lengths = np.linalg.norm(positions[edges[:, 0]] - positions[edges[:, 1]], axis=1)
+    min_len = reductor(lengths)
+    if not min_len > 0:
+        return positions
     mean = np.mean(positions, axis=0)
     positions -= mean
     positions *= scale/min_len
     positions += mean
-    return {key: positions[idx] for idx, key in enumerate(keys)}
+    return positions
+
+
+def rescale_bondlengths(graph, embedding, scale=1, reductor=np.median):
+    embedding = Embedding.from_dict(embedding)
+    edges = embedding.edge_rows(graph) if embedding else np.zeros((0, 2), dtype=int)
+    return Embedding(embedding.nodes, _rescale(embedding.positions, edges, scale, reductor))
+
+
+def _accepts_callback(layout_func):
+    try:
+        return 'callback' in inspect.signature(layout_func).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _rescaled_callback(graph, callback):
+    # The edges only need to be found once for all intermediate embeddings
+    # that share an index.
+    cached = {}
+
+    def preview(embedding):
+        if cached.get('index') is not embedding.index:
+            cached['index'] = embedding.index
+            cached['edges'] = embedding.edge_rows(graph)
+        callback(embedding.with_positions(_rescale(embedding.positions, cached['edges'])))
+    return preview
+
+
+def _component_key(graph):
+    # Cheap invariants first, the WL hash only distinguishes what is left.
+    elements = sorted(str(element) for element in nx.get_node_attributes(graph, 'element').values())
+    return (len(graph), graph.number_of_edges(), tuple(elements))
+
+
+def _hashable_copy(graph):
+    labeled = nx.Graph()
+    for idx in graph:
+        labeled.add_node(idx, label=str(graph.nodes[idx].get('element')))
+    for idx, jdx, order in graph.edges(data='order'):
+        labeled.add_edge(idx, jdx, label=str(order or 1))
+    return labeled
+
+
+def _group_components(graph, components, max_size=DEDUPLICATE_SIZE):
+    """
+    Groups identical components, e.g. water molecules or ions. Returns a
+    list of (representative, [(component, {rep_node: node}), ...]).
+    """
+    groups = []
+    candidates = defaultdict(list)
+    for component in components:
+        subgraph = graph.subgraph(component)
+        if len(component) > max_size:
+            groups.append((subgraph, []))
+            continue
+        key = _component_key(subgraph)
+        if len(component) > 1:
+            key += (nx.weisfeiler_lehman_graph_hash(_hashable_copy(subgraph),
+                                                    node_attr='label', edge_attr='label'),)
+        for rep, copies in candidates[key]:
+            matcher = nx.isomorphism.GraphMatcher(
+                rep, subgraph,
+                node_match=nx.isomorphism.categorical_node_match('element', None),
+                edge_match=nx.isomorphism.categorical_edge_match('order', 1),
+            )
+            match = next(matcher.isomorphisms_iter(), None)
+            if match is not None:
+                copies.append((subgraph, match))
+                break
+        else:
+            group = (subgraph, [])
+            candidates[key].append(group)
+            groups.append(group)
+    return groups
+
+
+def _fallback_layout(graph):
+    nodes = list(graph)
+    angles = np.linspace(0, 2 * np.pi, len(nodes), endpoint=False)
+    return Embedding(nodes, np.column_stack([np.cos(angles), np.sin(angles)]))
+
+
+def layout_component(layout_func, graph, *args, callback=None, **kwargs):
+    """
+    Lays out a single connected component and rescales it to unit bond
+    lengths. If `layout_func` fails, the spring layout is used instead.
+
+    If `layout_func` takes a `callback`, `callback` is called with the
+    rescaled intermediate embeddings. It can raise LayoutCancelled to stop.
+    """
+    if len(graph) == 1:
+        return Embedding(graph, np.zeros((1, 2)))
+    if callback is not None and _accepts_callback(layout_func):
+        kwargs['callback'] = _rescaled_callback(graph, callback)
+    try:
+        pos = layout_func(graph, *args, **kwargs)
+    except LayoutCancelled:
+        raise
+    except Exception as err:
+        warnings.warn('{} failed ({}), using a spring layout instead'.format(
+            getattr(layout_func, '__name__', layout_func), err))
+        try:
+            pos = nx.spring_layout(graph, seed=0)
+        except Exception:
+            pos = _fallback_layout(graph)
+    return rescale_bondlengths(graph, pos)
+
+
+def pack_components(embeddings, margin=2):
+    """
+    Places the embeddings next to each other in rows, largest first, without
+    overlapping. Returns a single Embedding.
+    """
+    boxes = []
+    for embedding in embeddings:
+        low = embedding.positions.min(axis=0)
+        size = embedding.positions.max(axis=0) - low + margin
+        boxes.append((low, size))
+    row_width = max(math.sqrt(sum(np.prod(size) for _, size in boxes)) * 1.2,
+                    max(size[0] for _, size in boxes))
+    order = sorted(range(len(embeddings)), key=lambda idx: -boxes[idx][1][1])
+
+    nodes = []
+    positions = []
+    x_pos = y_pos = row_height = 0
+    for idx in order:
+        low, size = boxes[idx]
+        if x_pos and x_pos + size[0] > row_width:
+            x_pos = 0
+            y_pos -= row_height
+            row_height = 0
+        # Rows grow downwards, so the top of the box goes at y_pos.
+        offset = np.array([x_pos, y_pos - size[1]]) - low
+        nodes.extend(embeddings[idx].nodes)
+        positions.append(embeddings[idx].positions + offset)
+        x_pos += size[0]
+        row_height = max(row_height, size[1])
+    return Embedding(nodes, np.concatenate(positions))
+
+
+def layout_components(graph, layout_func, *args, n_jobs=None,
+                      parallel_threshold=PARALLEL_THRESHOLD, callback=None, **kwargs):
+    """
+    Lays out every connected component of `graph` separately with
+    `layout_func`, and packs the results. Identical components are laid out
+    only once. If the components to lay out have more than
+    `parallel_threshold` atoms together they are distributed over `n_jobs`
+    processes.
+
+    `callback` is called with intermediate embeddings, which may only cover
+    the component that is being laid out. Components laid out in other
+    processes are only reported once they are done.
+    """
+    components = list(nx.connected_components(graph))
+    if len(components) <= 1:
+        return layout_component(layout_func, graph, *args, callback=callback, **kwargs)
+
+    groups = _group_components(graph, components)
+    # Plain copies, since views cannot be sent to other processes.
+    todo = [nx.Graph(rep) for rep, _ in groups]
+    work = sum(len(rep) for rep in todo if len(rep) > 1)
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(todo))
+    if n_jobs > 1 and work >= parallel_threshold:
+        # Not a with block, since leaving that waits for the running layouts.
+        pool = ProcessPoolExecutor(max_workers=n_jobs,
+                                   mp_context=multiprocessing.get_context('spawn'))
+        futures = [pool.submit(layout_component, layout_func, rep, *args, **kwargs)
+                   for rep in todo]
+        try:
+            for future in as_completed(futures):
+                if callback is not None:
+                    callback(future.result())
+        except BaseException:
+            # shutdown only cancels futures from Python 3.9.
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+            raise
+        pool.shutdown()
+        rep_embeddings = [future.result() for future in futures]
+    else:
+        rep_embeddings = [layout_component(layout_func, rep, *args, callback=callback, **kwargs)
+                          for rep in todo]
+
+    embeddings = []
+    for (_, copies), rep_embedding in zip(groups, rep_embeddings):
+        embeddings.append(rep_embedding)
+        for _, match in copies:
+            embeddings.append(Embedding([match[node] for node in rep_embedding.nodes],
+                                        rep_embedding.positions))
+    return pack_components(embeddings)
 
 
 def rescale(layout_func):
+    @wraps(layout_func)
     def layout(graph, *args, **kwargs):
-        try:
-            pos = layout_func(graph, *args, **kwargs)
-        except:
-            pos = {}
-        return rescale_bondlengths(graph, pos)
+        return layout_components(graph, layout_func, *args, **kwargs)
     return layout
 
 
-@rescale
-def vsepr_layout(graph):
-    dist = dict(nx.shortest_path_length(graph, weight=None))
-    for source, dest_d in dist.items():
-        for dest, d in dest_d.items():
-            if d % 2 == 1:  # odd
-                # sqrt(1 + (n*x)**2 + n*x**2)
-                n = (d + 1)/2
-                dist[source][dest] = math.sqrt(3*n**2 - 3*n + 1)
-            else:  # even
-                dist[source][dest] = d / 2 * math.sqrt(3)
-    try:
-        p0 = nx.planar_layout(graph)
-    except nx.NetworkXException:
-        p0 = None
-    pos = nx.kamada_kawai_layout(graph, pos=p0, weight=None, dist=dist, scale=len(graph) ** 0.5)
-    return pos
+def _vsepr_layout(graph, callback=None):
+    return stress_layout(graph, vsepr_distances, callback=callback)
 
 
+vsepr_layout = rescale(_vsepr_layout)
 kamada_kawai_layout = rescale(nx.kamada_kawai_layout)
 spring_layout = rescale(nx.spring_layout)
 spectral_layout = rescale(nx.spectral_layout)
 planar_layout = rescale(nx.planar_layout)
+multilevel_layout = rescale(multilevel_layout)
+
+
+def projection_layout(graph, n_jobs=None, callback=None, **kwargs):
+    # Components are not laid out separately, so that they stay where they
+    # are in 3D.
+    return rescale_bondlengths(graph, _projection_layout(graph, **kwargs))
+
+
+EMBEDDINGS = {
+    'VSEPR': vsepr_layout,
+    'Kamada Kawai': kamada_kawai_layout,
+    'Spring': spring_layout,
+    'Spectral': spectral_layout,
+    'Planar': planar_layout,
+    'Multilevel': multilevel_layout,
+    '3D projection': projection_layout,
+}
+# Layouts that depend on the coordinates of the atoms, which are not part of
+# the cache keys. They are quick, so they are never cached.
+UNCACHED = {'3D projection'}
+
+
+def _layout_cache(name, cache):
+    return None if name in UNCACHED else cache
+
+
+def compute_embedding(graph, name, cache=None, n_jobs=None, callback=None, **params):
+    """
+    Runs layout `name` from EMBEDDINGS on `graph`, unless `cache` already
+    has the result. `callback` is called with intermediate embeddings, see
+    `layout_components`. Layouts in UNCACHED are always run.
+    """
+    cache = _layout_cache(name, cache)
+    if cache is not None and len(graph):
+        embedding = cache.get(graph, name, params)
+        if embedding is not None:
+            return embedding
+    embedding = EMBEDDINGS[name](graph, n_jobs=n_jobs, callback=callback, **params)
+    if cache is not None and len(graph) and len(embedding) == len(graph):
+        cache.put(graph, name, embedding, params)
+    return embedding
+
+
+def warm_start_embedding(graph, name, previous_graph, previous, cache=None):
+    """
+    Layout `name` of `graph`, derived from `previous`, its layout of the
+    slightly different `previous_graph`. Only places the atoms that can be
+    placed from `previous`, so that this is fast enough for the GUI thread.
+    Returns None if the molecules have too little in common, or if part of
+    `graph` needs a full layout, which is then left to a LayoutWorker; see
+    `warm_start_layout`.
+    """
+    cache = _layout_cache(name, cache)
+    if cache is not None and len(graph):
+        embedding = cache.get(graph, name)
+        if embedding is not None:
+            return embedding
+    return warm_start_layout(graph, previous_graph, previous)
+
+
+def _score_embedding(graph, name, cache=None, n_jobs=None, callback=None):
+    embedding = compute_embedding(graph, name, cache=cache, n_jobs=n_jobs, callback=callback)
+    return embedding, layout_quality(graph, embedding)
+
+
+def survey_embeddings(graph, names=None, cache=None, n_jobs=None,
+                      parallel_threshold=PARALLEL_THRESHOLD, callback=None):
+    """
+    Computes and scores the layouts `names` (all of EMBEDDINGS by default)
+    at the same time. Yields (name, embedding, quality) as they finish; see
+    `layout_quality`. Layouts that are too slow for a molecule this size,
+    see SURVEY_MAX_ATOMS, are skipped, as is the 3D projection of molecules
+    without coordinates.
+
+    Layouts that are not cached are computed in `n_jobs` processes if there
+    are `parallel_threshold` atoms or more to lay out in total.
+
+    `callback` is called without arguments while layouts are computed, and
+    can raise LayoutCancelled to stop. Layouts that did not start yet are
+    then cancelled, and running ones are left to finish in the background.
+    """
+    if names is None:
+        names = list(EMBEDDINGS)
+    names = [name for name in names if len(graph) <= SURVEY_MAX_ATOMS.get(name, len(graph))]
+    if not has_coordinates(graph):
+        names = [name for name in names if EMBEDDINGS[name] is not projection_layout]
+    todo = []
+    for name in names:
+        layout_cache = _layout_cache(name, cache)
+        embedding = None
+        if layout_cache is not None and len(graph):
+            embedding = layout_cache.get(graph, name)
+        if embedding is None:
+            todo.append(name)
+        else:
+            yield name, embedding, layout_quality(graph, embedding)
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(todo))
+    if n_jobs <= 1 or len(graph) * len(todo) < parallel_threshold:
+        progress = None if callback is None else lambda embedding: callback()
+        for name in todo:
+            if callback is not None:
+                callback()
+            yield (name,) + _score_embedding(graph, name, cache=cache, n_jobs=n_jobs,
+                                             callback=progress)
+        return
+    graph = nx.Graph(graph)
+    # Not a with block, since leaving that waits for the running layouts.
+    pool = ProcessPoolExecutor(max_workers=n_jobs,
+                               mp_context=multiprocessing.get_context('spawn'))
+    # Every layout already has a process, so don't start more.
+    futures = {pool.submit(_score_embedding, graph, name, n_jobs=1): name for name in todo}
+    pending = set(futures)
+    try:
+        while pending:
+            if callback is not None:
+                callback()
+            done, pending = wait(pending, timeout=SURVEY_POLL_INTERVAL,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                embedding, quality = future.result()
+                layout_cache = _layout_cache(name, cache)
+                if layout_cache is not None and len(graph) and len(embedding) == len(graph):
+                    layout_cache.put(graph, name, embedding)
+                yield name, embedding, quality
+    finally:
+        # Pending layouts are left if the survey was cancelled, or the caller
+        # stopped iterating. shutdown only cancels futures from Python 3.9.
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=not pending)
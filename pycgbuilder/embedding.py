@@ -0,0 +1,121 @@
+from collections.abc import Mapping
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class Embedding(Mapping):
+    """
+    2D positions for the nodes of a graph, stored as a single (N, 2) array.
+    `index` maps every node to its row in `positions`. Can be used as a
+    read-only dict of node -> position.
+
+    Embeddings of the same nodes, such as the intermediate results of a
+    layout, can share their `nodes` and `index`.
+
+    Positions should not be changed in place: spatial queries use a KD-tree
+    that is built on first use.
+    """
+    def __init__(self, nodes, positions, index=None):
+        self.nodes = list(nodes) if index is None else nodes
+        if index is None:
+            index = {node: row for row, node in enumerate(self.nodes)}
+        self.index = index
+        self.positions = np.asarray(positions, dtype=float).reshape(len(self.nodes), 2)
+        self._tree = None
+
+    @classmethod
+    def from_dict(cls, pos):
+        if isinstance(pos, cls):
+            return pos
+        nodes = list(pos)
+        return cls(nodes, [pos[node] for node in nodes])
+
+    def __getitem__(self, node):
+        return self.positions[self.index[node]]
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def rows(self, nodes):
+        index = self.index
+        return np.array([index[node] for node in nodes], dtype=int)
+
+    def edge_rows(self, graph):
+        """
+        The rows of both ends of every edge in `graph` as an (E, 2) array.
+        """
+        index = self.index
+        edges = np.array([(index[idx], index[jdx]) for idx, jdx in graph.edges],
+                         dtype=int)
+        return edges.reshape(-1, 2)
+
+    def with_positions(self, positions):
+        return type(self)(self.nodes, positions, index=self.index)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = cKDTree(self.positions)
+        return self._tree
+
+    def nearest(self, point, max_distance=np.inf):
+        """
+        The node closest to `point`, or None if there is none within
+        `max_distance`.
+        """
+        if not self.nodes:
+            return None
+        distance, row = self.tree.query(point, distance_upper_bound=max_distance)
+        if not np.isfinite(distance):
+            return None
+        return self.nodes[row]
+
+    def rows_in_box(self, low, high):
+        """
+        The sorted rows of all nodes within the box from corner `low` to
+        corner `high`, as an array.
+        """
+        if not self.nodes:
+            return np.zeros(0, dtype=int)
+        low = np.asarray(low, dtype=float)
+        high = np.asarray(high, dtype=float)
+        center = (low + high) / 2
+        # All points in the box are within this circle around its center
+        rows = np.asarray(self.tree.query_ball_point(center, np.linalg.norm(high - center)),
+                          dtype=int)
+        inside = np.all((self.positions[rows] >= low) & (self.positions[rows] <= high), axis=1)
+        return np.sort(rows[inside])
+
+    def in_rectangle(self, corner, other_corner):
+        """
+        All nodes within the rectangle spanned by two opposite corners.
+        """
+        if not self.nodes:
+            return []
+        low = np.minimum(corner, other_corner)
+        high = np.maximum(corner, other_corner)
+        return [self.nodes[row] for row in self.rows_in_box(low, high)]
+
+    def in_polygon(self, vertices):
+        """
+        All nodes inside the polygon with (P, 2) `vertices`, e.g. a lasso.
+        """
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+        if not self.nodes or len(vertices) < 3:
+            return []
+        rows = self.rows_in_box(vertices.min(axis=0), vertices.max(axis=0))
+        points = self.positions[rows]
+        # Even-odd rule: count the polygon edges crossed by a ray from every
+        # point in the +x direction.
+        inside = np.zeros(len(points), dtype=bool)
+        for (x0, y0), (x1, y1) in zip(vertices, np.roll(vertices, -1, axis=0)):
+            if y0 == y1:
+                continue
+            straddles = (y0 > points[:, 1]) != (y1 > points[:, 1])
+            x_cross = x0 + (points[:, 1] - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= straddles & (points[:, 0] < x_cross)
+        return [self.nodes[row] for row in rows[inside]]
@@ -0,0 +1,238 @@
+"""
+A persistent cache of embeddings: a directory with one compressed npz file per
+layout. Files are named by a hash of the molecule (elements, bonds and bond
+orders, in a canonical order of the atoms), the layout name and its
+parameters, so the directory can be shared by everyone working on the same
+molecules, e.g. on a network drive, however they number their atoms.
+
+Writes are atomic, and the least recently used files are removed once the
+directory grows beyond `max_bytes`.
+"""
+from collections import Counter
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+
+import numpy as np
+
+from .embedding import Embedding
+
+# Bump when layouts or keys change in a way that should invalidate old results.
+CACHE_VERSION = 2
+
+
+def _number(keys):
+    """
+    Numbers the distinct rows of `keys` (a tuple of arrays, last one first)
+    by sorting them. Returns the numbers and how many there are.
+    """
+    order = np.lexsort(keys)
+    changes = np.zeros(len(order), dtype=bool)
+    for key in keys:
+        changes[1:] |= key[order[1:]] != key[order[:-1]]
+    changes[:1] = True
+    numbers = np.empty(len(order), dtype=int)
+    numbers[order] = np.cumsum(changes) - 1
+    return numbers, int(changes.sum())
+
+
+def _refine(colours, bonds, starts, targets, bond_values):
+    """
+    Refines `colours` by the colours of the neighbours of each atom and the
+    orders of the bonds to them, until they no longer change. Neighbours are
+    summarized as a sum of random numbers, which are the same every call, so
+    the colours do not depend on the order of the atoms.
+    """
+    rng = np.random.default_rng(0)
+    n_colours = int(colours.max(initial=-1)) + 1
+    while True:
+        values = rng.integers(np.iinfo(np.int64).max, size=n_colours, dtype=np.uint64)
+        sums = np.zeros(len(colours), dtype=np.uint64)
+        if len(targets):
+            sums[bonds] = np.add.reduceat(values[colours[targets]] * bond_values,
+                                          starts[bonds])
+        colours, n_new = _number((sums, colours))
+        # Colours are only ever split, so the same number means the same classes
+        if n_new == n_colours:
+            return colours
+        n_colours = n_new
+
+
+def canonical_order(graph):
+    """
+    Orders the nodes of `graph` by their elements and bonds, so that the same
+    molecule gets the same order however its atoms are numbered. Ties between
+    atoms that can not be told apart are broken by picking one of them and
+    refining again.
+    """
+    nodes = list(graph)
+    rows = {node: row for row, node in enumerate(nodes)}
+    edges = [(rows[idx], rows[jdx], str(bond_order or 1))
+             for idx, jdx, bond_order in graph.edges(data='order')]
+    edges += [(jdx, idx, bond_order) for idx, jdx, bond_order in edges]
+    edges.sort()
+    sources = np.array([edge[0] for edge in edges], dtype=int)
+    targets = np.array([edge[1] for edge in edges], dtype=int)
+    bond_orders = sorted({edge[2] for edge in edges})
+    odd = np.random.default_rng(1).integers(
+        np.iinfo(np.int64).max, size=len(bond_orders), dtype=np.uint64) | np.uint64(1)
+    bond_values = odd[[bond_orders.index(edge[2]) for edge in edges]]
+    starts = np.searchsorted(sources, np.arange(len(nodes)))
+    bonds = np.bincount(sources, minlength=len(nodes)) > 0
+    neighbours = [frozenset(edges[start:end]) for start, end in
+                  zip(starts.tolist(), starts[1:].tolist() + [len(edges)])]
+
+    elements = [str(graph.nodes[node].get('element')) for node in nodes]
+    numbers = {element: number for number, element in enumerate(sorted(set(elements)))}
+    colours = np.array([numbers[element] for element in elements], dtype=int)
+    colours = _refine(colours, bonds, starts, targets, bond_values)
+    while len(np.unique(colours)) < len(colours):
+        # Atoms of the same colour bonded to the same atoms, such as the
+        # hydrogens of a methyl group, can be swapped, so they are numbered
+        # in any order. Otherwise one atom of the first tied colour is picked.
+        twins = Counter()
+        ranks = np.zeros(len(colours), dtype=int)
+        for row, (colour, bonded) in enumerate(zip(colours.tolist(), neighbours)):
+            key = (colour, frozenset(edge[1:] for edge in bonded))
+            ranks[row] = twins[key]
+            twins[key] += 1
+        if not ranks.any():
+            counts = np.bincount(colours)
+            tied = np.flatnonzero(counts > 1)[0]
+            ranks = colours == tied
+            ranks[np.flatnonzero(ranks)[0]] = False
+        colours, _ = _number((ranks.astype(int), colours))
+        colours = _refine(colours, bonds, starts, targets, bond_values)
+    order = [None] * len(nodes)
+    for node, colour in zip(nodes, colours.tolist()):
+        order[colour] = node
+    return order
+
+
+def graph_hash(graph, order=None):
+    """
+    A hash of the elements, bonds and bond orders of `graph` in the
+    `canonical_order` of its atoms, which does not depend on how the atoms
+    are numbered, or the order in which atoms or bonds were added.
+    """
+    if order is None:
+        order = canonical_order(graph)
+    rows = {node: row for row, node in enumerate(order)}
+    digest = hashlib.sha256()
+    for node in order:
+        digest.update('{}\n'.format(graph.nodes[node].get('element')).encode())
+    edges = sorted((tuple(sorted((rows[idx], rows[jdx]))), bond_order or 1)
+                   for idx, jdx, bond_order in graph.edges(data='order'))
+    for (idx, jdx), bond_order in edges:
+        digest.update('{}-{}:{}\n'.format(idx, jdx, bond_order).encode())
+    return digest.hexdigest()
+
+
+def default_cache():
+    """
+    The cache in $PYCGBUILDER_CACHE, or in the user cache directory. Returns
+    None if $PYCGBUILDER_CACHE is "off".
+    """
+    if os.environ.get('PYCGBUILDER_CACHE', '').lower() == 'off':
+        return None
+    return EmbeddingCache()
+
+
+def default_cache_dir():
+    if os.environ.get('PYCGBUILDER_CACHE'):
+        return Path(os.environ['PYCGBUILDER_CACHE'])
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'pycgbuilder' / 'embeddings'
+
+
+class EmbeddingCache:
+    def __init__(self, directory=None, max_bytes=256 * 2**20):
+        self.directory = Path(directory) if directory else default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def key(self, graph, name, params=None, order=None):
+        params = json.dumps(params or {}, sort_keys=True, default=str)
+        digest = hashlib.sha256()
+        for part in (str(CACHE_VERSION), graph_hash(graph, order), name, params):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.directory / '{}.npz'.format(key)
+
+    def get(self, graph, name, params=None):
+        # Positions are stored in canonical order, so that the same molecule
+        # with its atoms numbered differently finds them too.
+        order = canonical_order(graph)
+        path = self._path(self.key(graph, name, params, order))
+        try:
+            with np.load(str(path)) as data:
+                positions = data['positions']
+        except (OSError, KeyError, ValueError):
+            return None
+        if len(positions) != len(graph):
+            return None
+        try:
+            # Mark as recently used
+            os.utime(str(path))
+        except OSError:
+            pass
+        return Embedding(order, positions)
+
+    def put(self, graph, name, embedding, params=None):
+        order = canonical_order(graph)
+        positions = np.asarray(embedding.positions[embedding.rows(order)], dtype=np.float32)
+        path = self._path(self.key(graph, name, params, order))
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            handle, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=str(self.directory))
+        except OSError:
+            # A read-only or full cache should never break the layout.
+            return
+        try:
+            with os.fdopen(handle, 'wb') as file_out:
+                np.savez_compressed(file_out, positions=positions)
+            os.replace(tmp_path, str(path))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        try:
+            with os.scandir(str(self.directory)) as scan:
+                for entry in scan:
+                    if not entry.name.endswith('.npz'):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError:
+            return
+        if total <= self.max_bytes:
+            return
+        # Remove the least recently used files until we're at 90% of the limit
+        entries.sort()
+        for _, size, path in entries:
+            if total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for path in self.directory.glob('*.npz'):
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,163 @@
+"""
+Updating a layout after a small change to the molecule, such as adding or
+removing hydrogens. Atoms that did not change keep their position, new atoms
+are placed next to the atoms they are bonded to, and only the neighbourhood
+of the change is relaxed. The work done is proportional to the size of the
+change rather than the size of the molecule.
+"""
+from collections import deque
+import math
+
+import numpy as np
+
+from .embedding import Embedding
+from .stress_layout import adjacency_matrix, local_pairs, sparse_stress, vsepr_distances
+
+
+def match_nodes(old, new):
+    """
+    The atoms of `new` that are the same atom in `old`: they have the same
+    key and element, and the same bonds to other such atoms.
+    """
+    common = {node for node in new
+              if node in old and old.nodes[node].get('element') == new.nodes[node].get('element')}
+    suspects = set(common)
+    while suspects:
+        bad = {node for node in suspects if node in common and
+               {nb for nb in old[node] if nb in common} != {nb for nb in new[node] if nb in common}}
+        common -= bad
+        # Only the neighbours of removed atoms can become inconsistent.
+        suspects = {nb for node in bad for nb in new[node] if nb in common}
+    return common
+
+
+def _free_directions(anchor, neighbours, count):
+    """
+    `count` unit vectors evenly spread over the largest angle between the
+    bonds from `anchor` to `neighbours`.
+    """
+    if not len(neighbours):
+        start, gap = 0, 2 * math.pi
+        angles = start + gap * np.arange(count) / count
+    else:
+        delta = np.asarray(neighbours) - anchor
+        bonds = np.sort(np.arctan2(delta[:, 1], delta[:, 0]))
+        gaps = np.diff(np.append(bonds, bonds[0] + 2 * math.pi))
+        widest = np.argmax(gaps)
+        start, gap = bonds[widest], gaps[widest]
+        angles = start + gap * np.arange(1, count + 1) / (count + 1)
+    return np.column_stack([np.cos(angles), np.sin(angles)])
+
+
+def place_new_atoms(graph, positions, bond_length=1):
+    """
+    Places atoms of `graph` that are not in `positions` (a dict), starting from
+    the placed atoms they are bonded to. Atoms that are not connected to any
+    placed atom are left out. Returns a new dict.
+    """
+    placed = dict(positions)
+    queue = deque(node for node in placed if node in graph
+                  and any(nb not in placed for nb in graph[node]))
+    while queue:
+        anchor = queue.popleft()
+        new = [nb for nb in graph[anchor] if nb not in placed]
+        if not new:
+            continue
+        neighbours = [placed[nb] for nb in graph[anchor] if nb in placed]
+        directions = _free_directions(placed[anchor], neighbours, len(new))
+        for node, direction in zip(new, directions):
+            placed[node] = placed[anchor] + bond_length * direction
+            queue.append(node)
+    return placed
+
+
+def _within_hops(graph, sources, hops):
+    seen = set(sources)
+    frontier = set(sources)
+    for _ in range(hops):
+        frontier = {nb for node in frontier for nb in graph[node]} - seen
+        seen |= frontier
+    return seen
+
+
+def relax(graph, positions, moving, radius=3, iterations=30):
+    """
+    Sparse stress relaxation of the atoms in `moving` only, against the
+    atoms up to `radius` bonds away. `positions` is a dict, and is updated.
+    """
+    context = list(_within_hops(graph, moving, radius))
+    if len(context) < 2:
+        return positions
+    adjacency = adjacency_matrix(graph.subgraph(context), context)
+    idxs, jdxs, hops = local_pairs(adjacency, radius)
+    movable = np.array([node in moving for node in context])
+    keep = movable[idxs]
+    idxs, jdxs, hops = idxs[keep], jdxs[keep], hops[keep]
+    dist = vsepr_distances(hops)
+    init = np.array([positions[node] for node in context], dtype=float)
+    new_pos = sparse_stress(idxs, jdxs, dist, dist ** -2., init, max_iter=iterations,
+                            tol=1e-3, movable=movable)
+    for node, position in zip(context, new_pos):
+        positions[node] = position
+    return positions
+
+
+def _heavy_atoms(graph):
+    heavy = {node for node in graph if graph.nodes[node].get('element') != 'H'}
+    return heavy or set(graph)
+
+
+def matched_fraction(previous_graph, graph, matched=None):
+    """
+    The fraction of the heavy atoms of `graph` that are the same atom in
+    `previous_graph`, see `match_nodes`. Hydrogens are not counted, since
+    they are placed well next to their heavy atom, and adding them to a
+    small molecule would otherwise look like a different molecule.
+    """
+    if not graph:
+        return 0
+    if matched is None:
+        matched = match_nodes(previous_graph, graph)
+    heavy = _heavy_atoms(graph)
+    return len(heavy & set(matched)) / len(heavy)
+
+
+def warm_start_layout(graph, previous_graph, previous, layout_func=None, relax_hops=0,
+                      min_matched=0.5):
+    """
+    Lays out `graph` starting from `previous`, the embedding of
+    `previous_graph`. New atoms, and known atoms at most `relax_hops` bonds
+    away from them, are relaxed; all other atoms stay where they are. Parts
+    of `graph` without any atom in common with `previous_graph` are laid out
+    with `layout_func` and put to the right. That is a full layout, so
+    leave `layout_func` out where it must not take long.
+
+    Returns None if fewer than `min_matched` of the heavy atoms of `graph`
+    are known in `previous_graph` (see `matched_fraction`), since then
+    starting over gives a better layout. Also returns None if parts need
+    laying out but there is no `layout_func`.
+    """
+    matched = match_nodes(previous_graph, graph)
+    matched = {node for node in matched if node in previous}
+    if not graph or matched_fraction(previous_graph, graph, matched) < min_matched:
+        return None
+    positions = {node: np.asarray(previous[node], dtype=float) for node in matched}
+    positions = place_new_atoms(graph, positions)
+    new = set(positions) - matched
+    moving = _within_hops(graph, new, relax_hops) & set(positions)
+    if moving:
+        positions = relax(graph, positions, moving)
+
+    nodes = list(positions)
+    embedding = Embedding(nodes, np.array([positions[node] for node in nodes]).reshape(-1, 2))
+    missing = [node for node in graph if node not in positions]
+    if missing and layout_func is not None:
+        rest = layout_func(graph.subgraph(missing))
+        offset = embedding.positions.max(axis=0) - rest.positions.min(axis=0)
+        offset[1] = 0
+        offset[0] += 2
+        embedding = Embedding(nodes + list(rest.nodes),
+                              np.concatenate([embedding.positions, rest.positions + offset]))
+    elif missing:
+        return None
+    return embedding
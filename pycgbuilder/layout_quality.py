@@ -0,0 +1,102 @@
+"""
+Cheap measures of how readable a 2D layout is, used to pick a layout
+automatically. Lower is better for all of them.
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .embedding import Embedding
+
+# How much a unit of every measure counts towards LayoutQuality.penalty.
+CROSSING_WEIGHT = 1
+OVERLAP_WEIGHT = 1
+SPREAD_WEIGHT = 10
+
+
+def _orientation(p_a, p_b, p_c):
+    return np.sign((p_b[..., 0] - p_a[..., 0]) * (p_c[..., 1] - p_a[..., 1])
+                   - (p_b[..., 1] - p_a[..., 1]) * (p_c[..., 0] - p_a[..., 0]))
+
+
+def count_crossings(segments):
+    """
+    Number of pairs of segments in the (S, 2, 2) array `segments` that cross.
+    Segments that only touch, e.g. bonds sharing an atom, do not count.
+
+    This is a sweep over x: segments are visited by their left end, and are
+    only tested against the segments that are still active, i.e. that reach
+    past that point. For drawings of molecules, where bonds are short, this
+    is a small fraction of all pairs.
+    """
+    segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+    left = segments[:, :, 0].min(axis=1)
+    right = segments[:, :, 0].max(axis=1)
+    low = segments[:, :, 1].min(axis=1)
+    high = segments[:, :, 1].max(axis=1)
+    crossings = 0
+    active = np.zeros(0, dtype=int)
+    for seg in np.argsort(left, kind='stable'):
+        active = active[right[active] >= left[seg]]
+        candidates = active[(low[active] <= high[seg]) & (high[active] >= low[seg])]
+        if len(candidates):
+            p_a, p_b = segments[seg]
+            p_c, p_d = segments[candidates, 0], segments[candidates, 1]
+            crossed = ((_orientation(p_a, p_b, p_c) * _orientation(p_a, p_b, p_d) < 0)
+                       & (_orientation(p_c, p_d, p_a) * _orientation(p_c, p_d, p_b) < 0))
+            crossings += int(np.count_nonzero(crossed))
+        active = np.append(active, seg)
+    return crossings
+
+
+def bond_length_spread(lengths):
+    """
+    Coefficient of variation of the bond lengths: 0 if all bonds are equally
+    long, independent of the scale of the drawing.
+    """
+    lengths = np.asarray(lengths, dtype=float)
+    mean = lengths.mean() if len(lengths) else 0
+    if not mean > 0:
+        return 0.
+    return float(lengths.std() / mean)
+
+
+def count_overlaps(positions, min_distance):
+    """
+    Number of pairs of atoms closer together than `min_distance`.
+    """
+    if len(positions) < 2:
+        return 0
+    return len(cKDTree(positions).query_pairs(min_distance))
+
+
+class LayoutQuality(namedtuple('LayoutQuality', 'crossings bond_spread overlaps')):
+    __slots__ = ()
+
+    @property
+    def penalty(self):
+        return (CROSSING_WEIGHT * self.crossings + SPREAD_WEIGHT * self.bond_spread
+                + OVERLAP_WEIGHT * self.overlaps)
+
+    def __str__(self):
+        return '{} crossings, bonds ±{:.0%}, {} overlaps'.format(
+            self.crossings, self.bond_spread, self.overlaps)
+
+
+def layout_quality(graph, embedding, min_distance=0.5):
+    """
+    Measures the quality of `embedding` as a drawing of `graph`. Atoms count
+    as overlapping if they are closer than `min_distance` times the median
+    bond length.
+    """
+    embedding = Embedding.from_dict(embedding)
+    positions = embedding.positions
+    edges = embedding.edge_rows(graph)
+    segments = positions[edges]
+    lengths = np.linalg.norm(segments[:, 1] - segments[:, 0], axis=1)
+    scale = np.median(lengths) if len(lengths) else 1
+    if not scale > 0:
+        scale = 1
+    return LayoutQuality(count_crossings(segments), bond_length_spread(lengths),
+                         count_overlaps(positions, min_distance * scale))
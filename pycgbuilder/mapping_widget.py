@@ -1,8 +1,11 @@
 from collections import defaultdict, Counter
+from functools import lru_cache
+import time
 
 from matplotlib.backend_bases import MouseButton
+from matplotlib.collections import PathCollection
+from matplotlib.widgets import LassoSelector, RectangleSelector
 from matplotlib.figure import Figure
-from matplotlib.cm import get_cmap
 from matplotlib.backends.backend_qt5agg import (
     FigureCanvas, NavigationToolbar2QT as NavigationToolbar
 )
@@ -11,50 +14,152 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 
 from .embed_molecule import (
-    vsepr_layout, kamada_kawai_layout, spring_layout, spectral_layout, planar_layout)
-from .draw_mol import draw_molecule
+    EMBEDDINGS, LayoutCancelled, compute_embedding, survey_embeddings, warm_start_embedding
+)
+from .embedding import Embedding
+from .embedding_cache import default_cache
+from .incremental_layout import matched_fraction
+from .draw_mol import colormap, draw_molecule, pie_wedges, wedge_paths
+from .molecule import set_default_atomnames
 
 import networkx as nx
 import numpy as np
 
-EMBEDDINGS = {
-    'VSEPR': vsepr_layout,
-    'Kamada Kawai': kamada_kawai_layout,
-    'Spring': spring_layout,
-    'Spectral': spectral_layout,
-    'Planar': planar_layout,
-}
+# Fraction of the atoms of a new molecule that must be the same in the old
+# one for its warm started layouts to replace the layout survey.
+SKIP_SURVEY_MATCHED = 0.9
 
+class LayoutWorker(QThread):
+    """
+    Computes a layout in the background. Intermediate embeddings are sent
+    with `preview` at most every `preview_interval` seconds, and the result
+    with `done`. A new preview is only sent once the receiver called
+    `preview_shown` for the previous one, so previews never queue up.
+    """
+    preview = pyqtSignal(str, object)
+    done = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
 
-class MappingView(FigureCanvas):
-    def __init__(self, figure, atom_radius=0.45):
-        super().__init__(figure)
-        self.ax = figure.subplots()
-        self.mpl_connect('button_press_event', self._click_canvas)
+    def __init__(self, molecule, name, cache=None, preview_interval=0.25):
+        super().__init__()
+        self.molecule = molecule
+        self.name = name
+        self.cache = cache
+        self.preview_interval = preview_interval
+        self._cancelled = False
+        self._last_preview = 0
+        self._pending = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def preview_shown(self, min_interval=0):
+        self.preview_interval = max(self.preview_interval, min_interval)
+        self._last_preview = time.monotonic()
+        self._pending = False
+
+    def _progress(self, embedding):
+        if self._cancelled:
+            raise LayoutCancelled
+        if self._pending or time.monotonic() - self._last_preview < self.preview_interval:
+            return
+        self._pending = True
+        self.preview.emit(self.name, embedding)
+
+    def run(self):
+        self._last_preview = time.monotonic()
+        try:
+            embedding = compute_embedding(self.molecule, self.name, cache=self.cache,
+                                          callback=self._progress)
+        except LayoutCancelled:
+            return
+        except Exception as err:
+            self.failed.emit(self.name, str(err))
+            return
+        if not self._cancelled:
+            self.done.emit(self.name, embedding)
+
+
+class LayoutSurveyWorker(QThread):
+    """
+    Computes and scores all layouts, see `survey_embeddings`.
+    """
+    scored = pyqtSignal(str, object, object)
+
+    def __init__(self, molecule, cache=None):
+        super().__init__()
+        self.molecule = molecule
+        self.cache = cache
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _progress(self):
+        if self._cancelled:
+            raise LayoutCancelled
+
+    def run(self):
+        results = survey_embeddings(self.molecule, cache=self.cache, callback=self._progress)
+        try:
+            for name, embedding, quality in results:
+                if self._cancelled:
+                    break
+                self.scored.emit(name, embedding, quality)
+        except LayoutCancelled:
+            return
+        finally:
+            results.close()
+
+
+class MappingViewBase:
+    """
+    What all views of a MappingModel share, whatever they draw with: the
+    model and selection model, computing the layouts of the molecule, and
+    mapping the atoms that are clicked or selected. Subclasses are QWidgets
+    that call `_init_view` from their __init__, define the `layout_scored`
+    and `survey_done` signals, and implement `redraw`, `redraw_selection`,
+    `_fit_view`, `hide_mapping` and `set_selection_tool`.
+    """
+    def _init_view(self, atom_radius):
         self.atom_radius = atom_radius
-        self._drawn_mapping = None
+        # Redraws requested by signals are coalesced: every request marks what
+        # changed, and a zero-length timer draws once the event loop is idle.
+        self._dirty = set()
+        self._redraw_timer = QTimer(self)
+        self._redraw_timer.setSingleShot(True)
+        self._redraw_timer.setInterval(0)
+        self._redraw_timer.timeout.connect(self._perform_redraw)
+        self._preview_workers = set()
+        self.selection_tool = None
+        # Number of redraws 'requested', and how many full redraws were
+        # 'performed' or only 'blitted' the selection.
+        self.redraw_counts = Counter()
         self._embeddings = {}
+        self._previews = {}
+        self._failed = {}
+        self._workers = {}
+        self._survey = None
+        self.qualities = {}
+        self.warm_started = False
+        # Cancelled workers that are still running.
+        self._retired = set()
+        self.embedding_cache = default_cache()
         self._current_embedding = ''
         self._molecule = nx.Graph()
         self._model = MappingModel(self._molecule)
         self._selectionmodel = QItemSelectionModel(self._model)
         self.show_mapping = True
-        self.ax.set_aspect(1)
-        self.ax.set_axis_off()
-        self.ax.autoscale(False)
-        self.draw()
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(lambda: self.cancel_layouts(wait=True))
 
     @property
     def mapping(self):
-        members = defaultdict(list)
-        for bd_idx in range(self.model.rowCount(self.model.index(0, 0))):
-            atoms = self.model.index(bd_idx, 2).data(role=Qt.UserRole)
-            if not atoms:
-                continue
-            for atom in atoms:
-                members[atom].append(bd_idx)
-        members = dict(members)
-        return members
+        """
+        The beads of every mapped atom, kept up to date by the model.
+        """
+        return self.model.atom_index
 
     @property
     def model(self):
@@ -64,8 +169,8 @@ class MappingView(FigureCanvas):
     def model(self, qtmodel):
         self._model = qtmodel
         self.molecule = self._model.molecule
-        self._model.dataChanged.connect(self.redraw)
-        self._model.modelReset.connect(self.redraw)
+        self._model.dataChanged.connect(self._mapping_changed)
+        self._model.modelReset.connect(self._mapping_changed)
 
     def setModel(self, qtmodel):
         self.model = qtmodel
@@ -73,7 +178,7 @@ class MappingView(FigureCanvas):
     def setSelectionModel(self, qtselectionmodel):
         self._selectionmodel = qtselectionmodel
         # Redraw the selection border
-        self._selectionmodel.selectionChanged.connect(self.redraw)
+        self._selectionmodel.selectionChanged.connect(self._selection_changed)
 
     def selectionModel(self):
         return self._selectionmodel
@@ -84,19 +189,28 @@ class MappingView(FigureCanvas):
 
     @molecule.setter
     def molecule(self, new_mol):
+        old_molecule, old_embeddings = self._molecule, dict(self._embeddings)
         self._molecule = new_mol.copy()
+        self.cancel_layouts()
         self._embeddings.clear()
-        self._set_ax_lims()
-        self.redraw()
-
-    def _set_ax_lims(self):
-        positions = np.array(list(self.embedding.values()))
-        if positions.ndim < 2:
-            return
-        min_x, min_y = np.min(positions, axis=0)
-        max_x, max_y = np.max(positions, axis=0)
-        self.ax.set_xlim(min_x - self.atom_radius, max_x + self.atom_radius, emit=False)
-        self.ax.set_ylim(min_y - self.atom_radius, max_y + self.atom_radius, emit=True)
+        self._failed.clear()
+        self.qualities.clear()
+        # Small changes, like adding hydrogens, only need the changed atoms
+        # to be placed.
+        self.warm_started = False
+        matched = matched_fraction(old_molecule, self._molecule) if old_embeddings else 0
+        for name, embedding in old_embeddings.items():
+            if not len(self._molecule):
+                break
+            warm = warm_start_embedding(self._molecule, name, old_molecule, embedding,
+                                        cache=self.embedding_cache)
+            if warm is not None:
+                self._embeddings[name] = warm
+                # Only layouts of nearly the same molecule are as good as
+                # their predecessors; otherwise the survey still runs.
+                self.warm_started = matched >= SKIP_SURVEY_MATCHED
+        self._fit_view()
+        self.schedule_redraw('molecule')
 
     @property
     def current_embedding(self):
@@ -105,84 +219,215 @@ class MappingView(FigureCanvas):
     @current_embedding.setter
     def current_embedding(self, embedding_name):
         self._current_embedding = embedding_name
-        self._set_ax_lims()
-        self.redraw()
+        # Only the layout that is shown is worth computing.
+        self.cancel_layouts(keep=embedding_name)
+        self._fit_view()
+        self.schedule_redraw('molecule')
 
     def _set_embedding(self, name):
         self.current_embedding = name
 
+    def _retire(self, worker):
+        worker.cancel()
+        self._retired.add(worker)
+
+    def _cancel_layout(self, name):
+        self._retire(self._workers.pop(name))
+        self._previews.pop(name, None)
+
+    def cancel_layouts(self, keep=None, wait=False):
+        """
+        Stops computing all layouts except `keep`, and stops the survey if
+        `keep` is None.
+        """
+        for name in list(self._workers):
+            if name != keep:
+                self._cancel_layout(name)
+        if keep is None and self._survey is not None:
+            self._retire(self._survey)
+            self._survey = None
+        if wait:
+            for worker in list(self._retired):
+                worker.wait()
+
+    def layout_running(self, name=None):
+        return (name or self.current_embedding) in self._workers
+
+    def survey_running(self):
+        return self._survey is not None
+
+    def survey_layouts(self):
+        """
+        Computes and scores all layouts at the same time. See `layout_scored`
+        and `survey_done`.
+        """
+        if self._survey is not None:
+            self._retire(self._survey)
+        self._survey = LayoutSurveyWorker(self._molecule, cache=self.embedding_cache)
+        self._survey.scored.connect(self._layout_scored)
+        self._survey.finished.connect(self._survey_finished)
+        self._survey.start()
+
+    def adopt_layouts(self, other):
+        """
+        Takes over the finished layouts and their scores from `other`, a
+        view of the same model.
+        """
+        if other.model is not self.model:
+            return
+        for name in other._embeddings:
+            if name in self._workers:
+                self._cancel_layout(name)
+        self._embeddings.update(other._embeddings)
+        self._failed.update(other._failed)
+        self.qualities.update(other.qualities)
+        self.warm_started = other.warm_started
+        self._fit_view()
+        self.schedule_redraw('molecule')
+
+    def _layout_scored(self, name, embedding, quality):
+        if self.sender() is not self._survey:
+            return
+        self.qualities[name] = quality
+        if name not in self._embeddings:
+            if name in self._workers:
+                self._cancel_layout(name)
+            self._embeddings[name] = embedding
+            if name == self.current_embedding:
+                self._fit_view()
+                self.schedule_redraw('molecule')
+        self.layout_scored.emit(name, quality)
+
+    def _survey_finished(self):
+        worker = self.sender()
+        self._retired.discard(worker)
+        if worker is not self._survey:
+            return
+        self._survey = None
+        if self.qualities:
+            best = min(self.qualities, key=lambda name: self.qualities[name].penalty)
+            self.survey_done.emit(best)
+
+    def _start_layout(self, name):
+        worker = LayoutWorker(self._molecule, name, cache=self.embedding_cache)
+        worker.preview.connect(self._layout_preview)
+        worker.done.connect(self._layout_done)
+        worker.failed.connect(self._layout_failed)
+        worker.finished.connect(self._layout_finished)
+        self._workers[name] = worker
+        worker.start()
+
+    def _is_current_worker(self, name):
+        return self._workers.get(name) is self.sender()
+
+    def _layout_preview(self, name, embedding):
+        if not self._is_current_worker(name):
+            return
+        first = name not in self._previews
+        self._previews[name] = embedding
+        if name == self.current_embedding:
+            if first:
+                self._fit_view()
+            # The worker is told when the preview has been drawn
+            self._preview_workers.add(self.sender())
+            self.schedule_redraw('molecule')
+        else:
+            self.sender().preview_shown()
+
+    def _layout_done(self, name, embedding):
+        if not self._is_current_worker(name):
+            return
+        self._embeddings[name] = embedding
+        self._previews.pop(name, None)
+        if name == self.current_embedding:
+            self._fit_view()
+            self.schedule_redraw('molecule')
+
+    def _layout_failed(self, name, message):
+        if not self._is_current_worker(name):
+            return
+        self._failed[name] = message
+        self._previews.pop(name, None)
+        if name == self.current_embedding:
+            self.schedule_redraw('molecule')
+
+    def _layout_finished(self):
+        worker = self.sender()
+        self._retired.discard(worker)
+        for name, running in list(self._workers.items()):
+            if running is worker:
+                del self._workers[name]
+
     def _make_embedding(self):
         name = self.current_embedding
         if name in self._embeddings:
             return self._embeddings[name]
-        mol = self._molecule
-        method = EMBEDDINGS[name]
-        new_pos = method(mol)
-        self._embeddings[name] = new_pos
-        return new_pos
+        # Hidden views start their layout once they are shown and redrawn.
+        if (name and name not in self._workers and name not in self._failed
+                and self.isVisible()):
+            self._start_layout(name)
+        if name in self._previews:
+            return self._previews[name]
+        return Embedding([], [])
+
+    def _status_message(self):
+        name = self.current_embedding
+        if name in self._failed:
+            return '{} layout failed: {}'.format(name, self._failed[name])
+        return 'Computing {} layout...'.format(name)
 
     @property
     def embedding(self):
+        """
+        The current layout. While it is being computed this is the latest
+        intermediate result, which may not contain all atoms yet.
+        """
         return self._make_embedding()
 
-    def redraw(self, *args):
-        xlim = self.ax.get_xlim()
-        ylim = self.ax.get_ylim()
-        self.ax.cla()
-        self.draw_molecule()
-        if self.show_mapping:
-            self.draw_mapping()
-        self.ax.set_axis_off()
-        self.ax.set(xlim=xlim, ylim=ylim)
-        self.draw_idle()
-
-    def hide_mapping(self):
-        self.show_mapping = not self.show_mapping
-        self.redraw()
+    def schedule_redraw(self, *changed):
+        """
+        Redraws once control returns to the event loop, however often this
+        is called before that. `changed` is any of 'molecule', 'mapping' and
+        'selection'; if only the selection changed, only the selection border
+        is drawn again.
+        """
+        self.redraw_counts['requested'] += 1
+        self._dirty.update(changed or ('molecule',))
+        if not self._redraw_timer.isActive():
+            self._redraw_timer.start()
 
-    def draw_molecule(self):
-        draw_molecule(self.molecule, pos=self.embedding, ax=self.ax,
-                      labels=nx.get_node_attributes(self.molecule, 'atomname'))
+    def _mapping_changed(self, *args):
+        self.schedule_redraw('mapping')
 
-    def draw_mapping(self, mapping=None):
-        pos = self.embedding
-        mapping = mapping or self.mapping
+    def _selection_changed(self, *args):
+        self.schedule_redraw('selection')
 
-        for idx in mapping:
-            position = pos[idx]
-            member = mapping[idx]
-            counts = Counter(member)
-            sizes = [counts[idx] for idx in range(max(member) + 1)]
-            colors = [self.model.index(bd_idx, 0).data(role=Qt.DecorationRole).getRgbF()
-                      for bd_idx in range(len(sizes))]
-            pie = self.ax.pie(sizes, center=position, radius=self.atom_radius, normalize=True,
-                              colors=colors)
-            selected = self._selected_bead()
-            for bd_idx, wedge in enumerate(pie[0]):
-                if bd_idx == selected:
-                    wedge.set_linewidth(1)
-                    wedge.set_linestyle('-')
-                    wedge.set_edgecolor('black')
-
-    def _click_canvas(self, mpl_event):
-        try:
-            xpress = mpl_event.xdata
-            ypress = mpl_event.ydata
-        except AttributeError:
+    def _perform_redraw(self):
+        if not self.isVisible():
+            # Hidden views catch up once they are shown again.
             return
-        if not xpress or not ypress:
+        dirty, self._dirty = self._dirty, set()
+        workers, self._preview_workers = self._preview_workers, set()
+        if not dirty:
             return
-        for n_idx, pos in self.embedding.items():
-            if (pos[0] - xpress) ** 2 + (pos[1] - ypress) ** 2 <= self.atom_radius ** 2:
-                # Clicked node n_idx
-                if mpl_event.button == MouseButton.RIGHT:
-                    self._select_atom(n_idx)
-                elif mpl_event.button == MouseButton.LEFT:
-                    self._map(n_idx)
+        start = time.monotonic()
+        if dirty == {'selection'}:
+            self.redraw_selection()
+        else:
+            self.redraw()
+        # Drawing big molecules is slow, and previews should not keep the GUI
+        # (or the layout, which shares the GIL) busy.
+        duration = time.monotonic() - start
+        for worker in workers:
+            worker.preview_shown(5 * duration)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self._dirty:
+            self._redraw_timer.start()
 
     def _select_atom(self, n_idx):
-        rev_mapping = self.model.reverse_mapping
-        members = rev_mapping.get(n_idx, [])
+        members = self.model.atom_beads(n_idx)
         if not members:
             # Select new bead
             bd_idx = self.model.rowCount(0) - 1
@@ -210,6 +455,13 @@ class MappingView(FigureCanvas):
         index = self.model.index(bd_idx, 2)
         self.model.setData(index, n_idx, Qt.UserRole)
 
+    def _map_atoms(self, atoms):
+        bd_idx = self._selected_bead()
+        if bd_idx == -1 or not atoms:
+            return
+        toggle = QApplication.keyboardModifiers() & Qt.ShiftModifier
+        self.model.map_atoms(bd_idx, atoms, mode='toggle' if toggle else 'add')
+
     def _selected_bead(self):
         bd_idxs = set(idx.row() for idx in self._selectionmodel.selection().indexes())
         if len(bd_idxs) != 1:
@@ -217,6 +469,248 @@ class MappingView(FigureCanvas):
         return bd_idxs.pop()
 
 
+class MappingView(MappingViewBase, FigureCanvas):
+    # Emitted with the name and LayoutQuality of every surveyed layout, and
+    # with the name of the best layout once the survey is done.
+    layout_scored = pyqtSignal(str, object)
+    survey_done = pyqtSignal(str)
+
+    def __init__(self, figure, atom_radius=0.45):
+        super().__init__(figure)
+        self.ax = figure.subplots()
+        self.mpl_connect('button_press_event', self._click_canvas)
+        self.mpl_connect('draw_event', self._canvas_drawn)
+        self._init_view(atom_radius)
+        # What is currently drawn. Artists are only replaced when what they
+        # show changes.
+        self._drawn_mapping = {}
+        self._drawn_embedding = None
+        self._drawn_molecule = None
+        self._molecule_artists = []
+        self._status_text = None
+        # For every atom with a pie, the beads and paths of its wedges
+        self._wedges = {}
+        self._wedge_beads = np.zeros(0, dtype=int)
+        self._wedge_paths = []
+        self._pies = PathCollection([], edgecolors='none', linewidths=0)
+        # The border around the selected bead is drawn on top by blitting,
+        # so that selecting a bead does not redraw the whole molecule.
+        self._highlight = PathCollection([], facecolors='none', edgecolors='black',
+                                         linewidths=1, animated=True)
+        self._background = None
+        # Rectangle and lasso selection, which map all atoms inside them at
+        # once. Holding shift toggles them instead. Only the selector of the
+        # active tool exists: a blitting selector redraws the canvas without
+        # the animated highlight on every draw to save its own background.
+        self._selector = None
+        self.ax.set_aspect(1)
+        self.ax.set_axis_off()
+        self.ax.autoscale(False)
+        self.ax.add_collection(self._pies, autolim=False)
+        self.ax.add_collection(self._highlight, autolim=False)
+        self.draw()
+
+    def _fit_view(self):
+        positions = self.embedding.positions
+        if not len(positions):
+            return
+        min_x, min_y = np.min(positions, axis=0)
+        max_x, max_y = np.max(positions, axis=0)
+        self.ax.set_xlim(min_x - self.atom_radius, max_x + self.atom_radius, emit=False)
+        self.ax.set_ylim(min_y - self.atom_radius, max_y + self.atom_radius, emit=True)
+
+    def redraw(self, *args):
+        """
+        Brings the drawing up to date with the embedding and the mapping. The
+        molecule is only drawn again if the embedding changed, and only the
+        pies of atoms whose beads changed are recomputed.
+        """
+        embedding = self.embedding
+        if not embedding and len(self.molecule):
+            self._clear_drawing()
+            self._draw_status()
+        else:
+            self._remove_status()
+            if (embedding is not self._drawn_embedding
+                    or self.molecule is not self._drawn_molecule):
+                self._clear_drawing()
+                self.draw_molecule()
+                self._drawn_embedding = embedding
+                self._drawn_molecule = self.molecule
+            self.draw_mapping()
+        self._update_highlight()
+        self.redraw_counts['performed'] += 1
+        self.draw_idle()
+
+    def _clear_drawing(self):
+        for artist in self._molecule_artists:
+            artist.remove()
+        self._molecule_artists = []
+        self._drawn_embedding = self._drawn_molecule = None
+        self._wedges = {}
+        self._drawn_mapping = {}
+        self._set_wedges()
+
+    def _draw_status(self):
+        text = self._status_message()
+        if self._status_text is None:
+            self._status_text = self.ax.text(0.5, 0.5, text, transform=self.ax.transAxes,
+                                             horizontalalignment='center',
+                                             verticalalignment='center')
+        else:
+            self._status_text.set_text(text)
+
+    def _remove_status(self):
+        if self._status_text is not None:
+            self._status_text.remove()
+            self._status_text = None
+
+    def hide_mapping(self):
+        self.show_mapping = not self.show_mapping
+        self._pies.set_visible(self.show_mapping)
+        self._highlight.set_visible(self.show_mapping)
+        self.schedule_redraw('mapping')
+
+    def draw_molecule(self):
+        pos = self.embedding
+        molecule = self.molecule
+        if len(pos) != len(molecule):
+            # Intermediate results can be missing atoms
+            molecule = molecule.subgraph(pos.nodes)
+        self._molecule_artists = draw_molecule(
+            molecule, pos=pos, ax=self.ax, labels=nx.get_node_attributes(molecule, 'atomname')
+        )
+
+    def draw_mapping(self, mapping=None):
+        """
+        Updates the pies of all atoms whose beads changed since the last
+        call.
+        """
+        pos = self.embedding
+        mapping = mapping or self.mapping
+        current = {idx: tuple(sorted(beads)) for idx, beads in mapping.items() if idx in pos}
+        changed = [idx for idx, beads in current.items() if self._drawn_mapping.get(idx) != beads]
+        removed = [idx for idx in self._drawn_mapping if idx not in current]
+        for idx in removed:
+            del self._wedges[idx]
+        if changed:
+            rows = np.repeat(np.arange(len(changed)), [len(current[idx]) for idx in changed])
+            beads = np.fromiter((bd_idx for idx in changed for bd_idx in current[idx]),
+                                dtype=int, count=len(rows))
+            sizes = np.zeros((len(changed), beads.max() + 1))
+            np.add.at(sizes, (rows, beads), 1)
+            vertices, pies, slices = pie_wedges(pos.positions[pos.rows(changed)], sizes,
+                                                radius=self.atom_radius)
+            paths = wedge_paths(vertices)
+            # Wedges are sorted by pie
+            bounds = np.cumsum(np.bincount(pies, minlength=len(changed)))
+            start = 0
+            for idx, stop in zip(changed, bounds):
+                self._wedges[idx] = (slices[start:stop], paths[start:stop])
+                start = stop
+        self._drawn_mapping = current
+        if changed or removed:
+            self._set_wedges()
+
+    def _set_wedges(self):
+        wedges = self._wedges.values()
+        self._wedge_beads = np.concatenate([beads for beads, _ in wedges] or [np.zeros(0, dtype=int)])
+        self._wedge_paths = [path for _, paths in wedges for path in paths]
+        self._pies.set_paths(self._wedge_paths)
+        if len(self._wedge_beads):
+            # Colours are the same for every atom
+            colors = np.array([self.model.index(bd_idx, 0).data(role=Qt.DecorationRole).getRgbF()
+                               for bd_idx in range(self._wedge_beads.max() + 1)])
+            self._pies.set_facecolor(colors[self._wedge_beads])
+
+    def _update_highlight(self):
+        if not len(self._wedge_beads):
+            self._highlight.set_paths([])
+            return
+        selected = np.nonzero(self._wedge_beads == self._selected_bead())[0]
+        self._highlight.set_paths([self._wedge_paths[idx] for idx in selected])
+
+    def _canvas_drawn(self, event):
+        # A full draw leaves out the animated highlight, so save the result
+        # as background and draw the highlight on top.
+        self._background = self.copy_from_bbox(self.ax.bbox)
+        if self._highlight.get_visible():
+            self.ax.draw_artist(self._highlight)
+
+    def redraw_selection(self, *args):
+        """
+        Draws the border around the selected bead, without drawing anything
+        else again.
+        """
+        self._update_highlight()
+        self.redraw_counts['blitted'] += 1
+        if self._background is None:
+            self.draw_idle()
+            return
+        self.restore_region(self._background)
+        if self._highlight.get_visible():
+            self.ax.draw_artist(self._highlight)
+        self.blit(self.ax.bbox)
+
+    def set_selection_tool(self, name=None):
+        """
+        Makes left dragging map atoms with the 'rectangle' or 'lasso' tool,
+        or turns that off if `name` is None.
+        """
+        if self._selector is not None:
+            self._selector.disconnect_events()
+            for artist in self._selector.artists:
+                artist.remove()
+            self._selector = None
+        if name == 'rectangle':
+            self._selector = RectangleSelector(self.ax, self._rectangle_selected, useblit=True,
+                                               button=[MouseButton.LEFT], minspanx=1e-9,
+                                               minspany=1e-9, spancoords='data')
+        elif name == 'lasso':
+            self._selector = LassoSelector(self.ax, self._lasso_selected, useblit=True,
+                                           button=[MouseButton.LEFT])
+        self.selection_tool = name
+
+    def _rectangle_selected(self, press, release):
+        if None in (press.xdata, press.ydata, release.xdata, release.ydata):
+            return
+        self._map_atoms(self.embedding.in_rectangle((press.xdata, press.ydata),
+                                                    (release.xdata, release.ydata)))
+
+    def _lasso_selected(self, vertices):
+        self._map_atoms(self.embedding.in_polygon(vertices))
+
+    def _click_canvas(self, mpl_event):
+        if self.selection_tool is not None and mpl_event.button == MouseButton.LEFT:
+            # Left clicks belong to the selection tool
+            return
+        try:
+            xpress = mpl_event.xdata
+            ypress = mpl_event.ydata
+        except AttributeError:
+            return
+        if xpress is None or ypress is None:
+            return
+        n_idx = self.embedding.nearest((xpress, ypress), self.atom_radius)
+        if n_idx is None:
+            return
+        # Clicked node n_idx
+        if mpl_event.button == MouseButton.RIGHT:
+            self._select_atom(n_idx)
+        elif mpl_event.button == MouseButton.LEFT:
+            self._map(n_idx)
+
+
+@lru_cache()
+def _palette(name, offset=0, step=1):
+    """
+    Every `step`th colour of the qualitative colormap `name`, starting at
+    `offset`, as QColors.
+    """
+    colors = colormap(name).colors
+    return tuple(QColor.fromRgbF(*colors[idx][:3]) for idx in range(offset, len(colors), step))
+
+
 class MappingModel(QAbstractTableModel):
     def __init__(self, molecule, mapping=None, names=None, types=None):
         super().__init__()
@@ -236,19 +730,85 @@ class MappingModel(QAbstractTableModel):
         self.names = names or []
         self.types = types or []
 
+    @property
+    def mapping(self):
+        """
+        For every bead, the sorted list of its atoms.
+        """
+        return [self.bead_atoms(row) for row in range(len(self._members))]
+
+    @mapping.setter
+    def mapping(self, mapping):
+        # Both directions are kept up to date on every edit: the atoms of
+        # every bead, and the beads of every atom.
+        self._members = [set(atoms) for atoms in mapping]
+        self._atom_beads = defaultdict(set)
+        for bd_idx, atoms in enumerate(self._members):
+            for atom in atoms:
+                self._atom_beads[atom].add(bd_idx)
+        self._sorted_members = {}
+        self._member_names = {}
+
+    def _changed(self, row):
+        self._sorted_members.pop(row, None)
+        self._member_names.pop(row, None)
+
+    def _add_members(self, row, atoms):
+        for atom in atoms:
+            self._atom_beads[atom].add(row)
+        self._members[row].update(atoms)
+        self._changed(row)
+
+    def _remove_members(self, row, atoms):
+        for atom in atoms:
+            self._atom_beads[atom].discard(row)
+            if not self._atom_beads[atom]:
+                del self._atom_beads[atom]
+        self._members[row].difference_update(atoms)
+        self._changed(row)
+
+    def _set_members(self, row, atoms):
+        atoms = set(atoms)
+        old = self._members[row]
+        self._remove_members(row, old - atoms)
+        self._add_members(row, atoms - old)
+
+    def bead_atoms(self, row):
+        if row not in self._sorted_members:
+            self._sorted_members[row] = sorted(self._members[row])
+        return self._sorted_members[row]
+
+    def bead_atom_names(self, row):
+        """
+        The names of the atoms of bead `row`, as shown in the table.
+        """
+        if row not in self._member_names:
+            self._member_names[row] = ' '.join(self.molecule.nodes[idx]['atomname']
+                                               for idx in self.bead_atoms(row))
+        return self._member_names[row]
+
+    def atom_beads(self, atom):
+        """
+        The sorted beads `atom` is part of.
+        """
+        return sorted(self._atom_beads.get(atom, ()))
+
+    @property
+    def atom_index(self):
+        """
+        The set of beads of every mapped atom. Do not modify.
+        """
+        return self._atom_beads
+
     @property
     def reverse_mapping(self):
-        out = defaultdict(list)
-        for bd_idx, at_idxs in enumerate(self.mapping):
-            for at_idx in at_idxs:
-                out[at_idx].append(bd_idx)
-        return dict(out)
+        return {atom: sorted(beads) for atom, beads in self._atom_beads.items()}
 
     def data(self, index, role):
         row = index.row()
         col = index.column()
         if role == Qt.DisplayRole or role == Qt.EditRole:
-            if row >= len(self.mapping):
+            if row >= len(self._members):
                 return ''
             if col == 0:
                 # Bead name
@@ -258,9 +818,9 @@ class MappingModel(QAbstractTableModel):
                 return self.types[row]
             elif col == 2:
                 # atom members
-                return ' '.join(self.molecule.nodes[idx]['atomname'] for idx in self.mapping[row])
+                return self.bead_atom_names(row)
         elif role == Qt.UserRole:
-            if row >= len(self.mapping):
+            if row >= len(self._members):
                 return None
             if col == 0:
                 # Bead name
@@ -270,18 +830,17 @@ class MappingModel(QAbstractTableModel):
                 return self.types[row]
             elif col == 2:
                 # atom members
-                return self.mapping[row]
+                return self.bead_atoms(row)
         elif role == Qt.BackgroundRole:
             # row to color
-            cmap = get_cmap('tab20')
-            c_idx = row*2 + 1  # Row 0 gets color 1, row 1 gets color 3, etc.
-            return QColor.fromRgbF(*cmap.colors[c_idx % cmap.N])
+            colors = _palette('tab20', 1, 2)  # Row 0 gets color 1, row 1 gets color 3, etc.
+            return colors[row % len(colors)]
         elif role == Qt.DecorationRole and col == 0:
-            cmap = get_cmap('tab10')
-            return QColor.fromRgbF(*cmap.colors[row % cmap.N])
+            colors = _palette('tab10')
+            return colors[row % len(colors)]
 
     def rowCount(self, index):
-        return len(self.mapping)+1
+        return len(self._members)+1
 
     def columnCount(self, index):
         return 3
@@ -295,11 +854,7 @@ class MappingModel(QAbstractTableModel):
         row = index.row()
         col = index.column()
         if row == len(self.names) and value != '':
-            self.layoutAboutToBeChanged.emit([QPersistentModelIndex(index.siblingAtRow(row+1))])
-            self.names.append('BD{}'.format(row))
-            self.types.append('__')
-            self.mapping.append([])
-            self.layoutChanged.emit([QPersistentModelIndex(index.siblingAtRow(row+1))])
+            self._add_bead(index)
         if role == Qt.EditRole:
             value = value.strip()
 
@@ -319,18 +874,50 @@ class MappingModel(QAbstractTableModel):
                         dialog.exec_()
                         return False
                     idxs.extend(self._name_to_idx[atname])
-                self.mapping[row] = sorted(idxs)
+                self._set_members(row, idxs)
             self.dataChanged.emit(index, index, [role])
         elif role == Qt.UserRole and col == 2:
             if value == -1:
-                self.mapping[row] = []
-            elif value in self.mapping[row]:
-                self.mapping[row].remove(value)
+                self._set_members(row, ())
+            elif value in self._members[row]:
+                self._remove_members(row, [value])
             else:
-                self.mapping[row] = sorted(self.mapping[row] + [value])
+                self._add_members(row, [value])
             self.dataChanged.emit(index, index, [role])
         return True
 
+    def _add_bead(self, index):
+        row = index.row()
+        self.layoutAboutToBeChanged.emit([QPersistentModelIndex(index.siblingAtRow(row+1))])
+        self.names.append('BD{}'.format(row))
+        self.types.append('__')
+        self._members.append(set())
+        self.layoutChanged.emit([QPersistentModelIndex(index.siblingAtRow(row+1))])
+
+    def map_atoms(self, row, atoms, mode='add'):
+        """
+        Adds ('add'), removes ('remove') or toggles ('toggle') all `atoms` in
+        bead `row` at once, with a single dataChanged. Row rowCount() - 1
+        makes a new bead.
+        """
+        if mode not in ('add', 'remove', 'toggle'):
+            raise ValueError('Unknown mode {}'.format(mode))
+        atoms = set(atoms)
+        if not atoms:
+            return
+        index = self.index(row, 2)
+        if row == len(self.names):
+            if mode == 'remove':
+                return
+            self._add_bead(index)
+        members = self._members[row]
+        present = atoms & members
+        if mode in ('remove', 'toggle'):
+            self._remove_members(row, present)
+        if mode in ('add', 'toggle'):
+            self._add_members(row, atoms - present)
+        self.dataChanged.emit(index, index, [Qt.UserRole])
+
     def reset(self):
         self.beginResetModel()
         self.mapping = []
@@ -345,6 +932,10 @@ class MappingModel(QAbstractTableModel):
             return Qt.ItemIsEditable | Qt.ItemIsEnabled | Qt.ItemIsSelectable
 
 
+# The canvases MappingWidget can draw with, as (label, name)
+CANVASES = (('Matplotlib', 'matplotlib'), ('Qt scene', 'scene'))
+
+
 class MappingWidget(QWidget):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -354,29 +945,62 @@ class MappingWidget(QWidget):
         layout = QHBoxLayout()
         canvas_layout = QVBoxLayout()
         self.embeddings_box = QComboBox()
-        self.embeddings_box.addItems(EMBEDDINGS.keys())
+        for name in EMBEDDINGS:
+            self.embeddings_box.addItem(name, name)
         self.embeddings_box.setEditable(False)
-        self.embeddings_box.currentTextChanged.connect(self._set_embedding)
+        self.embeddings_box.currentIndexChanged.connect(self._embedding_changed)
+        # Only emitted when the user picks a layout.
+        self.embeddings_box.activated.connect(self._embedding_picked)
+        self._user_picked = False
 
-        canvas_layout.addWidget(self.embeddings_box)
+        self.auto_layout = QCheckBox('Pick best')
+        self.auto_layout.setToolTip('Compute all layouts and show the one with the '
+                                    'fewest crossings and overlaps')
+        self.auto_layout.setChecked(True)
+        self.auto_layout.toggled.connect(self._auto_layout_toggled)
 
-        self.figure = Figure()
-        self.canvas = MappingView(self.figure)
-        canvas_layout.addWidget(self.canvas)
+        embeddings_layout = QHBoxLayout()
+        embeddings_layout.addWidget(self.embeddings_box, stretch=1)
+        embeddings_layout.addWidget(self.auto_layout)
+        canvas_layout.addLayout(embeddings_layout)
 
-        canvas_toolbar = NavigationToolbar(self.canvas, self.canvas, False)
-        canvas_toolbar.addSeparator()
+        # The canvas can be switched at runtime. Canvases are made when they
+        # are first picked, and share these actions.
+        self.canvas_box = QComboBox()
+        for label, name in CANVASES:
+            self.canvas_box.addItem(label, name)
+        self.canvas_box.setToolTip('What the molecule is drawn with')
+        self.canvas_box.currentIndexChanged.connect(self._canvas_changed)
+        embeddings_layout.addWidget(self.canvas_box)
+
+        self._canvas_actions = []
         hide_mapping = QAction('Hide Mapping', self,
                                icon=self.style().standardIcon(QStyle.SP_DesktopIcon))
-        hide_mapping.triggered.connect(self.canvas.hide_mapping)
-        canvas_toolbar.addAction(hide_mapping)
+        hide_mapping.triggered.connect(lambda: self.canvas.hide_mapping())
+        self._canvas_actions.append(hide_mapping)
 
         remove_mapping = QAction('Remove Mapping', self,
                                  icon=self.style().standardIcon(QStyle.SP_DialogDiscardButton))
-        remove_mapping.triggered.connect(self.canvas.remove_mapping)
-        canvas_toolbar.addAction(remove_mapping)
+        remove_mapping.triggered.connect(lambda: self.canvas.remove_mapping())
+        self._canvas_actions.append(remove_mapping)
+
+        self._canvas_actions.append(None)
+        self._selection_tools = {}
+        for tool, label in (('rectangle', 'Rectangle Select'), ('lasso', 'Lasso Select')):
+            action = QAction(label, self, checkable=True)
+            action.setToolTip('{}: map all atoms inside to the selected bead, '
+                              'hold shift to toggle them'.format(label))
+            action.toggled.connect(
+                lambda checked, tool=tool: self._selection_tool_toggled(tool, checked)
+            )
+            self._canvas_actions.append(action)
+            self._selection_tools[tool] = action
 
-        canvas_layout.addWidget(canvas_toolbar, alignment=Qt.AlignBottom)
+        self._canvases = {}
+        self._canvas_stack = QStackedWidget()
+        canvas_layout.addWidget(self._canvas_stack)
+        self.canvas = self._make_canvas(self.canvas_box.currentData())
+        self._canvas_stack.setCurrentWidget(self.canvas.parentWidget())
 
         layout.addLayout(canvas_layout)
 
@@ -385,11 +1009,97 @@ class MappingWidget(QWidget):
         layout.addWidget(self._table)
 
         self.setLayout(layout)
-        self._set_embedding(self.embeddings_box.currentText())
+        self._set_embedding(self.embeddings_box.currentData())
 
     def _set_embedding(self, name):
         self.canvas.current_embedding = name
 
+    def _make_canvas(self, name):
+        if name == 'scene':
+            from .scene_view import SceneMappingView
+
+            canvas = SceneMappingView()
+            toolbar = QToolBar()
+            toolbar.addAction(self.style().standardIcon(QStyle.SP_DirHomeIcon), 'Home',
+                              canvas.home)
+        else:
+            self.figure = Figure()
+            canvas = MappingView(self.figure)
+            toolbar = NavigationToolbar(canvas, canvas, False)
+        canvas.layout_scored.connect(self._layout_scored)
+        canvas.survey_done.connect(self._survey_done)
+        toolbar.addSeparator()
+        for action in self._canvas_actions:
+            if action is None:
+                toolbar.addSeparator()
+            else:
+                toolbar.addAction(action)
+
+        page = QWidget()
+        page_layout = QVBoxLayout(page)
+        page_layout.setContentsMargins(0, 0, 0, 0)
+        page_layout.addWidget(canvas)
+        page_layout.addWidget(toolbar, alignment=Qt.AlignBottom)
+        self._canvas_stack.addWidget(page)
+        self._canvases[name] = canvas
+        return canvas
+
+    def _canvas_changed(self, index):
+        name = self.canvas_box.itemData(index)
+        old = self.canvas
+        new = self._canvases.get(name) or self._make_canvas(name)
+        if new is old:
+            return
+        surveying = old.survey_running()
+        old.cancel_layouts()
+        # The new canvas is still hidden, so none of this starts a layout.
+        if new.model is not self._mapping:
+            new.setModel(self._mapping)
+        if new.selectionModel() is not self._table.selectionModel():
+            new.setSelectionModel(self._table.selectionModel())
+        new.current_embedding = old.current_embedding
+        new.adopt_layouts(old)
+        new.set_selection_tool(old.selection_tool)
+        if new.show_mapping != old.show_mapping:
+            new.hide_mapping()
+        self.canvas = new
+        self._canvas_stack.setCurrentWidget(new.parentWidget())
+        if surveying:
+            new.survey_layouts()
+
+    def _selection_tool_toggled(self, tool, checked):
+        if checked:
+            for other, action in self._selection_tools.items():
+                if other != tool:
+                    action.setChecked(False)
+            self.canvas.set_selection_tool(tool)
+        elif self.canvas.selection_tool == tool:
+            self.canvas.set_selection_tool(None)
+
+    def _embedding_changed(self, index):
+        self._set_embedding(self.embeddings_box.itemData(index))
+
+    def _embedding_picked(self, index):
+        self._user_picked = True
+
+    def _layout_scored(self, name, quality):
+        index = self.embeddings_box.findData(name)
+        self.embeddings_box.setItemText(index, '{} ({})'.format(name, quality))
+
+    def _survey_done(self, best):
+        if not self._user_picked and self.auto_layout.isChecked():
+            self.embeddings_box.setCurrentIndex(self.embeddings_box.findData(best))
+
+    def _reset_scores(self):
+        for index in range(self.embeddings_box.count()):
+            self.embeddings_box.setItemText(index, self.embeddings_box.itemData(index))
+
+    def _auto_layout_toggled(self, checked):
+        if (checked and len(self._molecule) and not self.canvas.qualities
+                and not self.canvas.survey_running()):
+            self._user_picked = False
+            self.canvas.survey_layouts()
+
     @property
     def molecule(self):
         return self._molecule
@@ -397,15 +1107,20 @@ class MappingWidget(QWidget):
     @molecule.setter
     def molecule(self, new_mol):
         self._molecule = new_mol.copy()
-        for idx in self._molecule:
-            node = self._molecule.nodes[idx]
-            node['atomname'] = node.get('atomname', '{}{}'.format(node['element'], idx))
+        set_default_atomnames(self._molecule)
         self._mapping.molecule = self._molecule
         self._mapping = MappingModel(self._molecule)
         self._table.setModel(self._mapping)
         self.canvas.setModel(self._mapping)
         self.canvas.setSelectionModel(self._table.selectionModel())
-        self._set_embedding(self.embeddings_box.currentText())
+        self._reset_scores()
+        self._user_picked = False
+        self._set_embedding(self.embeddings_box.currentData())
+        # Warm started layouts are as good as their predecessors, and much
+        # cheaper than the survey.
+        if (self.auto_layout.isChecked() and len(self._molecule)
+                and not self.canvas.warm_started):
+            self.canvas.survey_layouts()
 
     def set_value(self, value):
         self.molecule = value
@@ -0,0 +1,258 @@
+"""
+Finding which atom of one molecule is which atom of another, e.g. of a PDB
+file and a SMILES string. Mismatches are rejected with cheap invariants
+first: atom and bond counts, and the number of atoms of every element with
+every number of bonds. The atoms are then coloured by iterative colour
+refinement (1-dimensional Weisfeiler-Lehman), comparing the colour histograms
+of both molecules after every round. Only atoms with the same colour can be
+matched, which leaves very few candidates for the final backtracking search.
+"""
+from collections import Counter
+import time
+
+import numpy as np
+
+# Colour refinement stops after this many rounds, even if the colours still
+# change. Long chains need as many rounds as they are long to be refined
+# completely, but the search does not need that.
+REFINEMENT_ROUNDS = 32
+# Number of search steps between calls to the callback.
+CHECK_INTERVAL = 1000
+
+
+class NotIsomorphic(ValueError):
+    """
+    Raised if two molecules are not isomorphic. The message says why.
+    """
+
+
+class MatchCancelled(Exception):
+    """
+    Raised from a matching callback to stop the search.
+    """
+
+
+class MatchTimeout(TimeoutError):
+    """
+    Raised if no isomorphism was found within the timeout.
+    """
+
+
+def _compare(count1, count2, names, what):
+    for key in sorted(set(count1) | set(count2), key=str):
+        if count1[key] != count2[key]:
+            raise NotIsomorphic('the {} has {} {} and the {} {}'.format(
+                names[0], count1[key], what(key), names[1], count2[key]))
+
+
+def check_invariants(graph1, graph2, attribute='element', names=('first', 'second')):
+    """
+    Raises NotIsomorphic if `graph1` and `graph2` differ in their number of
+    atoms or bonds, or in how many atoms of every element have a given
+    number of bonds.
+    """
+    if len(graph1) != len(graph2):
+        raise NotIsomorphic('the {} has {} atoms and the {} {}'.format(
+            names[0], len(graph1), names[1], len(graph2)))
+    if graph1.number_of_edges() != graph2.number_of_edges():
+        raise NotIsomorphic('the {} has {} bonds and the {} {}'.format(
+            names[0], graph1.number_of_edges(), names[1], graph2.number_of_edges()))
+    elements1 = Counter(element for _, element in graph1.nodes(data=attribute))
+    elements2 = Counter(element for _, element in graph2.nodes(data=attribute))
+    _compare(elements1, elements2, names, '{} atoms'.format)
+    degrees1 = Counter((graph1.nodes[node].get(attribute), degree)
+                       for node, degree in graph1.degree)
+    degrees2 = Counter((graph2.nodes[node].get(attribute), degree)
+                       for node, degree in graph2.degree)
+    _compare(degrees1, degrees2, names, lambda key: '{} atoms with {} bond(s)'.format(*key))
+
+
+def _edge_rows(graph, nodes):
+    """
+    Both directions of every edge as row numbers into `nodes`, sorted by the
+    first. Returns the first and second rows, and where every node's edges
+    start.
+    """
+    rows = {node: row for row, node in enumerate(nodes)}
+    edges = np.array([(rows[u], rows[v]) for u, v in graph.edges], dtype=int).reshape(-1, 2)
+    edges = np.concatenate([edges, edges[:, ::-1]])
+    edges = edges[np.argsort(edges[:, 0], kind='stable')]
+    starts = np.searchsorted(edges[:, 0], np.arange(len(nodes)))
+    return edges[:, 0], edges[:, 1], starts
+
+
+def _neighbour_sums(values, sources, targets, starts, n_nodes):
+    # Nodes without neighbours get 0; reduceat needs valid starts for those.
+    sums = np.zeros(n_nodes, dtype=np.uint64)
+    if len(sources):
+        has_edges = np.bincount(sources, minlength=n_nodes) > 0
+        sums[has_edges] = np.add.reduceat(values[targets], starts[has_edges])
+    return sums
+
+
+def refine_colours(graph1, graph2, attribute='element', max_rounds=REFINEMENT_ROUNDS,
+                   names=('first', 'second'), check=None):
+    """
+    Colours the atoms of both graphs by their `attribute` and number of
+    bonds, and refines the colours by those of their neighbours until they
+    no longer change, or for `max_rounds` rounds. Colours are comparable
+    between the two graphs. Raises NotIsomorphic as soon as the number of
+    atoms of every colour differs between the graphs. `check` is called
+    every round. Returns two dicts of node to colour.
+    """
+    nodes1, nodes2 = list(graph1), list(graph2)
+    n_nodes = len(nodes1)
+    ids = {}
+    colours = np.array(
+        [ids.setdefault((graph1.nodes[node].get(attribute), graph1.degree[node]), len(ids))
+         for node in nodes1] +
+        [ids.setdefault((graph2.nodes[node].get(attribute), graph2.degree[node]), len(ids))
+         for node in nodes2],
+        dtype=int
+    )
+    n_colours = len(ids)
+    # Both graphs as one, so that colours are comparable
+    sources1, targets1, starts1 = _edge_rows(graph1, nodes1)
+    sources2, targets2, starts2 = _edge_rows(graph2, nodes2)
+    sources = np.concatenate([sources1, sources2 + n_nodes])
+    targets = np.concatenate([targets1, targets2 + n_nodes])
+    starts = np.concatenate([starts1, starts2 + len(sources1)])
+    # The neighbours of an atom are summarized as the sum of a random number
+    # for each of their colours, which is the same for any order. Sums that
+    # collide only make the colours coarser, never wrong.
+    rng = np.random.default_rng(0)
+    for _ in range(max_rounds):
+        if check:
+            check(0)
+        values = rng.integers(np.iinfo(np.int64).max, size=n_colours, dtype=np.uint64)
+        sums = _neighbour_sums(values[colours], sources, targets, starts, len(colours))
+        # Number the distinct (colour, sum) pairs
+        order = np.lexsort((sums, colours))
+        changes = np.ones(len(order), dtype=bool)
+        changes[1:] = ((colours[order[1:]] != colours[order[:-1]])
+                       | (sums[order[1:]] != sums[order[:-1]]))
+        new_colours = np.empty_like(colours)
+        new_colours[order] = np.cumsum(changes) - 1
+        n_new = int(changes.sum())
+        counts1 = np.bincount(new_colours[:n_nodes], minlength=n_new)
+        counts2 = np.bincount(new_colours[n_nodes:], minlength=n_new)
+        if np.any(counts1 != counts2):
+            raise NotIsomorphic('the atoms of the {} and {} have different surroundings'.format(*names))
+        colours = new_colours
+        # Colours are only ever split, so the same number means the same classes
+        if n_new == n_colours:
+            break
+        n_colours = n_new
+    return dict(zip(nodes1, colours[:n_nodes].tolist())), dict(zip(nodes2, colours[n_nodes:].tolist()))
+
+
+def _search_order(graph, colours):
+    """
+    Orders the nodes of `graph` such that every node but the first of each
+    connected component is a neighbour of an earlier one, starting from the
+    atoms with the rarest colours. Returns the order, and for every node the
+    earlier neighbour it is reached from (or None).
+    """
+    sizes = Counter(colours.values())
+    rarity = lambda node: sizes[colours[node]]
+    order = []
+    parents = {}
+    for root in sorted(graph, key=rarity):
+        if root in parents:
+            continue
+        parents[root] = None
+        frontier = [root]
+        while frontier:
+            order.extend(frontier)
+            next_frontier = []
+            for node in frontier:
+                for neighbour in sorted(graph[node], key=rarity):
+                    if neighbour not in parents:
+                        parents[neighbour] = node
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+    return order, parents
+
+
+def find_isomorphism(graph1, graph2, attribute='element', timeout=None, callback=None,
+                     names=('first', 'second')):
+    """
+    Finds an isomorphism between `graph1` and `graph2` in which matched atoms
+    have the same `attribute`. Returns a dict of the nodes of graph1 to
+    those of graph2.
+
+    Raises NotIsomorphic, with the reason, if there is none. `callback` is
+    called regularly with the fraction of atoms matched so far and can raise
+    MatchCancelled to stop. If `timeout` seconds pass before a match is
+    found, MatchTimeout is raised. `names` are what the two graphs are
+    called in error messages.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def check(fraction):
+        if deadline is not None and time.monotonic() > deadline:
+            raise MatchTimeout('no match found within {} seconds'.format(timeout))
+        if callback:
+            callback(fraction)
+
+    check_invariants(graph1, graph2, attribute, names)
+    colours1, colours2 = refine_colours(graph1, graph2, attribute, names=names, check=check)
+    if not graph1:
+        return {}
+
+    classes2 = {}
+    for node, colour in colours2.items():
+        classes2.setdefault(colour, []).append(node)
+    order, parents = _search_order(graph1, colours1)
+    n_nodes = len(order)
+    mapping = {}
+    used = set()
+
+    def candidates(node):
+        colour = colours1[node]
+        parent = parents[node]
+        if parent is None:
+            pool = classes2[colour]
+        else:
+            pool = graph2[mapping[parent]]
+        return iter([other for other in pool if colours2[other] == colour and other not in used])
+
+    def feasible(node, other):
+        if other in used:
+            return False
+        n_mapped = 0
+        for neighbour in graph1[node]:
+            if neighbour in mapping:
+                if mapping[neighbour] not in graph2[other]:
+                    return False
+                n_mapped += 1
+        return n_mapped == sum(1 for neighbour in graph2[other] if neighbour in used)
+
+    # Backtracking without recursion, since molecules can have many atoms.
+    options = [None] * n_nodes
+    options[0] = candidates(order[0])
+    depth = deepest = steps = 0
+    while depth < n_nodes:
+        steps += 1
+        if steps % CHECK_INTERVAL == 0:
+            check(deepest / n_nodes)
+        node = order[depth]
+        if node in mapping:
+            used.discard(mapping.pop(node))
+        for other in options[depth]:
+            if feasible(node, other):
+                mapping[node] = other
+                used.add(other)
+                break
+        else:
+            depth -= 1
+            if depth < 0:
+                raise NotIsomorphic('the {} and {} are bonded differently'.format(*names))
+            continue
+        depth += 1
+        deepest = max(deepest, depth)
+        if depth < n_nodes:
+            options[depth] = candidates(order[depth])
+    if callback:
+        callback(1)
+    return mapping
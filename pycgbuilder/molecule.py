@@ -0,0 +1,78 @@
+"""
+Reading molecules from PDB files and SMILES strings. pysmiles and vermouth are
+only imported once a molecule is actually read.
+"""
+from pathlib import Path
+
+from .bonds import guess_bonds
+from .matching import NotIsomorphic, find_isomorphism
+from .pdb_reader import read_pdb_molecule
+
+
+def load_pdb(filename, keep_hydrogens=False, chain=None, resids=None):
+    """
+    Reads the first molecule in PDB file `filename`, or the atoms in `chain`
+    and residue range `resids` of the first model, see
+    :func:`pycgbuilder.pdb_reader.read_pdb_molecule`. Bonds are guessed if
+    the file has no CONECT records for them.
+    """
+    from pysmiles import remove_explicit_hydrogens
+
+    pdb_mol = read_pdb_molecule(filename, chain, resids)
+    if not pdb_mol:
+        raise ValueError('No atoms selected in {}'.format(filename))
+    pdb_mol.graph['name'] = Path(filename).stem
+    if not pdb_mol.edges:
+        guess_bonds(pdb_mol)
+    if not keep_hydrogens:
+        remove_explicit_hydrogens(pdb_mol)
+    return pdb_mol
+
+
+def load_smiles(smiles, keep_hydrogens=False):
+    from pysmiles import read_smiles, add_explicit_hydrogens
+
+    smiles_mol = read_smiles(smiles)
+    smiles_mol.graph['smiles'] = smiles
+    smiles_mol.graph['name'] = smiles
+    if keep_hydrogens:
+        add_explicit_hydrogens(smiles_mol)
+    return smiles_mol
+
+
+def merge_molecules(pdb_mol, smiles_mol, timeout=None, callback=None):
+    """
+    Transfers the PDB atom attributes onto the matching atoms of the SMILES
+    molecule. Raises a ValueError if the two are not isomorphic. `timeout`
+    and `callback` are passed to :func:`pycgbuilder.matching.find_isomorphism`.
+    """
+    try:
+        match = find_isomorphism(pdb_mol, smiles_mol, timeout=timeout, callback=callback,
+                                 names=('PDB', 'SMILES'))
+    except NotIsomorphic as err:
+        raise ValueError('Smiles and PDB molecule are not isomorphic: {}!'.format(err)) from err
+    for pdb_idx, smi_idx in match.items():
+        smiles_mol.nodes[smi_idx].update(pdb_mol.nodes[pdb_idx])
+    smiles_mol.graph.update(pdb_mol.graph)
+    return smiles_mol
+
+
+def read_molecule(pdb=None, smiles=None, keep_hydrogens=False, chain=None, resids=None):
+    """
+    Non-interactive equivalent of :meth:`MoleculeWidget.get_value`.
+    """
+    pdb_mol = load_pdb(pdb, keep_hydrogens, chain, resids) if pdb else None
+    smiles_mol = load_smiles(smiles, keep_hydrogens) if smiles else None
+    if pdb_mol and smiles_mol:
+        return merge_molecules(pdb_mol, smiles_mol)
+    molecule = smiles_mol or pdb_mol
+    if not molecule:
+        raise ValueError('Either a PDB file or a SMILES string is required')
+    return molecule
+
+
+def set_default_atomnames(molecule):
+    # Same naming scheme as MappingWidget uses for atoms without a name
+    for idx in molecule:
+        node = molecule.nodes[idx]
+        node['atomname'] = node.get('atomname', '{}{}'.format(node['element'], idx))
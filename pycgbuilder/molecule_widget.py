@@ -1,16 +1,87 @@
-from pathlib import Path
-
-import networkx as nx
+import re
+import time
 
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 
-from pysmiles import read_smiles, remove_explicit_hydrogens, add_explicit_hydrogens
+from .matching import MatchCancelled, MatchTimeout
+from .molecule import load_pdb, load_smiles, merge_molecules
+
+# Seconds before matching the PDB and SMILES atoms is given up.
+MATCH_TIMEOUT = 60
+# A residue number, or a range of them. Residue numbers can be negative.
+RESIDS = re.compile(r'^(-?\d+)(?:-(-?\d+))?$')
+
+
+def parse_resids(text):
+    """
+    The first and last residue number in `text`, such as "5", "1-20" or
+    "-3--1", or None if `text` is empty.
+    """
+    text = text.strip()
+    if not text:
+        return None
+    match = RESIDS.match(text)
+    if match is None:
+        raise ValueError('Residues should be a number or a range like 1-20, '
+                         'not "{}"'.format(text))
+    first, last = match.groups()
+    return int(first), int(last or first)
+
+
+def parse_chain(text):
+    """
+    The chain to select: None (any chain) if `text` is empty, and the blank
+    chain if it is a space.
+    """
+    if not text:
+        return None
+    return text.strip()
+
+
+class MatchWorker(QThread):
+    """
+    Merges a PDB and SMILES molecule in the background, see
+    `merge_molecules`. The percentage of atoms matched so far is sent with
+    `progress`, at most every `progress_interval` seconds.
+    """
+    progress = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, pdb_mol, smiles_mol, timeout=MATCH_TIMEOUT, progress_interval=0.1):
+        super().__init__()
+        self.pdb_mol = pdb_mol
+        self.smiles_mol = smiles_mol
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.molecule = None
+        self._cancelled = False
+        self._last_progress = 0
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _progress(self, fraction):
+        if self._cancelled:
+            raise MatchCancelled
+        if time.monotonic() - self._last_progress >= self.progress_interval:
+            self._last_progress = time.monotonic()
+            self.progress.emit(int(100 * fraction))
+
+    def run(self):
+        try:
+            self.molecule = merge_molecules(self.pdb_mol, self.smiles_mol,
+                                            timeout=self.timeout, callback=self._progress)
+        except MatchCancelled:
+            return
+        except MatchTimeout:
+            self.failed.emit('Could not match the PDB and SMILES atoms within {} seconds. '
+                             'Are they the same molecule?'.format(self.timeout))
+        except Exception as err:
+            # Anything else would only be printed, and leave the dialog waiting.
+            self.failed.emit(str(err))
 
-from vermouth.processors import MakeBonds
-from vermouth.system import System
-from vermouth.pdb import read_pdb
 
 class MoleculeWidget(QWidget):
     def __init__(self, *args, **kwargs):
@@ -25,6 +96,21 @@ class MoleculeWidget(QWidget):
         file_layout.addWidget(self._pth_widget)
         file_layout.addWidget(browse_button)
 
+        # Which atoms of the PDB file to read. By default the first molecule;
+        # an empty chain or residue field means any chain or residue.
+        selection_layout = QHBoxLayout()
+        self._chain_widget = QLineEdit()
+        self._chain_widget.setMaxLength(1)
+        self._chain_widget.setPlaceholderText('any')
+        self._chain_widget.setToolTip('Leave empty for any chain, or type a space for atoms '
+                                      'without chain')
+        self._resids_widget = QLineEdit()
+        self._resids_widget.setPlaceholderText('all, or e.g. 1-20')
+        selection_layout.addWidget(QLabel('Chain: '))
+        selection_layout.addWidget(self._chain_widget)
+        selection_layout.addWidget(QLabel('Residues: '))
+        selection_layout.addWidget(self._resids_widget)
+
         smiles_layout = QHBoxLayout()
         smiles_layout.addWidget(QLabel('SMILES: '))
         self._smiles_widget = QLineEdit()
@@ -33,6 +119,7 @@ class MoleculeWidget(QWidget):
         self.hydrogen_checkbox = QCheckBox('Keep hydrogen atoms')
 
         layout.addLayout(file_layout)
+        layout.addLayout(selection_layout)
         layout.addLayout(smiles_layout)
         layout.addWidget(self.hydrogen_checkbox)
 
@@ -41,58 +128,72 @@ class MoleculeWidget(QWidget):
         filename = filename[0]
         self._pth_widget.setText(filename)
 
+    def _merge(self, pdb_mol, smiles_mol):
+        """
+        Merges the molecules in a MatchWorker, while a progress dialog keeps
+        the GUI responsive and allows cancelling. Returns None on failure.
+        """
+        worker = MatchWorker(pdb_mol, smiles_mol)
+        progress = QProgressDialog('Matching PDB and SMILES atoms...', 'Cancel', 0, 100, self)
+        progress.setWindowModality(Qt.WindowModal)
+        # Most molecules match long before the dialog would show
+        progress.setMinimumDuration(500)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        errors = []
+        loop = QEventLoop()
+        worker.progress.connect(progress.setValue)
+        worker.failed.connect(errors.append)
+        worker.finished.connect(loop.quit)
+        progress.canceled.connect(worker.cancel)
+        worker.start()
+        loop.exec_()
+        progress.close()
+        if errors:
+            dialog = QErrorMessage()
+            dialog.showMessage(errors[0])
+            dialog.exec_()
+        return worker.molecule
+
     def get_value(self):
+        keep_hydrogens = bool(self.hydrogen_checkbox.checkState())
         filename = self._pth_widget.text()
         if filename:
             try:
-                pdb_mol = read_pdb(filename)
+                resids = parse_resids(self._resids_widget.text())
+            except ValueError as err:
+                dialog = QErrorMessage()
+                dialog.showMessage(str(err))
+                dialog.exec_()
+                return False
+            try:
+                pdb_mol = load_pdb(filename, keep_hydrogens,
+                                   chain=parse_chain(self._chain_widget.text()), resids=resids)
             except Exception as err:
                 self._pth_widget.setText('')
                 dialog = QErrorMessage()
                 dialog.showMessage(str(err))
                 dialog.exec_()
                 return False
-            pdb_mol = pdb_mol[0]
-            pdb_mol.graph['name'] = Path(filename).stem
-            if not pdb_mol.edges:
-                system = System()
-                system.add_molecule(pdb_mol)
-                MakeBonds(allow_name=False).run_system(system)
-            if not self.hydrogen_checkbox.checkState():
-                remove_explicit_hydrogens(pdb_mol)
         else:
             pdb_mol = None
         smiles = self._smiles_widget.text()
         if smiles:
             try:
-                smiles_mol = read_smiles(smiles)
+                smiles_mol = load_smiles(smiles, keep_hydrogens)
             except Exception as err:
                 dialog = QErrorMessage()
                 dialog.showMessage(str(err))
                 dialog.exec_()
                 self._smiles_widget.setText('')
                 return False
-
-            smiles_mol.graph['smiles'] = smiles
-            smiles_mol.graph['name'] = smiles
-            if self.hydrogen_checkbox.checkState():
-                add_explicit_hydrogens(smiles_mol)
-
         else:
             smiles_mol = None
 
         if pdb_mol and smiles_mol:
-            gm = nx.isomorphism.GraphMatcher(pdb_mol, smiles_mol,
-                                             nx.isomorphism.categorical_node_match('element', None))
-            match = next(gm.isomorphisms_iter(), {})
-            if not match:
-                dialog = QErrorMessage()
-                dialog.showMessage('Smiles and PDB molecule are not isomorphic!')
-                dialog.exec_()
+            smiles_mol = self._merge(pdb_mol, smiles_mol)
+            if smiles_mol is None:
                 return False
-            for pdb_idx, smi_idx in match.items():
-                smiles_mol.nodes[smi_idx].update(pdb_mol.nodes[pdb_idx])
-            smiles_mol.graph.update(pdb_mol.graph)
 
         molecule = smiles_mol or pdb_mol
         if not molecule:
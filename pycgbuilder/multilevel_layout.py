@@ -0,0 +1,187 @@
+"""
+Multilevel force-directed layout [1]_. The graph is coarsened by repeatedly
+collapsing a matching of its edges, the coarsest graph is laid out with stress
+majorization, and every finer level starts from the positions of the level
+above it and is refined with a spring-electrical model. Repulsion is only
+computed between atoms closer than a cutoff, which are found with a KD-tree
+instead of looping over all pairs.
+
+.. [1] C. Walshaw, A Multilevel Algorithm for Force-Directed Graph-Drawing,
+       Journal of Graph Algorithms and Applications 7 (2003) 253-285.
+"""
+import math
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from .embedding import Embedding
+from .stress_layout import adjacency_matrix, stress_layout, vsepr_distances
+
+
+def _propose(adjacency, free, degree, rng):
+    """
+    Every free atom picks a free neighbour, preferring neighbours with a low
+    degree so that coarse graphs stay balanced. Returns -1 for atoms without
+    free neighbours.
+    """
+    n_nodes = adjacency.shape[0]
+    indices = adjacency.indices
+    rows = np.repeat(np.arange(n_nodes), np.diff(adjacency.indptr))
+    key = np.where(free[rows] & free[indices],
+                   degree[indices] + rng.random(len(indices)), np.inf)
+    best = np.full(n_nodes, np.inf)
+    np.minimum.at(best, rows, key)
+    choice = np.nonzero(np.isfinite(key) & (key == best[rows]))[0]
+    proposal = np.full(n_nodes, -1)
+    proposal[rows[choice]] = indices[choice]
+    return proposal
+
+
+def coarsen(adjacency, rng, rounds=3):
+    """
+    Collapses a matching of the edges of `adjacency`. Returns the coarse
+    adjacency matrix and, for every atom, the index of its coarse node.
+    """
+    n_nodes = adjacency.shape[0]
+    degree = np.diff(adjacency.indptr)
+    partner = np.full(n_nodes, -1)
+    for _ in range(rounds):
+        proposal = _propose(adjacency, partner < 0, degree, rng)
+        proposers = np.nonzero(proposal >= 0)[0]
+        mutual = proposers[proposal[proposal[proposers]] == proposers]
+        if not len(mutual):
+            break
+        partner[mutual] = proposal[mutual]
+
+    parent = np.arange(n_nodes)
+    paired = partner >= 0
+    parent[paired] = np.minimum(np.arange(n_nodes)[paired], partner[paired])
+    # Matchings make little progress on star-like graphs, such as dendrimers,
+    # so unmatched terminal atoms are merged into their neighbour.
+    leaves = np.nonzero(~paired & (degree == 1))[0]
+    parent[leaves] = parent[adjacency.indices[adjacency.indptr[leaves]]]
+    _, parent = np.unique(parent, return_inverse=True)
+    n_coarse = parent.max() + 1 if n_nodes else 0
+
+    projection = sparse.csr_matrix((np.ones(n_nodes), (np.arange(n_nodes), parent)),
+                                   shape=(n_nodes, n_coarse))
+    coarse = (projection.T @ adjacency @ projection).tolil()
+    coarse.setdiag(0)
+    coarse = coarse.tocsr()
+    coarse.eliminate_zeros()
+    coarse.data[:] = 1
+    return coarse, parent
+
+
+def _edges(adjacency):
+    upper = sparse.triu(adjacency, k=1).tocoo()
+    return upper.row, upper.col
+
+
+def refine(adjacency, pos, natural_length, iterations=50, cutoff=2.5, neighbours=8,
+           cooling=0.9, callback=None):
+    """
+    Spring-electrical refinement: bonds attract with d**2/k, and atoms within
+    `cutoff` * k of each other repel with k**2/d. Every iteration atoms move
+    at most `step`, which cools down over time. `callback` is called with the
+    positions after every iteration.
+    """
+    n_nodes = len(pos)
+    idxs, jdxs = _edges(adjacency)
+    k = natural_length
+    step = k
+    pos = pos.copy()
+    for _ in range(iterations):
+        force = np.zeros_like(pos)
+
+        delta = pos[jdxs] - pos[idxs]
+        dist = np.linalg.norm(delta, axis=1)
+        attraction = delta * (dist / k)[:, None]
+        for dim in range(2):
+            force[:, dim] += np.bincount(idxs, attraction[:, dim], minlength=n_nodes)
+            force[:, dim] -= np.bincount(jdxs, attraction[:, dim], minlength=n_nodes)
+
+        # Repulsion from at most `neighbours` atoms within the cutoff. This
+        # bounds the work per iteration, even in crowded parts of the drawing.
+        _, nearest = cKDTree(pos).query(pos, k=neighbours + 1,
+                                        distance_upper_bound=cutoff * k)
+        rows = np.repeat(np.arange(n_nodes), neighbours + 1)
+        cols = nearest.ravel()
+        valid = (cols < n_nodes) & (cols != rows)
+        rows, cols = rows[valid], cols[valid]
+        delta = pos[rows] - pos[cols]
+        sq_dist = np.maximum(np.sum(delta**2, axis=1), (1e-3 * k)**2)
+        repulsion = delta * (k**2 / sq_dist)[:, None]
+        for dim in range(2):
+            force[:, dim] += np.bincount(rows, repulsion[:, dim], minlength=n_nodes)
+
+        magnitude = np.linalg.norm(force, axis=1)
+        scale = np.divide(np.minimum(magnitude, step), magnitude,
+                          out=np.zeros_like(magnitude), where=magnitude > 0)
+        pos += force * scale[:, None]
+        step *= cooling
+        if callback is not None:
+            callback(pos)
+    return pos
+
+
+def _coarsest_layout(adjacency):
+    n_nodes = adjacency.shape[0]
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n_nodes))
+    graph.add_edges_from(zip(*_edges(adjacency)))
+    embedding = stress_layout(graph, vsepr_distances)
+    return embedding.positions[embedding.rows(range(n_nodes))]
+
+
+def multilevel_layout(graph, coarsest=50, iterations=50, finest_iterations=30, seed=0,
+                      callback=None):
+    """
+    Lays out `graph` by coarsening it until at most `coarsest` nodes remain, or
+    until coarsening stops making progress. `callback` is called with an
+    Embedding of all atoms after every refinement step; atoms that are still
+    collapsed share a position.
+    """
+    rng = np.random.default_rng(seed)
+    nodes = list(graph)
+    if not nodes:
+        return Embedding([], np.zeros((0, 2)))
+    levels = [adjacency_matrix(graph, nodes)]
+    parents = []
+    while levels[-1].shape[0] > coarsest:
+        coarse, parent = coarsen(levels[-1], rng)
+        if coarse.shape[0] > 0.9 * levels[-1].shape[0]:
+            break
+        levels.append(coarse)
+        parents.append(parent)
+
+    template = Embedding(nodes, np.zeros((len(nodes), 2)))
+    # For every level, the coarse node every atom ended up in.
+    atom_parents = [np.arange(len(nodes))]
+    for parent in parents:
+        atom_parents.append(parent[atom_parents[-1]])
+
+    def preview(level):
+        if callback is None:
+            return None
+        return lambda pos: callback(template.with_positions(pos[atom_parents[level]]))
+
+    pos = _coarsest_layout(levels[-1])
+    if callback is not None:
+        preview(len(parents))(pos)
+    # Every level is a bit finer, so the natural bond length shrinks [1]_. It
+    # is also capped by the room every atom has in the current drawing, which
+    # keeps the number of atoms within the repulsion cutoff bounded.
+    natural_length = 1
+    for level in range(len(parents) - 1, -1, -1):
+        pos = pos[parents[level]]
+        area = max(np.prod(np.ptp(pos, axis=0)), 1e-12)
+        natural_length = min(natural_length * math.sqrt(4 / 7),
+                             math.sqrt(area / len(pos)))
+        pos += rng.uniform(-0.1, 0.1, size=pos.shape) * natural_length
+        n_iter = finest_iterations if level == 0 else iterations
+        pos = refine(levels[level], pos, natural_length, iterations=n_iter,
+                     callback=preview(level))
+    return template.with_positions(pos)
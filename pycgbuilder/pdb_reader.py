@@ -0,0 +1,246 @@
+"""
+Reading a single molecule from large PDB files. vermouth's read_pdb parses
+every record of every model into a molecule, while only the first molecule
+is used. Here the file is memory mapped, records are only looked at until
+the first molecule (or the first model, when selecting chains or residues)
+is complete, and the fixed width columns of all selected atoms are parsed
+at once with NumPy. Only the CONECT records are looked for in the rest of
+the file.
+"""
+import mmap
+
+import numpy as np
+
+# Bytes of the file looked at in one go.
+CHUNK_SIZE = 1 << 24
+ATOM_RECORDS = (b'ATOM  ', b'HETATM')
+# Start and end columns of the fields of ATOM and HETATM records.
+FIELDS = {
+    'atomid': (6, 11),
+    'atomname': (12, 16),
+    'altloc': (16, 17),
+    'resname': (17, 21),
+    'chain': (21, 22),
+    'resid': (22, 26),
+    'insertion_code': (26, 27),
+    'x': (30, 38),
+    'y': (38, 46),
+    'z': (46, 54),
+    'occupancy': (54, 60),
+    'temp_factor': (60, 66),
+    'element': (76, 78),
+    'charge': (78, 80),
+}
+RECORD_WIDTH = 80
+CONECT_WIDTH = 5
+
+
+def _lines(data, start=0):
+    """
+    Yields the lines of `data` from `start`, splitting CHUNK_SIZE bytes at
+    a time.
+    """
+    while start < len(data):
+        end = data.find(b'\n', min(start + CHUNK_SIZE, len(data)) - 1)
+        end = len(data) if end < 0 else end + 1
+        yield from data[start:end].splitlines()
+        start = end
+
+
+def _atom_lines(data, exclude, first_only):
+    """
+    The ATOM and HETATM records of the first model, and the number of the
+    molecule every record is in. Molecules end at TER records after an atom
+    that is not excluded. If `first_only`, stops at the end of the first
+    molecule.
+    """
+    atoms = []
+    molecules = []
+    molecule = 0
+    n_kept = 0
+    in_model = False
+    for line in _lines(data):
+        record = line[:6]
+        if record in ATOM_RECORDS:
+            atoms.append(line)
+            molecules.append(molecule)
+            if line[16:17] in (b' ', b'', b'A') and line[17:21].strip() not in exclude:
+                n_kept += 1
+        elif record.startswith(b'MODEL'):
+            if in_model or atoms:
+                break
+            in_model = True
+        elif record.startswith(b'END'):
+            # Both END and ENDMDL
+            break
+        elif record.startswith(b'TER') and n_kept:
+            if first_only:
+                break
+            molecule += 1
+            n_kept = 0
+    return atoms, np.array(molecules, dtype=int)
+
+
+def _linked_molecules(atomids, molecules, conects):
+    """
+    The molecules joined to the first one by `conects`, directly or through
+    other molecules, given the atom ids of all atoms and their molecules.
+    """
+    rows = {}
+    for row, atomid in enumerate(atomids.tolist()):
+        rows.setdefault(atomid, row)
+    pairs = [(molecules[rows[atomid1]], molecules[rows[atomid2]])
+             for atomid1, atomid2 in conects.tolist() if atomid1 in rows and atomid2 in rows]
+    linked = {molecules[0]}
+    added = True
+    while added:
+        added = False
+        for molecule1, molecule2 in pairs:
+            if (molecule1 in linked) != (molecule2 in linked):
+                linked |= {molecule1, molecule2}
+                added = True
+    return sorted(linked)
+
+
+def _table(lines, width):
+    """
+    `lines` as a 2D array of single bytes, padded or cut to `width`.
+    """
+    joined = b''.join(line.ljust(width)[:width] for line in lines)
+    return np.frombuffer(joined, dtype='S1').reshape(len(lines), width)
+
+
+def _column(table, start, end):
+    return np.ascontiguousarray(table[:, start:end]).view('S{}'.format(end - start)).ravel()
+
+
+def _numbers(column, dtype, default=0):
+    blank = np.char.isspace(column) | (column == b'')
+    return np.where(blank, str(default).encode(), column).astype(dtype)
+
+
+def _strings(column):
+    return [value.decode().strip() for value in column.tolist()]
+
+
+def _charge(value):
+    # Charges are written as "2-" or "1+"
+    if not value:
+        return 0
+    try:
+        return float(value)
+    except ValueError:
+        return float(value[::-1])
+
+
+def _conect_records(data):
+    """
+    All CONECT records in `data`, as pairs of atom ids. They are at the end
+    of the file, so they are found with a search rather than by reading all
+    records.
+    """
+    first = data.find(b'CONECT')
+    while first > 0 and data[first - 1:first] != b'\n':
+        first = data.find(b'CONECT', first + 1)
+    if first < 0:
+        return np.zeros((0, 2), dtype=int)
+    last = data.rfind(b'\nCONECT')
+    end = data.find(b'\n', last + 1)
+    end = len(data) if end < 0 else end
+    lines = [line.rstrip() for line in data[first:end].splitlines() if line.startswith(b'CONECT')]
+    n_fields = (max(len(line) for line in lines) - 6 + CONECT_WIDTH - 1) // CONECT_WIDTH
+    if n_fields < 2:
+        return np.zeros((0, 2), dtype=int)
+    table = _table(lines, 6 + n_fields * CONECT_WIDTH)
+    ids = np.stack([_numbers(_column(table, start, start + CONECT_WIDTH), int, -1)
+                    for start in range(6, table.shape[1], CONECT_WIDTH)], axis=1)
+    pairs = np.stack([np.repeat(ids[:, 0], n_fields - 1), ids[:, 1:].ravel()], axis=1)
+    return pairs[pairs[:, 1] >= 0]
+
+
+def _parse_atoms(lines, exclude):
+    """
+    The fields of the atom records `lines` as columns, and which atoms are
+    kept: those not in residues named in `exclude`, and not in alternative
+    locations other than A.
+    """
+    table = _table(lines, RECORD_WIDTH)
+    columns = {name: _column(table, *span) for name, span in FIELDS.items()}
+    keep = np.isin(np.char.strip(columns['altloc']), [b'', b'A'])
+    keep &= ~np.isin(np.char.strip(columns['resname']), exclude)
+    return columns, keep
+
+
+def read_pdb_molecule(filename, chain=None, resids=None, exclude=('SOL',)):
+    """
+    Reads the first molecule of PDB file `filename`, with the same atom
+    attributes and CONECT bonds as ``vermouth.pdb.read_pdb(filename)[0]``.
+    Like in vermouth, the first molecule ends at a TER record, unless CONECT
+    records join it to the molecules after it. The atoms of joined molecules
+    stay in file order.
+
+    If `chain` or `resids` (the first and last residue number) are given,
+    the molecule is made of all atoms of the first model in that chain and
+    residue range instead. A `chain` of '' selects atoms without chain, and
+    None any chain. Atoms in residues named in `exclude` and
+    alternative conformations other than A are left out, like vermouth does.
+    """
+    from vermouth.molecule import Molecule
+    from vermouth.utils import first_alpha
+
+    molecule = Molecule()
+    selecting = chain is not None or resids is not None
+    with open(str(filename), 'rb') as file_in:
+        if not file_in.seek(0, 2):
+            # Empty files can not be mapped
+            return molecule
+        with mmap.mmap(file_in.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            exclude = [name.encode() for name in exclude]
+            conects = _conect_records(data)
+            lines, molecules = _atom_lines(data, exclude, first_only=not selecting)
+            if not lines:
+                return molecule
+            columns, keep = _parse_atoms(lines, exclude)
+            if not selecting:
+                # CONECT records across a TER join molecules, like in vermouth.
+                # Then the rest of the first model is needed after all.
+                kept_ids = _numbers(columns['atomid'][keep], int)
+                if (np.isin(conects, kept_ids).sum(axis=1) == 1).any():
+                    lines, molecules = _atom_lines(data, exclude, first_only=False)
+                    columns, keep = _parse_atoms(lines, exclude)
+                    linked = _linked_molecules(_numbers(columns['atomid'][keep], int),
+                                               molecules[keep], conects)
+                    keep &= np.isin(molecules, linked)
+            resid = _numbers(columns['resid'], int)
+            if chain is not None:
+                keep &= np.char.strip(columns['chain']) == chain.strip().encode()
+            if resids is not None:
+                keep &= (resid >= resids[0]) & (resid <= resids[1])
+            columns = {name: column[keep] for name, column in columns.items()}
+
+    atomids = _numbers(columns['atomid'], int)
+    positions = np.stack([_numbers(columns[axis], float) for axis in 'xyz'], axis=1) / 10
+    occupancies = _numbers(columns['occupancy'], float)
+    temp_factors = _numbers(columns['temp_factor'], float)
+    atomnames = _strings(columns['atomname'])
+    for idx, (atomid, atomname, altloc, resname, chain_, resid_, insertion_code, occupancy,
+              temp_factor, element, charge, position) in enumerate(zip(
+                  atomids.tolist(), atomnames, _strings(columns['altloc']),
+                  _strings(columns['resname']), _strings(columns['chain']),
+                  resid[keep].tolist(), _strings(columns['insertion_code']),
+                  occupancies.tolist(), temp_factors.tolist(), _strings(columns['element']),
+                  _strings(columns['charge']), positions)):
+        molecule.add_node(idx, atomid=atomid, atomname=atomname, altloc=altloc,
+                          resname=resname, chain=chain_, resid=resid_,
+                          insertion_code=insertion_code, occupancy=occupancy,
+                          temp_factor=temp_factor, element=element or first_alpha(atomname),
+                          charge=_charge(charge), position=position)
+
+    # Bonds to atoms that were not read are left out
+    rows = {atomid: idx for idx, atomid in enumerate(atomids.tolist())}
+    selected = np.isin(conects, atomids).all(axis=1)
+    for atomid1, atomid2 in conects[selected].tolist():
+        idx1, idx2 = rows[atomid1], rows[atomid2]
+        molecule.add_edge(idx1, idx2,
+                          distance=np.linalg.norm(positions[idx1] - positions[idx2]))
+    return molecule
@@ -0,0 +1,83 @@
+"""
+Layouts from existing 3D coordinates: the atoms are projected onto the plane
+in which they are most spread out, so the drawing looks like the molecule in
+a 3D viewer.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .embedding import Embedding
+
+
+def principal_plane(positions):
+    """
+    Projects the (N, 3) `positions` onto their first two principal axes.
+    """
+    positions = np.asarray(positions, dtype=float)
+    centered = positions - positions.mean(axis=0)
+    if len(positions) < 2:
+        return np.zeros((len(positions), 2))
+    # The right singular vectors are the principal axes, sorted by variance.
+    _, _, axes = np.linalg.svd(centered, full_matrices=False)
+    projected = centered @ axes[:2].T
+    if projected.shape[1] < 2:
+        projected = np.hstack([projected, np.zeros((len(projected), 2 - projected.shape[1]))])
+    return projected
+
+
+def remove_overlaps(positions, min_distance, iterations=10, seed=0):
+    """
+    Pushes apart all pairs of atoms closer than `min_distance`, `iterations`
+    times. Every iteration moves both atoms of a pair half the missing
+    distance away from each other.
+    """
+    positions = np.array(positions, dtype=float)
+    rng = np.random.default_rng(seed)
+    n_nodes = len(positions)
+    for _ in range(iterations):
+        pairs = cKDTree(positions).query_pairs(min_distance, output_type='ndarray')
+        if not len(pairs):
+            break
+        idxs, jdxs = pairs[:, 0], pairs[:, 1]
+        delta = positions[idxs] - positions[jdxs]
+        dist = np.linalg.norm(delta, axis=1)
+        # Atoms on top of each other are pushed apart in a random direction.
+        same = dist < 1e-9 * min_distance
+        angles = rng.uniform(0, 2 * np.pi, np.count_nonzero(same))
+        delta[same] = np.column_stack([np.cos(angles), np.sin(angles)])
+        dist[same] = 1
+        push = delta * ((min_distance - np.where(same, 0, dist)) / (2 * dist))[:, None]
+        for dim in range(2):
+            positions[:, dim] += np.bincount(idxs, push[:, dim], minlength=n_nodes)
+            positions[:, dim] -= np.bincount(jdxs, push[:, dim], minlength=n_nodes)
+    return positions
+
+
+def has_coordinates(graph):
+    return all(graph.nodes[node].get('position') is not None for node in graph)
+
+
+def projection_layout(graph, min_distance=0.5, overlap_iterations=10):
+    """
+    Lays out `graph` by projecting the 'position' of every atom onto the
+    principal plane of the molecule. Afterwards, atoms closer than
+    `min_distance` times the median bond length are pushed apart for at most
+    `overlap_iterations` iterations.
+    """
+    nodes = list(graph)
+    if not has_coordinates(graph):
+        raise ValueError('Not all atoms have coordinates')
+    if not nodes:
+        return Embedding([], np.zeros((0, 2)))
+    positions = np.array([graph.nodes[node]['position'] for node in nodes], dtype=float)
+    projected = principal_plane(positions.reshape(len(nodes), -1))
+    embedding = Embedding(nodes, projected)
+    if overlap_iterations and graph.number_of_edges():
+        edges = embedding.edge_rows(graph)
+        bond_length = np.median(np.linalg.norm(positions[edges[:, 0]] - positions[edges[:, 1]],
+                                               axis=1))
+        if bond_length > 0:
+            projected = remove_overlaps(projected, min_distance * bond_length,
+                                        iterations=overlap_iterations)
+            embedding = embedding.with_positions(projected)
+    return embedding
@@ -0,0 +1,236 @@
+"""
+Headless rendering of mappings to PNG or SVG, to review the mappings of a
+whole library of molecules without opening the GUI. Reads the same JSON
+manifest as :mod:`pycgbuilder.batch`, where every entry can also name the
+"layout" to draw it with (see EMBEDDINGS).
+
+Molecules are drawn with the Agg backend, without Qt, by a pool of worker
+processes. Every worker draws all its molecules on the same figure, and
+layouts come from the embedding cache when they were computed before.
+Optionally, an HTML contact sheet with all images is written as well.
+"""
+import argparse
+import html
+import json
+import os
+from pathlib import Path
+import sys
+import time
+from urllib.parse import quote
+
+import networkx as nx
+import numpy as np
+
+from .batch import (lap, new_result, output_path, parse_beads, read_entry, read_manifest,
+                    run_entries, set_failed, summarize)
+from .draw_mol import bead_colors, draw_molecule, draw_pies
+from .embed_molecule import EMBEDDINGS, compute_embedding
+from .embedding_cache import default_cache
+
+FORMATS = ('png', 'svg')
+DEFAULT_LAYOUT = 'VSEPR'
+STAGES = ('read', 'map', 'layout', 'draw', 'write', 'total')
+
+# The figure every molecule in this process is drawn on, see _init_worker.
+_FIGURE = None
+
+
+def _init_worker(size, dpi):
+    global _FIGURE
+    # Not pyplot, so that no GUI backend is ever loaded.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    _FIGURE = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(_FIGURE)
+    ax = _FIGURE.add_axes([0, 0, 1, 0.94])
+    ax.set_aspect(1)
+    ax.set_axis_off()
+    ax.autoscale(False)
+
+
+def draw_mapping(ax, molecule, embedding, mapping, atom_radius=0.45):
+    """
+    Draws `molecule` at `embedding` on `ax`, with a pie on every mapped atom
+    that has a slice for each of its beads, like MappingView. Returns the
+    artists that were added.
+    """
+    labels = nx.get_node_attributes(molecule, 'atomname')
+    artists = draw_molecule(molecule, labels=labels, pos=embedding, ax=ax)
+    rows = embedding.index
+    sizes = np.zeros((len(embedding), len(mapping)))
+    for bd_idx, atoms in enumerate(mapping):
+        sizes[[rows[atom] for atom in atoms], bd_idx] = 1
+    mapped = sizes.any(axis=1)
+    if mapped.any():
+        pies = draw_pies(ax, embedding.positions[mapped], sizes[mapped],
+                         bead_colors(len(mapping)), radius=atom_radius)
+        # Bonds go on top of the pies, as in MappingView
+        pies.set_zorder(0.5)
+        artists.append(pies)
+    if len(embedding):
+        low = embedding.positions.min(axis=0) - atom_radius
+        high = embedding.positions.max(axis=0) + atom_radius
+        ax.set_xlim(low[0], high[0])
+        ax.set_ylim(low[1], high[1])
+    return artists
+
+
+def render_entry(entry, out_dir, formats, layout=DEFAULT_LAYOUT, cache=None):
+    """
+    Reads, lays out and draws a single manifest entry, and writes the figure
+    in all `formats`. Never raises; errors are reported in the returned
+    result, like :func:`pycgbuilder.batch.build_entry`.
+    """
+    result = new_result(entry)
+    result['layout'] = entry.get('layout') or layout
+    timings = result['timings']
+    ax = _FIGURE.axes[0]
+    artists = []
+    start = tick = time.perf_counter()
+    stage = 'read'
+    try:
+        molecule = read_entry(entry)
+        tick = lap(timings, stage, tick)
+
+        stage = 'map'
+        _, _, mapping = parse_beads(molecule, entry.get('beads', []))
+        tick = lap(timings, stage, tick)
+
+        stage = 'layout'
+        # Every worker is a process already
+        embedding = compute_embedding(molecule, result['layout'], cache=cache, n_jobs=1)
+        tick = lap(timings, stage, tick)
+
+        stage = 'draw'
+        artists = draw_mapping(ax, molecule, embedding, mapping)
+        ax.set_title(result['name'])
+        tick = lap(timings, stage, tick)
+
+        stage = 'write'
+        for ext in formats:
+            path = output_path(entry, out_dir, ext)
+            _FIGURE.savefig(path, format=ext)
+            result['files'].append(path)
+        lap(timings, stage, tick)
+    except Exception as err:
+        set_failed(result, stage, err)
+    finally:
+        # Leave the figure empty for the next molecule
+        for artist in artists:
+            artist.remove()
+    timings['total'] = time.perf_counter() - start
+    return result
+
+
+def run_render(entries, out_dir, formats=('png',), layout=DEFAULT_LAYOUT, jobs=None,
+               cache=None, size=(6, 6), dpi=100, progress=None):
+    """
+    Renders all `entries` using `jobs` worker processes, each with a single
+    figure of `size` inches at `dpi`, see :func:`pycgbuilder.batch.run_entries`.
+    Layouts are looked up in and added to `cache`.
+    """
+    entries = [dict(entry, layout=entry.get('layout') or layout) for entry in entries]
+    return run_entries(render_entry, entries, out_dir, (list(formats), layout, cache), jobs,
+                       progress, fields=('layout',), initializer=_init_worker,
+                       initargs=(size, dpi))
+
+
+SHEET_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; }}
+.sheet {{ display: grid; grid-template-columns: repeat(auto-fill, minmax({width}px, 1fr)); gap: 8px; }}
+figure {{ margin: 0; padding: 4px; border: 1px solid #ccc; }}
+figure img {{ width: 100%; }}
+figcaption {{ font-size: small; overflow-wrap: anywhere; }}
+.failed {{ color: #a00; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<div class="sheet">
+{figures}
+</div>
+{failures}
+</body>
+</html>
+'''
+
+
+def write_contact_sheet(results, filename, title='Mappings', width=240):
+    """
+    Writes an HTML page showing the images of all `results` from
+    `run_render` in a grid, with the failures listed below. Images are
+    linked relative to `filename`, as URLs.
+    """
+    directory = os.path.dirname(os.path.abspath(str(filename)))
+    figures = []
+    failures = []
+    for result in results:
+        name = html.escape(str(result['name']))
+        if result['status'] != 'ok' or not result['files']:
+            failures.append('<li>{}: {}</li>'.format(name, html.escape(str(result['error']))))
+            continue
+        # Browsers show PNG thumbnails faster; link to the first file
+        files = [quote(Path(os.path.relpath(os.path.abspath(path), directory)).as_posix())
+                 for path in result['files']]
+        thumbnail = next((path for path in files if path.endswith('.png')), files[0])
+        figures.append(
+            '<figure><a href="{link}"><img src="{src}" alt="{name}" loading="lazy"></a>'
+            '<figcaption>{name} ({layout})</figcaption></figure>'.format(
+                link=html.escape(files[0]), src=html.escape(thumbnail), name=name,
+                layout=html.escape(str(result['layout'])))
+        )
+    if failures:
+        failures = '<h2 class="failed">Failed</h2>\n<ul class="failed">\n{}\n</ul>'.format(
+            '\n'.join(failures))
+    with open(str(filename), 'w') as file_out:
+        file_out.write(SHEET_TEMPLATE.format(title=html.escape(title), width=width,
+                                             figures='\n'.join(figures),
+                                             failures=failures or ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pycgbuilder-render',
+        description='Draw the mappings of a manifest of molecules to image files.'
+    )
+    parser.add_argument('manifest', help='JSON file describing the molecules and their mappings')
+    parser.add_argument('-o', '--output', default='.', help='Output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes. Defaults to the number of CPUs')
+    parser.add_argument('-f', '--formats', nargs='+', choices=FORMATS, default=['png'],
+                        help='Which image formats to write')
+    parser.add_argument('-l', '--layout', choices=list(EMBEDDINGS), default=DEFAULT_LAYOUT,
+                        help='Layout for entries that do not name one')
+    parser.add_argument('--size', type=float, nargs=2, default=(6, 6), metavar=('WIDTH', 'HEIGHT'),
+                        help='Figure size in inches')
+    parser.add_argument('--dpi', type=int, default=100, help='Resolution of PNG files')
+    parser.add_argument('--html', default=None,
+                        help='Write a contact sheet with all images to this HTML file')
+    parser.add_argument('-r', '--report', default=None,
+                        help='Write the per-molecule timings and errors to this JSON file')
+    args = parser.parse_args(argv)
+
+    entries = read_manifest(args.manifest)
+    start = time.perf_counter()
+    results = run_render(entries, args.output, args.formats, args.layout, args.jobs,
+                         cache=default_cache(), size=tuple(args.size), dpi=args.dpi)
+    wall_time = time.perf_counter() - start
+
+    summarize(results, wall_time, stages=STAGES)
+    if args.html:
+        write_contact_sheet(results, args.html,
+                            title='Mappings in {}'.format(os.path.basename(args.manifest)))
+    if args.report:
+        with open(args.report, 'w') as file_out:
+            json.dump({'wall_time': wall_time, 'results': results}, file_out, indent=2)
+    return int(any(result['status'] != 'ok' for result in results))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""
+A view of a MappingModel drawn with a QGraphicsScene instead of matplotlib.
+Every atom and bond is an item of the scene, so Qt only paints the items in
+view, and a change to the mapping or the selection only repaints the atoms
+it touches.
+"""
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+
+import numpy as np
+
+from .atom_labels import HYDROGEN_PIXELS, MIN_PIXELS
+from .draw_mol import bond_length, bond_segments
+from .mapping_widget import MappingViewBase
+
+# Scene units per unit of the embedding. The y axis of the scene points down,
+# so y is flipped going from one to the other.
+SCALE = 50
+# Zoom factor per 1/8 degree that the mouse wheel turns
+ZOOM_STEP = 1.0015
+# A full circle, in the 1/16 degrees QPainter.drawPie wants
+FULL_CIRCLE = 360 * 16
+
+
+class AtomItem(QGraphicsItem):
+    """
+    An atom: a pie with a slice for each of its `beads`, and its label on
+    top. Labels are left out when zoomed out, like AtomLabels does.
+    """
+    def __init__(self, view, label, hydrogen, label_width):
+        super().__init__()
+        self._view = view
+        self.label = label
+        self.hydrogen = hydrogen
+        self.beads = ()
+        radius = view.atom_radius * SCALE
+        self._pie = QRectF(-radius, -radius, 2 * radius, 2 * radius)
+        half_width = max(radius, label_width / 2)
+        self._bounds = QRectF(-half_width, -radius, 2 * half_width, 2 * radius)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def _draw_slice(self, painter, slice_idx):
+        n_slices = len(self.beads)
+        if n_slices == 1:
+            painter.drawEllipse(self._pie)
+            return
+        start = FULL_CIRCLE * slice_idx // n_slices
+        stop = FULL_CIRCLE * (slice_idx + 1) // n_slices
+        painter.drawPie(self._pie, start, stop - start)
+
+    def paint(self, painter, option, widget=None):
+        view = self._view
+        if view.show_mapping and self.beads:
+            painter.setPen(Qt.NoPen)
+            for slice_idx, bead in enumerate(self.beads):
+                painter.setBrush(view.bead_color(bead))
+                self._draw_slice(painter, slice_idx)
+            if view.highlighted_bead in self.beads:
+                painter.setPen(view.highlight_pen)
+                painter.setBrush(Qt.NoBrush)
+                self._draw_slice(painter, self.beads.index(view.highlighted_bead))
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        pixels = scale * SCALE * view.bond_length
+        if pixels >= MIN_PIXELS and (pixels >= HYDROGEN_PIXELS or not self.hydrogen):
+            painter.setPen(Qt.black)
+            painter.setFont(view.label_font)
+            painter.drawText(self._bounds, Qt.AlignCenter, self.label)
+
+
+class SceneMappingView(MappingViewBase, QGraphicsView):
+    """
+    Draws the molecule and the mapping of a MappingModel, like MappingView.
+    Drag to pan and use the mouse wheel to zoom. Left clicking an atom maps
+    it to the selected bead, and right clicking selects its bead.
+    """
+    # Emitted with the name and LayoutQuality of every surveyed layout, and
+    # with the name of the best layout once the survey is done.
+    layout_scored = pyqtSignal(str, object)
+    survey_done = pyqtSignal(str)
+
+    def __init__(self, parent=None, atom_radius=0.45):
+        super().__init__(parent)
+        self._init_view(atom_radius)
+        self.setScene(QGraphicsScene(self))
+        self.setRenderHint(QPainter.Antialiasing)
+        self.setBackgroundBrush(Qt.white)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.rubberBandChanged.connect(self._rubber_band_changed)
+
+        self.label_font = QFont()
+        self.label_font.setPixelSize(round(0.3 * SCALE))
+        self._bond_pen = QPen(Qt.black, 1.5)
+        self._bond_pen.setCosmetic(True)
+        self._aromatic_pen = QPen(self._bond_pen)
+        self._aromatic_pen.setStyle(Qt.DotLine)
+        self.highlight_pen = QPen(Qt.black, 1)
+        self.highlight_pen.setCosmetic(True)
+        self._lasso_pen = QPen(Qt.black, 1, Qt.DashLine)
+        self._lasso_pen.setCosmetic(True)
+
+        # What is currently drawn, see MappingView
+        self._atom_items = {}
+        self._drawn_mapping = {}
+        self._drawn_embedding = None
+        self._drawn_molecule = None
+        self._status_text = None
+        self._bead_colors = {}
+        self.bond_length = 1
+        self.highlighted_bead = -1
+        # The part of the scene kept in view when resizing, until the user
+        # zooms or pans.
+        self._fitted_rect = None
+        self._press_pos = None
+        self._rubber_band = QRectF()
+        self._lasso = None
+        self._lasso_item = None
+
+    @staticmethod
+    def _to_data(point):
+        return point.x() / SCALE, -point.y() / SCALE
+
+    def _scene_rect(self, positions, margin):
+        low = positions.min(axis=0) - margin
+        high = positions.max(axis=0) + margin
+        return QRectF(QPointF(low[0] * SCALE, -high[1] * SCALE),
+                      QPointF(high[0] * SCALE, -low[1] * SCALE))
+
+    def _fit_view(self):
+        positions = self.embedding.positions
+        if not len(positions):
+            return
+        self._fitted_rect = self._scene_rect(positions, self.atom_radius)
+        self.fitInView(self._fitted_rect, Qt.KeepAspectRatio)
+
+    def home(self):
+        """
+        Zooms out to the whole molecule.
+        """
+        self._fit_view()
+
+    def bead_color(self, bead):
+        if bead not in self._bead_colors:
+            self._bead_colors[bead] = QColor(self.model.index(bead, 0).data(Qt.DecorationRole))
+        return self._bead_colors[bead]
+
+    def redraw(self, *args):
+        """
+        Brings the scene up to date with the embedding and the mapping. Items
+        are only made again if the embedding changed, and only atoms whose
+        beads changed are repainted.
+        """
+        embedding = self.embedding
+        if not embedding and len(self.molecule):
+            self._clear_drawing()
+            self._draw_status()
+        else:
+            self._remove_status()
+            if (embedding is not self._drawn_embedding
+                    or self.molecule is not self._drawn_molecule):
+                self._clear_drawing()
+                self.draw_molecule()
+                self._drawn_embedding = embedding
+                self._drawn_molecule = self.molecule
+            self.draw_mapping()
+        self._update_highlight()
+        self.redraw_counts['performed'] += 1
+
+    def _clear_drawing(self):
+        self.scene().clear()
+        self._atom_items = {}
+        self._drawn_mapping = {}
+        self._drawn_embedding = self._drawn_molecule = None
+        self._status_text = None
+        self._bead_colors = {}
+        self._lasso = self._lasso_item = None
+
+    def _draw_status(self):
+        text = self._status_message()
+        if self._status_text is None:
+            self._status_text = self.scene().addSimpleText(text)
+            self._status_text.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        else:
+            self._status_text.setText(text)
+        self.scene().setSceneRect(self._status_text.sceneBoundingRect())
+        self.centerOn(self._status_text)
+
+    def _remove_status(self):
+        if self._status_text is not None:
+            self.scene().removeItem(self._status_text)
+            self._status_text = None
+
+    def draw_molecule(self):
+        pos = self.embedding
+        molecule = self.molecule
+        if len(pos) != len(molecule):
+            # Intermediate results can be missing atoms
+            molecule = molecule.subgraph(pos.nodes)
+        scene = self.scene()
+        self.bond_length = bond_length(molecule, pos)
+        rows = pos.edge_rows(molecule)
+        orders = np.fromiter((order or 1 for _, _, order in molecule.edges(data='order')),
+                             dtype=float, count=len(rows))
+        segments, aromatic = bond_segments(pos.positions, rows[:, 0], rows[:, 1], orders)
+        segments = segments * (SCALE, -SCALE)
+        for ((x0, y0), (x1, y1)), dotted in zip(segments.tolist(), aromatic.tolist()):
+            item = QGraphicsLineItem(x0, y0, x1, y1)
+            item.setPen(self._aromatic_pen if dotted else self._bond_pen)
+            scene.addItem(item)
+
+        metrics = QFontMetricsF(self.label_font)
+        for node, (x, y) in zip(pos.nodes, pos.positions.tolist()):
+            label = molecule.nodes[node].get('atomname', '')
+            item = AtomItem(self, label, molecule.nodes[node].get('element') == 'H',
+                            metrics.horizontalAdvance(label))
+            item.setPos(x * SCALE, -y * SCALE)
+            item.setZValue(1)
+            scene.addItem(item)
+            self._atom_items[node] = item
+        # Leave room to pan a bit past the molecule
+        if len(pos):
+            rect = self._scene_rect(pos.positions, self.atom_radius)
+            scene.setSceneRect(rect.adjusted(-rect.width() / 2, -rect.height() / 2,
+                                             rect.width() / 2, rect.height() / 2))
+
+    def draw_mapping(self, mapping=None):
+        """
+        Repaints all atoms whose beads changed since the last call.
+        """
+        mapping = mapping or self.mapping
+        items = self._atom_items
+        current = {idx: tuple(sorted(beads)) for idx, beads in mapping.items() if idx in items}
+        for idx, beads in current.items():
+            if self._drawn_mapping.get(idx) != beads:
+                items[idx].beads = beads
+                items[idx].update()
+        for idx in self._drawn_mapping:
+            if idx not in current:
+                items[idx].beads = ()
+                items[idx].update()
+        self._drawn_mapping = current
+
+    def _update_highlight(self):
+        bead = self._selected_bead()
+        if bead == self.highlighted_bead:
+            return
+        previous, self.highlighted_bead = self.highlighted_bead, bead
+        n_beads = self.model.rowCount(QModelIndex()) - 1
+        for row in (previous, bead):
+            if not 0 <= row < n_beads:
+                continue
+            for atom in self.model.bead_atoms(row):
+                if atom in self._atom_items:
+                    self._atom_items[atom].update()
+
+    def redraw_selection(self, *args):
+        """
+        Repaints the atoms of the previously and currently selected bead.
+        """
+        self._update_highlight()
+        self.redraw_counts['blitted'] += 1
+
+    def hide_mapping(self):
+        self.show_mapping = not self.show_mapping
+        self.viewport().update()
+
+    def set_selection_tool(self, name=None):
+        """
+        Makes left dragging map atoms with the 'rectangle' or 'lasso' tool,
+        or pan if `name` is None.
+        """
+        modes = {'rectangle': QGraphicsView.RubberBandDrag, 'lasso': QGraphicsView.NoDrag}
+        self.setDragMode(modes.get(name, QGraphicsView.ScrollHandDrag))
+        self.selection_tool = name
+
+    def _rubber_band_changed(self, rect, from_scene, to_scene):
+        # The rubber band is reset to an empty one when the mouse is released.
+        # The scene points can lag one mouse move behind, so map `rect`.
+        if not rect.isNull():
+            self._rubber_band = self.mapToScene(rect).boundingRect()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self._fitted_rect is not None:
+            self.fitInView(self._fitted_rect, Qt.KeepAspectRatio)
+
+    def wheelEvent(self, event):
+        factor = ZOOM_STEP ** event.angleDelta().y()
+        self.scale(factor, factor)
+        self._fitted_rect = None
+
+    def mousePressEvent(self, event):
+        self._press_pos = event.pos()
+        if self.selection_tool == 'lasso' and event.button() == Qt.LeftButton:
+            self._lasso = [self.mapToScene(event.pos())]
+            self._lasso_item = self.scene().addPath(QPainterPath(), self._lasso_pen)
+            return
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self._lasso is not None:
+            self._lasso.append(self.mapToScene(event.pos()))
+            path = QPainterPath()
+            path.addPolygon(QPolygonF(self._lasso))
+            self._lasso_item.setPath(path)
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        press, self._press_pos = self._press_pos, None
+        if self._lasso is not None:
+            vertices = [self._to_data(point) for point in self._lasso]
+            self.scene().removeItem(self._lasso_item)
+            self._lasso = self._lasso_item = None
+            self._map_atoms(self.embedding.in_polygon(vertices))
+            return
+        if self.selection_tool == 'rectangle' and event.button() == Qt.LeftButton:
+            rect, self._rubber_band = self._rubber_band, QRectF()
+            if not rect.isNull():
+                self._map_atoms(self.embedding.in_rectangle(self._to_data(rect.topLeft()),
+                                                            self._to_data(rect.bottomRight())))
+            return
+        if press is None:
+            return
+        if (event.pos() - press).manhattanLength() > QApplication.startDragDistance():
+            # Dragged the view around
+            self._fitted_rect = None
+            return
+        n_idx = self.embedding.nearest(self._to_data(self.mapToScene(event.pos())),
+                                       self.atom_radius)
+        if n_idx is None:
+            return
+        if event.button() == Qt.RightButton:
+            self._select_atom(n_idx)
+        elif event.button() == Qt.LeftButton:
+            self._map(n_idx)
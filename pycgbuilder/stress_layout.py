@@ -0,0 +1,279 @@
+"""
+Stress majorization layouts. Graph distances are computed as integer hop
+counts with scipy's BFS, and transformed to target distances in a single
+vectorized operation.
+
+Small graphs are laid out with full SMACOF on the dense distance matrix. Large
+graphs use sparse stress [1]_: every atom only feels its neighbours within a
+few bonds exactly, and the rest of the molecule through a small set of pivot
+atoms. That keeps both memory and time per iteration linear in the number of
+atoms.
+
+.. [1] M. Ortmann, M. Klimenta, U. Brandes, A Sparse Stress Model, Graph
+       Drawing and Network Visualization (2016) 18-32.
+"""
+import math
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.linalg import cho_factor, cho_solve
+from scipy.sparse import csgraph
+
+from .embedding import Embedding
+
+SQRT3 = math.sqrt(3)
+
+
+def vsepr_distances(hops):
+    """
+    Ideal distances between atoms `hops` bonds apart, assuming 120 degree
+    angles and a zigzag conformation. Negative hops mean "unreachable" and
+    become infinite.
+    """
+    hops = np.asarray(hops, dtype=float)
+    hops = np.where(hops < 0, np.inf, hops)
+    n = (hops + 1) / 2
+    with np.errstate(invalid='ignore'):
+        odd = np.sqrt(3 * n**2 - 3 * n + 1)
+        return np.where(hops % 2 == 1, odd, hops / 2 * SQRT3)
+
+
+def hop_distances(adjacency, indices=None):
+    """
+    Number of bonds between atoms as an int32 array, -1 if unreachable.
+    """
+    hops = csgraph.shortest_path(adjacency, method='D', unweighted=True, indices=indices)
+    hops[np.isinf(hops)] = -1
+    return hops.astype(np.int32)
+
+
+def adjacency_matrix(graph, nodes):
+    index = {node: row for row, node in enumerate(nodes)}
+    edges = np.array([(index[idx], index[jdx]) for idx, jdx in graph.edges if idx != jdx],
+                     dtype=int).reshape(-1, 2)
+    rows = np.concatenate([edges[:, 0], edges[:, 1]])
+    cols = np.concatenate([edges[:, 1], edges[:, 0]])
+    adjacency = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                  shape=(len(nodes), len(nodes)))
+    adjacency.sum_duplicates()
+    adjacency.data[:] = 1
+    return adjacency
+
+
+def local_pairs(adjacency, radius):
+    """
+    All ordered pairs of atoms at most `radius` bonds apart, as arrays of
+    rows, columns and hop counts.
+    """
+    n_nodes = adjacency.shape[0]
+    seen = (adjacency + sparse.identity(n_nodes, format='csr')).tocsr()
+    frontier = adjacency
+    rows, cols, hops = [], [], []
+    for hop in range(1, radius + 1):
+        coo = frontier.tocoo()
+        rows.append(coo.row)
+        cols.append(coo.col)
+        hops.append(np.full(coo.nnz, hop, dtype=np.int32))
+        if hop == radius:
+            break
+        reach = (frontier @ adjacency).tocsr()
+        reach.data[:] = 1
+        frontier = (reach - reach.multiply(seen)).tocsr()
+        frontier.eliminate_zeros()
+        seen = (seen + frontier).tocsr()
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(hops)
+
+
+def maxmin_pivots(adjacency, n_pivots, start=0):
+    """
+    Picks pivots that are spread out over the graph by repeatedly taking the
+    atom furthest away from all pivots so far. Returns the pivots and their
+    (n_pivots, N) hop distances to all atoms.
+    """
+    n_nodes = adjacency.shape[0]
+    n_pivots = min(n_pivots, n_nodes)
+    pivots = np.empty(n_pivots, dtype=int)
+    hops = np.empty((n_pivots, n_nodes), dtype=np.int32)
+    closest = np.full(n_nodes, np.iinfo(np.int32).max)
+    pivot = start
+    for p_idx in range(n_pivots):
+        pivots[p_idx] = pivot
+        hops[p_idx] = hop_distances(adjacency, indices=pivot)
+        closest = np.minimum(closest, hops[p_idx])
+        pivot = int(np.argmax(closest))
+    return pivots, hops
+
+
+def pivot_mds(pivot_dist, pivots, dim=2):
+    """
+    Classical MDS approximated from the distances between a few pivots and
+    all atoms [2]_. `pivot_dist` has shape (n_pivots, N), and `pivots` are the
+    rows of the pivots.
+
+    .. [2] U. Brandes, C. Pich, Eigensolver Methods for Progressive
+           Multidimensional Scaling of Large Data, Graph Drawing (2007) 42-53.
+    """
+    sq_dist = pivot_dist.T ** 2
+    centered = -0.5 * (sq_dist - sq_dist.mean(axis=0) - sq_dist.mean(axis=1)[:, None]
+                       + sq_dist.mean())
+    evals, evecs = np.linalg.eigh(centered.T @ centered)
+    order = np.argsort(evals)[::-1][:dim]
+    pos = centered @ evecs[:, order]
+    if pos.shape[1] < dim:
+        pos = np.hstack([pos, np.zeros((len(pos), dim - pos.shape[1]))])
+    # The projection is only correct up to a scale factor, so fit that to the
+    # pivot distances.
+    norms = np.linalg.norm(pos[pivots][:, None, :] - pos[None, :, :], axis=-1)
+    finite = np.isfinite(pivot_dist)
+    scale = np.sum(norms * pivot_dist, where=finite) / max(np.sum(norms**2, where=finite), 1e-12)
+    return pos * scale
+
+
+def _jitter(pos, seed=0):
+    # Majorization cannot leave a line once all atoms are on it, which
+    # happens for e.g. linear chains.
+    rng = np.random.default_rng(seed)
+    spread = max(np.ptp(pos, axis=0).max(), 1)
+    return pos + rng.normal(scale=1e-3 * spread, size=pos.shape)
+
+
+def smacof(dist, init, max_iter=300, tol=1e-3, callback=None):
+    """
+    Stress majorization on a dense (N, N) target distance matrix, with
+    weights d**-2. `callback` is called with the positions after every
+    iteration.
+    """
+    n_nodes = len(dist)
+    with np.errstate(divide='ignore'):
+        weights = dist ** -2.
+    weights[~np.isfinite(weights)] = 0
+    laplacian = -weights
+    laplacian[np.diag_indices(n_nodes)] = weights.sum(axis=1)
+    # The laplacian is singular, but fixing the first atom at the origin makes
+    # the rest positive definite.
+    factor = cho_factor(laplacian[1:, 1:])
+    w_dist = weights * np.where(np.isfinite(dist), dist, 0)
+
+    pos = init - init[0]
+    prev_stress = np.inf
+    for _ in range(max_iter):
+        sq_norm = np.sum(pos**2, axis=1)
+        norms = np.sqrt(np.maximum(sq_norm[:, None] + sq_norm[None, :] - 2 * pos @ pos.T, 0))
+        stress = np.sum(weights * (norms - dist)**2, where=weights > 0) / 2
+        if prev_stress - stress < tol * prev_stress:
+            break
+        prev_stress = stress
+        ratio = np.divide(w_dist, norms, out=np.zeros_like(norms), where=norms > 0)
+        b_mat = -ratio
+        b_mat[np.diag_indices(n_nodes)] = ratio.sum(axis=1)
+        new_pos = np.zeros_like(pos)
+        new_pos[1:] = cho_solve(factor, (b_mat @ pos)[1:])
+        pos = new_pos
+        if callback is not None:
+            callback(pos)
+    return pos
+
+
+def sparse_stress(idxs, jdxs, dist, weights, init, max_iter=100, tol=0.05, callback=None,
+                  movable=None):
+    """
+    Localized stress majorization over a list of terms. Every term moves atom
+    idxs[k] towards distance dist[k] from atom jdxs[k] with weight weights[k].
+    All atoms are updated at once, so every iteration is a handful of vectorized
+    operations over the terms. `callback` is called with the positions after
+    every iteration. If given, only atoms for which `movable` is True move.
+    """
+    n_nodes = len(init)
+    w_sum = np.bincount(idxs, weights, minlength=n_nodes)
+    w_sum[w_sum == 0] = 1
+    w_dist = weights * dist
+    pos = init.copy()
+    for _ in range(max_iter):
+        delta = pos[idxs] - pos[jdxs]
+        norms = np.sqrt(np.sum(delta**2, axis=1))
+        ratio = np.divide(w_dist, norms, out=np.zeros_like(norms), where=norms > 0)
+        target = weights[:, None] * pos[jdxs] + ratio[:, None] * delta
+        new_pos = np.empty_like(pos)
+        new_pos[:, 0] = np.bincount(idxs, target[:, 0], minlength=n_nodes)
+        new_pos[:, 1] = np.bincount(idxs, target[:, 1], minlength=n_nodes)
+        new_pos /= w_sum[:, None]
+        if movable is not None:
+            new_pos[~movable] = pos[~movable]
+        moved = np.mean(np.linalg.norm(new_pos - pos, axis=1))
+        pos = new_pos
+        if callback is not None:
+            callback(pos)
+        if moved < tol:
+            break
+    return pos
+
+
+def _sparse_terms(adjacency, transform, n_pivots, radius):
+    idxs, jdxs, hops = local_pairs(adjacency, radius)
+    dist = transform(hops)
+    weights = dist ** -2.
+
+    pivots, pivot_hops = maxmin_pivots(adjacency, n_pivots)
+    pivot_dist = transform(pivot_hops)
+    # Every atom belongs to the region of its closest pivot. The weight of a
+    # pivot term stands in for the part of that region that is closer to the
+    # pivot than to the atom.
+    region = np.argmin(pivot_hops, axis=0)
+    p_idxs, p_jdxs, p_dist, p_weights = [idxs], [jdxs], [dist], [weights]
+    for p_idx, pivot in enumerate(pivots):
+        members = np.sort(pivot_hops[p_idx, region == p_idx])
+        counts = np.searchsorted(members, pivot_hops[p_idx] / 2, side='right')
+        far = np.nonzero(pivot_hops[p_idx] > radius)[0]
+        p_idxs.append(far)
+        p_jdxs.append(np.full(len(far), pivot))
+        p_dist.append(pivot_dist[p_idx, far])
+        p_weights.append(counts[far] / pivot_dist[p_idx, far]**2)
+    terms = [np.concatenate(arrays) for arrays in (p_idxs, p_jdxs, p_dist, p_weights)]
+    return terms, pivots, pivot_dist
+
+
+def _layout_connected(graph, nodes, transform, dense_limit, n_pivots, radius, callback):
+    n_nodes = len(nodes)
+    if n_nodes == 1:
+        return np.zeros((1, 2))
+    adjacency = adjacency_matrix(graph, nodes)
+    if n_nodes <= dense_limit:
+        dist = transform(hop_distances(adjacency))
+        init = _jitter(pivot_mds(dist, np.arange(n_nodes)))
+        return smacof(dist, init, callback=callback)
+    terms, pivots, pivot_dist = _sparse_terms(adjacency, transform, n_pivots, radius)
+    init = _jitter(pivot_mds(pivot_dist, pivots))
+    return sparse_stress(*terms, init, callback=callback)
+
+
+def stress_layout(graph, transform=vsepr_distances, dense_limit=1000, n_pivots=32,
+                  radius=3, callback=None):
+    """
+    Lays out `graph` such that the distances between atoms match
+    `transform(hops)`. Graphs with more than `dense_limit` atoms use sparse
+    stress with `n_pivots` pivots and exact terms for atoms up to `radius`
+    bonds apart. Disconnected parts are laid out separately and put next to
+    each other. `callback` is called with an Embedding of the component being
+    laid out after every iteration.
+    """
+    pieces = []
+    offset = 0
+    components = list(nx.connected_components(graph))
+    for component in components:
+        nodes = sorted(component, key=str)
+        subgraph = graph if len(components) == 1 else graph.subgraph(nodes)
+        preview = None
+        if callback is not None:
+            template = Embedding(nodes, np.zeros((len(nodes), 2)))
+            preview = lambda pos: callback(template.with_positions(pos))
+        pos = _layout_connected(subgraph, nodes, transform, dense_limit, n_pivots, radius,
+                                preview)
+        pos = pos - pos.min(axis=0)
+        pos[:, 0] += offset
+        offset = pos[:, 0].max() + 2
+        pieces.append((nodes, pos))
+    if not pieces:
+        return Embedding([], np.zeros((0, 2)))
+    nodes = [node for piece in pieces for node in piece[0]]
+    return Embedding(nodes, np.concatenate([piece[1] for piece in pieces]))
@@ -31,9 +31,15 @@ setup(
         "gui_scripts": [
             "pycgbuilder = pycgbuilder.__main__:main"
         ],
+        "console_scripts": [
+            "pycgbuilder-batch = pycgbuilder.batch:main",
+            "pycgbuilder-render = pycgbuilder.render:main"
+        ],
     },
     include_package_data=True,
     install_requires=requirements,
+    # The package uses module __getattr__ (PEP 562) for lazy imports
+    python_requires='>=3.7',
     license="Apache Software License",
     zip_safe=False,
     keywords='pycgbuilder',
@@ -44,6 +50,10 @@ setup(
         'License :: OSI Approved :: Apache Software License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
         'Topic :: Scientific/Engineering :: Bio-Informatics',
         'Topic :: Scientific/Engineering :: Chemistry',
     ],
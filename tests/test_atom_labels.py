@@ -0,0 +1,84 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from pycgbuilder.atom_labels import AtomLabels
+
+
+@pytest.fixture
+def axes():
+    # 100 by 100 pixels, so that 1 unit is 10 pixels for limits of 0 to 10
+    figure = plt.figure(figsize=(1, 1), dpi=100)
+    axes = figure.add_axes([0, 0, 1, 1])
+    yield axes
+    plt.close(figure)
+
+
+def grid(n_side):
+    """
+    A square grid of atoms 1 apart, every other one a hydrogen.
+    """
+    pos = {(x, y): (x, y) for x in range(n_side) for y in range(n_side)}
+    labels = {node: 'H' if sum(node) % 2 else 'C' for node in pos}
+    hydrogens = [node for node, label in labels.items() if label == 'H']
+    return pos, labels, hydrogens
+
+
+def view(axes, low, high):
+    axes.set_xlim(low, high)
+    axes.set_ylim(low, high)
+
+
+def test_thresholds(axes):
+    pos, labels, hydrogens = grid(5)
+    artist = axes.add_artist(AtomLabels(pos, labels, hydrogens, min_pixels=10,
+                                        hydrogen_pixels=20))
+    # 5 pixels per bond
+    view(axes, -10, 10)
+    assert artist.visible_labels() == []
+    # 10 pixels per bond
+    view(axes, -2, 8)
+    assert set(artist.visible_labels()) == set(pos) - set(hydrogens)
+    # 20 pixels per bond
+    view(axes, -0.5, 4.5)
+    assert set(artist.visible_labels()) == set(pos)
+
+
+def test_culling(axes):
+    pos, labels, hydrogens = grid(20)
+    artist = axes.add_artist(AtomLabels(pos, labels, hydrogens, min_pixels=10,
+                                        hydrogen_pixels=10))
+    view(axes, 10, 20)
+    visible = artist.visible_labels()
+    assert set(visible) == {node for node in pos
+                            if all(9.5 <= coord <= 20.5 for coord in node)}
+
+
+def test_thinning(axes):
+    pos, labels, hydrogens = grid(20)
+    artist = axes.add_artist(AtomLabels(pos, labels, hydrogens, min_pixels=1,
+                                        hydrogen_pixels=1, max_labels=30))
+    view(axes, -0.5, 19.5)
+    visible = artist.visible_labels()
+    assert 0 < len(visible) <= 30
+    # Heavy atoms only, spread over the whole view
+    assert not set(visible) & set(hydrogens)
+    positions = np.array([pos[node] for node in visible])
+    assert positions.min(axis=0).max() < 5
+    assert positions.max(axis=0).min() > 14
+    # Everything fits again once zoomed in
+    artist.max_labels = 1000
+    assert set(artist.visible_labels()) == set(pos)
+
+
+def test_draw(axes):
+    pos, labels, hydrogens = grid(5)
+    artist = axes.add_artist(AtomLabels(pos, labels, hydrogens, min_pixels=1,
+                                        hydrogen_pixels=1, max_labels=10))
+    view(axes, -0.5, 4.5)
+    axes.figure.canvas.draw()
+    visible = artist.visible_labels()
+    assert 0 < len(visible) <= 10
+    assert set(artist._texts) == set(visible)
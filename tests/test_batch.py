@@ -0,0 +1,147 @@
+import json
+
+import pytest
+from pysmiles import read_smiles
+
+from pycgbuilder.batch import (build_entry, file_stem, main, parse_beads, read_manifest,
+                               run_batch, unique_stems)
+from pycgbuilder.molecule import set_default_atomnames
+
+ETHANOL_PDB = '''\
+ATOM      1  C1  ETH A   1       0.000   0.000   0.000  1.00  0.00           C
+ATOM      2  C2  ETH A   1       1.520   0.000   0.000  1.00  0.00           C
+ATOM      3  O   ETH A   1       2.030   1.350   0.000  1.00  0.00           O
+END
+'''
+
+
+def entry(index, name=None, **kwargs):
+    return dict(kwargs, index=index, name=name)
+
+
+def ethanol():
+    molecule = read_smiles('CCO')
+    set_default_atomnames(molecule)
+    return molecule
+
+
+def test_read_manifest(tmp_path):
+    (tmp_path / 'mols').mkdir()
+    manifest = tmp_path / 'mols' / 'manifest.json'
+    manifest.write_text(json.dumps({'molecules': [
+        {'smiles': 'CCO'},
+        {'name': 'eth', 'pdb': 'ethanol.pdb', 'index': 7},
+    ]}))
+    entries = read_manifest(manifest)
+    assert entries[0] == {'smiles': 'CCO', 'name': None, 'index': 0}
+    # PDB files are relative to the manifest
+    assert entries[1] == {'name': 'eth', 'pdb': str(tmp_path / 'mols' / 'ethanol.pdb'),
+                          'index': 7}
+    manifest.write_text(json.dumps([{'smiles': 'C'}]))
+    assert read_manifest(manifest) == [{'smiles': 'C', 'name': None, 'index': 0}]
+
+
+def test_parse_beads():
+    beads = [
+        {'name': 'A', 'type': 'P1', 'atoms': ['C0', 'C1']},
+        {'atoms': 'O2 C1'},
+        {'atoms': [2]},
+    ]
+    names, types, mapping = parse_beads(ethanol(), beads)
+    assert names == ['A', 'BD1', 'BD2']
+    assert types == ['P1', '__', '__']
+    assert mapping == [[0, 1], [1, 2], [2]]
+
+
+@pytest.mark.parametrize('atoms, error', [
+    (['N0'], KeyError),
+    ([5], KeyError),
+])
+def test_parse_beads_errors(atoms, error):
+    with pytest.raises(error):
+        parse_beads(ethanol(), [{'atoms': atoms}])
+
+
+def test_parse_beads_ambiguous():
+    molecule = ethanol()
+    molecule.nodes[1]['atomname'] = 'C0'
+    with pytest.raises(ValueError):
+        parse_beads(molecule, [{'atoms': ['C0']}])
+
+
+@pytest.mark.parametrize('name, stem', [
+    ('ethanol', 'ethanol'),
+    ('C/C=C/C', 'C_C=C_C'),
+    ('a:b*?', 'a_b__'),
+    (' .hidden. ', 'hidden'),
+    ('', 'molecule'),
+    (None, 'molecule'),
+])
+def test_file_stem(name, stem):
+    assert file_stem(name) == stem
+
+
+def test_unique_stems():
+    entries = [entry(0, 'a'), entry(1, 'a'), entry(2, 'a_1'), entry(3, 'B'), entry(4, 'b'),
+               entry(5, smiles='CCO'), entry(6, pdb='/some/where/CCO.pdb')]
+    stems = unique_stems(entries)
+    assert stems == ['a_0', 'a_2', 'a_1', 'B_3', 'b_4', 'CCO_5', 'CCO_6']
+    assert len({stem.lower() for stem in stems}) == len(stems)
+
+
+def test_build_entry(tmp_path):
+    result = build_entry(entry(0, smiles='CCO', beads=[{'atoms': 'C0 C1'}, {'atoms': 'O2'}]),
+                         tmp_path, ['itp', 'map', 'pdb'])
+    assert result['status'] == 'ok', result['error']
+    assert result['name'] == 'CCO'
+    # SMILES have no coordinates
+    assert result['skipped'] == ['pdb']
+    assert sorted(result['files']) == [str(tmp_path / 'CCO.itp'), str(tmp_path / 'CCO.map')]
+    assert all((tmp_path / name).exists() for name in ('CCO.itp', 'CCO.map'))
+    assert set(result['timings']) == {'read', 'map', 'write', 'total'}
+
+
+def test_build_entry_pdb(tmp_path):
+    pdb = tmp_path / 'ethanol.pdb'
+    pdb.write_text(ETHANOL_PDB)
+    result = build_entry(entry(0, pdb=str(pdb), beads=[{'atoms': 'C1 C2 O'}]), tmp_path,
+                         ['pdb'])
+    assert result['status'] == 'ok', result['error']
+    assert result['files'] == [str(tmp_path / 'ethanol.pdb')]
+
+
+def test_build_entry_failed(tmp_path):
+    result = build_entry(entry(3, 'bad', smiles='CCO', beads=[{'atoms': ['X9']}]),
+                         tmp_path, ['itp'])
+    assert result['status'] == 'failed'
+    assert result['error'].startswith('map: KeyError')
+    assert result['files'] == []
+    assert not list(tmp_path.iterdir())
+
+
+def test_run_batch(tmp_path):
+    beads = [{'atoms': 'C0 C1'}]
+    entries = [entry(0, 'eth', smiles='CCO', beads=beads),
+               entry(1, 'eth', smiles='CCC', beads=beads),
+               entry(2, 'eth_1', smiles='CCN', beads=beads),
+               entry(3, smiles='C/C=C/C', beads=beads),
+               entry(4, smiles='CCO', beads=[{'atoms': 'X'}])]
+    seen = []
+    results = run_batch(entries, tmp_path / 'out', ['itp'], jobs=1, progress=seen.append)
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+    assert len(seen) == 5
+    assert [result['status'] for result in results] == ['ok'] * 4 + ['failed']
+    files = [result['files'] for result in results[:4]]
+    assert files == [[str(tmp_path / 'out' / name)]
+                     for name in ('eth_0.itp', 'eth_2.itp', 'eth_1.itp', 'C_C=C_C.itp')]
+    assert len(list((tmp_path / 'out').iterdir())) == 4
+
+
+def test_main(tmp_path, capsys):
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps([{'smiles': 'CCO', 'beads': [{'atoms': 'C0 C1 O2'}]}]))
+    report = tmp_path / 'report.json'
+    assert main([str(manifest), '-o', str(tmp_path), '-j', '1', '-f', 'itp',
+                 '-r', str(report)]) == 0
+    assert 'Built 1 of 1 molecules' in capsys.readouterr().out
+    assert json.loads(report.read_text())['results'][0]['files'] == [str(tmp_path / 'CCO.itp')]
@@ -0,0 +1,93 @@
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+from vermouth.molecule import Molecule
+from vermouth.processors import MakeBonds
+from vermouth.system import System
+
+from pycgbuilder.bonds import close_pairs, guess_bonds
+
+# MakeBonds mixes up positions once atoms of unknown elements are left out,
+# so only elements it knows are compared.
+ELEMENTS = ['C', 'H', 'H', 'O', 'N', 'S', 'P']
+
+
+def random_molecule(n_atoms, density, seed, elements=ELEMENTS):
+    """
+    `n_atoms` random atoms in 5 residues, at `density` atoms per nm^3.
+    """
+    rng = np.random.default_rng(seed)
+    side = (n_atoms / density) ** (1 / 3)
+    molecule = Molecule()
+    for idx in range(n_atoms):
+        molecule.add_node(idx, element=elements[rng.integers(len(elements))],
+                          position=rng.random(3) * side, resid=int(rng.integers(5)),
+                          resname='RES', chain='A', insertion_code='')
+    return molecule
+
+
+def make_bonds(molecule):
+    system = System()
+    system.add_molecule(molecule)
+    MakeBonds(allow_name=False).run_system(system)
+    return nx.union_all(system.molecules)
+
+
+def bonds(molecule):
+    return {frozenset((idx, jdx)): distance
+            for idx, jdx, distance in molecule.edges(data='distance')}
+
+
+@pytest.mark.parametrize('n_points, cutoff', [
+    (0, 1), (1, 1), (2, 5), (500, 0.1), (2000, 0.07), (300, 10),
+])
+def test_close_pairs(n_points, cutoff):
+    rng = np.random.default_rng(n_points)
+    positions = rng.random((n_points, 3)) * [1, 2, 0.5]
+    rows1, rows2, distances = close_pairs(positions, cutoff)
+    expected = cKDTree(positions).query_pairs(cutoff) if n_points else set()
+    assert set(zip(rows1.tolist(), rows2.tolist())) == expected
+    assert np.all(rows1 < rows2)
+    assert np.allclose(distances, np.linalg.norm(positions[rows1] - positions[rows2], axis=1))
+
+
+@pytest.mark.parametrize('n_atoms, density, elements', [
+    (200, 100, ELEMENTS),
+    (2000, 100, ELEMENTS),
+    (1000, 30, ['C', 'H']),
+    (50, 1000, ELEMENTS),
+])
+def test_guess_bonds(n_atoms, density, elements):
+    molecule = random_molecule(n_atoms, density, n_atoms, elements)
+    expected = bonds(make_bonds(molecule.copy()))
+    guess_bonds(molecule)
+    found = bonds(molecule)
+    assert expected
+    assert set(found) == set(expected)
+    for bond, distance in expected.items():
+        assert found[bond] == pytest.approx(distance)
+
+
+def test_guess_bonds_rules():
+    molecule = Molecule()
+    positions = {'C': [0, 0, 0], 'H': [0.1, 0, 0], 'Xx': [0, 0.1, 0]}
+    for idx, (element, position) in enumerate(positions.items()):
+        molecule.add_node(idx, element=element, position=np.array(position, dtype=float),
+                          resid=1, resname='RES', chain='A', insertion_code='')
+    # A hydrogen in another residue, and one on top of the first
+    molecule.add_node(3, element='H', position=np.array([-0.1, 0, 0]), resid=2,
+                      resname='RES', chain='A', insertion_code='')
+    molecule.add_node(4, element='H', position=np.array([0.12, 0, 0]), resid=1,
+                      resname='RES', chain='A', insertion_code='')
+    guess_bonds(molecule)
+    # Atoms of unknown elements and hydrogens in other residues get no bonds,
+    # and hydrogens are not bonded to each other.
+    assert set(map(frozenset, molecule.edges)) == {frozenset((0, 1)), frozenset((0, 4))}
+
+
+def test_guess_bonds_keeps_edges():
+    molecule = random_molecule(100, 100, 0)
+    molecule.add_edge(0, 1, distance=42)
+    guess_bonds(molecule)
+    assert molecule.edges[0, 1]['distance'] == 42
@@ -0,0 +1,78 @@
+import math
+
+import numpy as np
+import pytest
+
+from pycgbuilder.draw_mol import bond_segments, make_edge
+
+
+def rot(x, y, theta):
+    return x*math.cos(theta) - y*math.sin(theta), x*math.sin(theta) + y*math.cos(theta)
+
+
+def reference_edge(p0, p1, order, spacing=0.1, sep=0.2):
+    """
+    The bond segments as draw_molecule made them before `bond_segments`,
+    one bond and one line at a time.
+    """
+    x0, y0 = p0
+    x1, y1 = p1
+    bond_length = math.sqrt((x0 - x1)**2 + (y0-y1)**2)
+    sep = min(sep * bond_length, sep)
+    x0p = sep
+    x1p = bond_length - sep
+    theta = math.atan2((y1 - y0), (x1 - x0))
+    out = []
+    for f in range(order):
+        y0p = y1p = spacing * ((1-order)/2 + f)
+        x0pp, y0pp = rot(x0p, y0p, theta)
+        x1pp, y1pp = rot(x1p, y1p, theta)
+        out.append([[x0pp + x0, y0pp + y0], [x1pp + x0, y1pp + y0]])
+    return out
+
+
+def random_bonds(n_atoms=20, n_bonds=40, seed=0):
+    rng = np.random.default_rng(seed)
+    # Both long bonds and bonds shorter than 1
+    positions = rng.random((n_atoms, 2)) * 3
+    starts = rng.integers(n_atoms, size=n_bonds)
+    ends = (starts + rng.integers(1, n_atoms, size=n_bonds)) % n_atoms
+    return positions, starts, ends
+
+
+@pytest.mark.parametrize('order', [1, 2, 3])
+def test_same_as_reference(order):
+    positions, starts, ends = random_bonds()
+    segments, dotted = bond_segments(positions, starts, ends, np.full(len(starts), order))
+    expected = [segment for start, end in zip(starts, ends)
+                for segment in reference_edge(positions[start], positions[end], order)]
+    assert segments.shape == (len(starts) * order, 2, 2)
+    assert np.allclose(segments, expected)
+    assert not dotted.any()
+
+
+def test_mixed_orders():
+    positions, starts, ends = random_bonds(seed=1)
+    orders = np.random.default_rng(1).choice([1, 1.5, 2, 3], size=len(starts))
+    segments, dotted = bond_segments(positions, starts, ends, orders, spacing=0.05, sep=0.3)
+    expected = []
+    expected_dotted = []
+    for start, end, order in zip(starts, ends, orders):
+        lines = reference_edge(positions[start], positions[end], 2 if order == 1.5 else int(order),
+                               spacing=0.05, sep=0.3)
+        expected.extend(lines)
+        # Aromatic bonds are a dotted and a full line
+        expected_dotted.extend([order == 1.5] + [False] * (len(lines) - 1))
+    assert np.allclose(segments, expected)
+    assert dotted.tolist() == expected_dotted
+
+
+def test_make_edge():
+    assert np.allclose(make_edge((0, 0), (1, 1), 2), reference_edge((0, 0), (1, 1), 2))
+    assert np.allclose(make_edge((0, 0), (0, 0.5), 1), [[[0, 0.1], [0, 0.4]]])
+
+
+def test_no_bonds():
+    segments, dotted = bond_segments(np.zeros((3, 2)), [], [], [])
+    assert segments.shape == (0, 2, 2)
+    assert not len(dotted)
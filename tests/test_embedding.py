@@ -0,0 +1,37 @@
+import numpy as np
+
+from pycgbuilder.embedding import Embedding
+
+
+def grid():
+    nodes = ['a{}'.format(idx) for idx in range(25)]
+    positions = np.stack(np.meshgrid(np.arange(5), np.arange(5), indexing='ij'),
+                         axis=-1).reshape(-1, 2)
+    return Embedding(nodes, positions)
+
+
+def test_rows_in_box():
+    embedding = grid()
+    rows = embedding.rows_in_box((0.5, -1), (2, 1))
+    assert rows.tolist() == [5, 6, 10, 11]
+    assert embedding.rows_in_box((10, 10), (11, 11)).tolist() == []
+    assert Embedding([], np.zeros((0, 2))).rows_in_box((0, 0), (1, 1)).tolist() == []
+
+
+def test_in_rectangle():
+    embedding = grid()
+    # Corners can be given in any order
+    assert embedding.in_rectangle((2, 1), (0.5, -1)) == ['a5', 'a6', 'a10', 'a11']
+
+
+def test_in_polygon():
+    embedding = grid()
+    triangle = [(-0.5, -0.5), (3, -0.5), (-0.5, 3)]
+    assert embedding.in_polygon(triangle) == ['a0', 'a1', 'a2', 'a5', 'a6', 'a10']
+    assert embedding.in_polygon(triangle[:2]) == []
+
+
+def test_nearest():
+    embedding = grid()
+    assert embedding.nearest((3.1, 0.9)) == 'a16'
+    assert embedding.nearest((10, 10), max_distance=1) is None
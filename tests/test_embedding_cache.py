@@ -0,0 +1,136 @@
+import os
+
+import networkx as nx
+import numpy as np
+
+from pycgbuilder.embedding import Embedding
+from pycgbuilder.embedding_cache import (EmbeddingCache, canonical_order, default_cache,
+                                         graph_hash)
+
+
+def molecule(n_atoms=10):
+    graph = nx.path_graph(n_atoms)
+    nx.set_node_attributes(graph, 'C', 'element')
+    return graph
+
+
+def embedding_of(graph, seed=0):
+    rng = np.random.default_rng(seed)
+    return Embedding(list(graph), rng.random((len(graph), 2)))
+
+
+def test_graph_hash_order():
+    graph = molecule()
+    shuffled = nx.Graph()
+    shuffled.add_nodes_from(reversed(list(graph.nodes(data=True))))
+    shuffled.add_edges_from((jdx, idx) for idx, jdx in reversed(list(graph.edges)))
+    assert graph_hash(graph) == graph_hash(shuffled)
+    graph.nodes[0]['element'] = 'O'
+    assert graph_hash(graph) != graph_hash(shuffled)
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    graph = molecule()
+    embedding = embedding_of(graph)
+    assert cache.get(graph, 'VSEPR') is None
+    cache.put(graph, 'VSEPR', embedding)
+    cached = cache.get(graph, 'VSEPR')
+    assert set(cached) == set(graph)
+    for node in graph:
+        assert np.allclose(cached[node], embedding[node], atol=1e-6)
+    # Layouts and parameters have their own entries
+    assert cache.get(graph, 'Multilevel') is None
+    assert cache.get(graph, 'VSEPR', {'seed': 1}) is None
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_renumbered(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    graph = molecule()
+    graph.add_edge(2, 10, order=2)
+    graph.nodes[10]['element'] = 'O'
+    embedding = embedding_of(graph)
+    cache.put(graph, 'VSEPR', embedding)
+    mapping = {node: 'atom{}'.format(len(graph) - node) for node in graph}
+    renumbered = nx.relabel_nodes(graph, mapping)
+    cached = cache.get(renumbered, 'VSEPR')
+    assert cached is not None
+    for node, new_node in mapping.items():
+        assert np.allclose(cached[new_node], embedding[node], atol=1e-6)
+    renumbered.edges['atom9', 'atom1']['order'] = 1
+    assert cache.get(renumbered, 'VSEPR') is None
+
+
+def test_canonical_order_symmetric():
+    # Every atom of a ring looks the same until one of them is picked
+    ring = nx.cycle_graph(6)
+    nx.set_node_attributes(ring, 'C', 'element')
+    order = canonical_order(ring)
+    assert sorted(order) == list(ring)
+    rows = {node: row for row, node in enumerate(order)}
+    shuffled = nx.relabel_nodes(ring, {node: (node * 5) % 6 for node in ring})
+    shuffled_rows = {node: row for row, node in enumerate(canonical_order(shuffled))}
+    assert ({frozenset((rows[idx], rows[jdx])) for idx, jdx in ring.edges} ==
+            {frozenset((shuffled_rows[idx], shuffled_rows[jdx])) for idx, jdx in shuffled.edges})
+
+
+def test_corrupt_file(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    graph = molecule()
+    cache.put(graph, 'VSEPR', embedding_of(graph))
+    path, = tmp_path.glob('*.npz')
+    path.write_bytes(b'not an npz file')
+    assert cache.get(graph, 'VSEPR') is None
+
+
+def test_failed_write(tmp_path, monkeypatch):
+    cache = EmbeddingCache(tmp_path)
+    graph = molecule()
+
+    def full_disk(*args, **kwargs):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(np, 'savez_compressed', full_disk)
+    cache.put(graph, 'VSEPR', embedding_of(graph))
+    assert not list(tmp_path.iterdir())
+
+
+def test_eviction(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    graphs = [molecule(n_atoms) for n_atoms in (100, 101, 102)]
+    for graph in graphs:
+        cache.put(graph, 'VSEPR', embedding_of(graph))
+    paths = {path: path.stat().st_size for path in tmp_path.glob('*.npz')}
+    assert len(paths) == 3
+    # Give the files distinct ages, oldest first
+    for age, graph in enumerate(reversed(graphs)):
+        path = cache._path(cache.key(graph, 'VSEPR'))
+        os.utime(str(path), (1e9 - age * 100, 1e9 - age * 100))
+    # Reading the oldest makes it the most recently used
+    assert cache.get(graphs[0], 'VSEPR') is not None
+
+    cache.max_bytes = sum(paths.values()) - 1
+    cache.evict()
+    assert cache.get(graphs[0], 'VSEPR') is not None
+    assert cache.get(graphs[1], 'VSEPR') is None
+    assert cache.get(graphs[2], 'VSEPR') is not None
+    assert sum(path.stat().st_size for path in tmp_path.glob('*.npz')) <= cache.max_bytes
+
+
+def test_clear(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    graph = molecule()
+    cache.put(graph, 'VSEPR', embedding_of(graph))
+    cache.clear()
+    assert cache.get(graph, 'VSEPR') is None
+
+
+def test_default_cache_off(monkeypatch):
+    monkeypatch.setenv('PYCGBUILDER_CACHE', 'Off')
+    assert default_cache() is None
+
+
+def test_default_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv('PYCGBUILDER_CACHE', str(tmp_path))
+    assert default_cache().directory == tmp_path
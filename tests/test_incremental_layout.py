@@ -0,0 +1,84 @@
+import networkx as nx
+import numpy as np
+import pytest
+from pysmiles import add_explicit_hydrogens, read_smiles
+
+from pycgbuilder.embed_molecule import compute_embedding, warm_start_embedding
+from pycgbuilder.incremental_layout import (match_nodes, matched_fraction, place_new_atoms,
+                                            warm_start_layout)
+from pycgbuilder.stress_layout import stress_layout
+
+ETHANOL = 'CCO'
+ANTHRACENE = 'c1ccc2cc3ccccc3cc2c1'
+
+
+@pytest.fixture
+def ethanol():
+    molecule = read_smiles(ETHANOL)
+    return molecule, compute_embedding(molecule, 'VSEPR')
+
+
+def test_match_nodes():
+    old = nx.path_graph(4)
+    nx.set_node_attributes(old, 'C', 'element')
+    new = old.copy()
+    new.nodes[3]['element'] = 'O'
+    assert match_nodes(old, new) == {0, 1, 2}
+    # Moving the bond of 3 also changes the bonds of 0 and 2
+    new = old.copy()
+    new.remove_edge(2, 3)
+    new.add_edge(0, 3)
+    assert match_nodes(old, new) == {1}
+
+
+def test_unrelated_molecule(ethanol):
+    # A small molecule followed by an unrelated, larger one should not be
+    # laid out on top of the few atoms they happen to share.
+    molecule, embedding = ethanol
+    anthracene = read_smiles(ANTHRACENE)
+    assert matched_fraction(molecule, anthracene) < 0.5
+    assert warm_start_embedding(anthracene, 'VSEPR', molecule, embedding) is None
+
+
+def test_add_hydrogens(ethanol):
+    molecule, embedding = ethanol
+    with_hydrogens = molecule.copy()
+    add_explicit_hydrogens(with_hydrogens)
+    assert matched_fraction(molecule, with_hydrogens) == 1
+    warm = warm_start_embedding(with_hydrogens, 'VSEPR', molecule, embedding)
+    assert set(warm) == set(with_hydrogens)
+    for node in molecule:
+        assert np.allclose(warm[node], embedding[node])
+
+
+def test_remove_hydrogens():
+    molecule = read_smiles(ETHANOL)
+    add_explicit_hydrogens(molecule)
+    embedding = compute_embedding(molecule, 'VSEPR')
+    heavy = molecule.subgraph([node for node in molecule
+                               if molecule.nodes[node]['element'] != 'H']).copy()
+    warm = warm_start_embedding(heavy, 'VSEPR', molecule, embedding)
+    assert set(warm) == set(heavy)
+    for node in heavy:
+        assert np.allclose(warm[node], embedding[node])
+
+
+def test_place_new_atoms():
+    graph = nx.star_graph(3)
+    placed = place_new_atoms(graph, {0: np.zeros(2), 1: np.array([1., 0])})
+    assert set(placed) == set(graph)
+    for node in (2, 3):
+        assert np.linalg.norm(placed[node]) == pytest.approx(1)
+    assert np.linalg.norm(placed[2] - placed[3]) > 1
+
+
+def test_new_fragment(ethanol):
+    molecule, embedding = ethanol
+    graph = nx.disjoint_union(molecule, read_smiles('CC'))
+    # The new fragment needs a full layout
+    assert warm_start_layout(graph, molecule, embedding) is None
+    warm = warm_start_layout(graph, molecule, embedding, layout_func=stress_layout)
+    assert set(warm) == set(graph)
+    new_rows = warm.rows([3, 4])
+    old_rows = warm.rows(list(molecule))
+    assert warm.positions[new_rows, 0].min() > warm.positions[old_rows, 0].max()
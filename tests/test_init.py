@@ -0,0 +1,18 @@
+import subprocess
+import sys
+
+import pycgbuilder
+
+
+def test_lazy_attributes():
+    assert set(pycgbuilder.__all__) <= set(dir(pycgbuilder))
+    for name in pycgbuilder.__all__:
+        assert getattr(pycgbuilder, name) is not None
+
+
+def test_no_qt_for_core():
+    # Using the writers should not load the GUI libraries
+    code = ('import sys, pycgbuilder; pycgbuilder.make_cg_mol; '
+            'print("PyQt5" in sys.modules, "matplotlib.pyplot" in sys.modules)')
+    output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+    assert output.split() == ['False', 'False']
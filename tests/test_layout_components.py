@@ -0,0 +1,31 @@
+import networkx as nx
+import pytest
+
+from pycgbuilder.embed_molecule import LayoutCancelled, layout_components
+from pycgbuilder.stress_layout import stress_layout
+
+
+def molecules(sizes):
+    graph = nx.Graph()
+    for size in sizes:
+        graph = nx.disjoint_union(graph, nx.path_graph(size))
+    return graph
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_layout_components(n_jobs):
+    # Identical components are laid out once, and copied
+    graph = molecules([10, 20, 20, 30])
+    embedding = layout_components(graph, stress_layout, n_jobs=n_jobs, parallel_threshold=0)
+    assert set(embedding) == set(graph)
+
+
+def test_layout_components_cancel():
+    graph = molecules([100, 200, 300])
+
+    def cancel(embedding):
+        raise LayoutCancelled
+
+    with pytest.raises(LayoutCancelled):
+        layout_components(graph, stress_layout, n_jobs=2, parallel_threshold=0,
+                          callback=cancel)
@@ -0,0 +1,72 @@
+import networkx as nx
+from PyQt5.QtCore import QCoreApplication, Qt
+import pytest
+
+from pycgbuilder.mapping_widget import MappingModel
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def model(app):
+    molecule = nx.path_graph(6)
+    for idx in molecule:
+        molecule.nodes[idx]['atomname'] = 'C{}'.format(idx + 1)
+    model = MappingModel(molecule, mapping=[[0, 1], [1, 2]], names=['A', 'B'], types=['P1', 'P2'])
+    model.changes = []
+    model.dataChanged.connect(
+        lambda first, last, roles: model.changes.append((first.row(), first.column(),
+                                                         last.row(), last.column(), roles)))
+    return model
+
+
+def test_add(model):
+    model.map_atoms(0, [1, 3, 4])
+    assert model.mapping == [[0, 1, 3, 4], [1, 2]]
+    assert model.atom_beads(3) == [0]
+    assert model.atom_beads(1) == [0, 1]
+    assert model.data(model.index(0, 2), Qt.DisplayRole) == 'C1 C2 C4 C5'
+    assert model.changes == [(0, 2, 0, 2, [Qt.UserRole])]
+
+
+def test_remove(model):
+    model.map_atoms(1, [1, 2, 5], mode='remove')
+    assert model.mapping == [[0, 1], []]
+    assert model.atom_beads(1) == [0]
+    assert model.atom_beads(2) == []
+    assert 2 not in model.reverse_mapping
+    assert model.data(model.index(1, 2), Qt.DisplayRole) == ''
+    assert model.changes == [(1, 2, 1, 2, [Qt.UserRole])]
+
+
+def test_toggle(model):
+    model.map_atoms(0, [0, 2], mode='toggle')
+    assert model.mapping == [[1, 2], [1, 2]]
+    assert model.atom_beads(0) == []
+    assert model.atom_beads(2) == [0, 1]
+    model.map_atoms(0, [0, 2], mode='toggle')
+    assert model.mapping == [[0, 1], [1, 2]]
+    assert len(model.changes) == 2
+
+
+def test_new_bead(model):
+    model.map_atoms(2, [4, 5])
+    assert model.mapping == [[0, 1], [1, 2], [4, 5]]
+    assert model.names[2] == 'BD2'
+    assert model.rowCount(None) == 4
+    assert model.changes == [(2, 2, 2, 2, [Qt.UserRole])]
+    # Nothing to remove from a bead that does not exist yet
+    model.map_atoms(3, [0], mode='remove')
+    assert len(model.mapping) == 3
+    assert len(model.changes) == 1
+
+
+def test_nothing_to_map(model):
+    model.map_atoms(0, [])
+    assert model.changes == []
+    with pytest.raises(ValueError):
+        model.map_atoms(0, [1], mode='replace')
+    assert model.mapping == [[0, 1], [1, 2]]
@@ -0,0 +1,101 @@
+import random
+
+import networkx as nx
+import pytest
+from pysmiles import add_explicit_hydrogens, read_smiles
+
+from pycgbuilder.matching import (MatchCancelled, MatchTimeout, NotIsomorphic,
+                                  find_isomorphism)
+
+MOLECULES = {
+    'benzene': 'c1ccccc1',
+    'glucose': 'OC[C@H]1OC(O)[C@H](O)[C@@H](O)[C@@H]1O',
+    'POPC': 'CCCCCCCCC=CCCCCCCCC(=O)OCC(COP(=O)([O-])OCC[N+](C)(C)C)OC(=O)CCCCCCCCCCCCCCC',
+    'C60': 'c12c3c4c5c1c6c7c8c2c9c1c3c2c3c4c4c%10c5c5c6c6c7c7c%11c8c9c8c9c1c2c1c2c3c3c4c4'
+           'c%10c5c5c6c6c7c7c%11c8c8c9c1c1c2c3c2c4c5c6c3c7c8c1c23',
+    'PEG': 'O' + 'CCO' * 100,
+}
+
+
+def shuffled(graph, seed=0):
+    """
+    A copy of `graph` with renamed atoms, added in random order.
+    """
+    rng = random.Random(seed)
+    nodes = list(graph)
+    rng.shuffle(nodes)
+    names = {node: 'a{}'.format(idx) for idx, node in enumerate(graph)}
+    copy = nx.Graph()
+    copy.add_nodes_from((names[node], graph.nodes[node]) for node in nodes)
+    edges = list(graph.edges)
+    rng.shuffle(edges)
+    copy.add_edges_from((names[idx], names[jdx]) for idx, jdx in edges)
+    return copy
+
+
+def assert_isomorphism(graph1, graph2, mapping):
+    assert set(mapping) == set(graph1)
+    assert set(mapping.values()) == set(graph2)
+    for node in graph1:
+        assert graph1.nodes[node]['element'] == graph2.nodes[mapping[node]]['element']
+    for idx, jdx in graph1.edges:
+        assert graph2.has_edge(mapping[idx], mapping[jdx])
+
+
+@pytest.mark.parametrize('name', MOLECULES)
+@pytest.mark.parametrize('hydrogens', [False, True])
+def test_find_isomorphism(name, hydrogens):
+    molecule = read_smiles(MOLECULES[name])
+    if hydrogens:
+        add_explicit_hydrogens(molecule)
+    pdb_mol = shuffled(molecule)
+    assert_isomorphism(pdb_mol, molecule, find_isomorphism(pdb_mol, molecule))
+
+
+def test_find_isomorphism_empty():
+    assert find_isomorphism(nx.Graph(), nx.Graph()) == {}
+
+
+@pytest.mark.parametrize('smiles1, smiles2', [
+    # Different number of atoms
+    ('CCCCO', 'CCCO'),
+    # Same atoms, different bonds
+    ('CCCCO', 'CCC(C)O'),
+    ('CCCCO', 'CCCOC'),
+])
+def test_not_isomorphic(smiles1, smiles2):
+    with pytest.raises(NotIsomorphic):
+        find_isomorphism(shuffled(read_smiles(smiles1)), read_smiles(smiles2))
+
+
+def test_not_isomorphic_same_colours():
+    # Colour refinement can not tell these apart; only the search can.
+    hexagon = nx.cycle_graph(6)
+    triangles = nx.disjoint_union(nx.cycle_graph(3), nx.cycle_graph(3))
+    for graph in (hexagon, triangles):
+        nx.set_node_attributes(graph, 'C', 'element')
+    with pytest.raises(NotIsomorphic):
+        find_isomorphism(hexagon, triangles)
+    copy = shuffled(triangles)
+    assert_isomorphism(copy, triangles, find_isomorphism(copy, triangles))
+
+
+def test_not_isomorphic_message():
+    with pytest.raises(NotIsomorphic, match='PDB'):
+        find_isomorphism(read_smiles('CCO'), read_smiles('CCN'), names=('PDB', 'SMILES'))
+
+
+def test_cancel():
+    molecule = read_smiles(MOLECULES['PEG'])
+
+    def cancel(fraction):
+        raise MatchCancelled
+
+    with pytest.raises(MatchCancelled):
+        find_isomorphism(shuffled(molecule), molecule, callback=cancel)
+
+
+def test_timeout():
+    molecule = read_smiles(MOLECULES['PEG'])
+    with pytest.raises(MatchTimeout):
+        find_isomorphism(shuffled(molecule), molecule, timeout=0)
@@ -0,0 +1,50 @@
+import pytest
+
+from pycgbuilder import molecule_widget
+from pycgbuilder.matching import MatchTimeout
+from pycgbuilder.molecule_widget import MatchWorker, parse_chain, parse_resids
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', None),
+    ('  ', None),
+    ('5', (5, 5)),
+    ('1-20', (1, 20)),
+    (' 1-20 ', (1, 20)),
+    ('-3', (-3, -3)),
+    ('-3-2', (-3, 2)),
+    ('-3--1', (-3, -1)),
+])
+def test_parse_resids(text, expected):
+    assert parse_resids(text) == expected
+
+
+@pytest.mark.parametrize('text', ['a', '1-', '1-2-3', '1--', '--1', '1 - 2'])
+def test_parse_resids_invalid(text):
+    with pytest.raises(ValueError):
+        parse_resids(text)
+
+
+def test_parse_chain():
+    assert parse_chain('') is None
+    assert parse_chain(' ') == ''
+    assert parse_chain('A') == 'A'
+
+
+@pytest.mark.parametrize('error, expected', [
+    (MatchTimeout(), ['Could not match the PDB and SMILES atoms within 5 seconds. '
+                      'Are they the same molecule?']),
+    (ValueError('different elements'), ['different elements']),
+    (KeyError('element'), ["'element'"]),
+])
+def test_match_worker_failed(monkeypatch, error, expected):
+    def merge_molecules(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(molecule_widget, 'merge_molecules', merge_molecules)
+    worker = MatchWorker(None, None, timeout=5)
+    messages = []
+    worker.failed.connect(messages.append)
+    worker.run()
+    assert messages == expected
+    assert worker.molecule is None
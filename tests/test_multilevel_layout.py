@@ -0,0 +1,52 @@
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from pycgbuilder.multilevel_layout import multilevel_layout
+
+
+def bond_lengths(graph, embedding):
+    edges = embedding.edge_rows(graph)
+    return np.linalg.norm(embedding.positions[edges[:, 0]] - embedding.positions[edges[:, 1]],
+                          axis=1)
+
+
+@pytest.mark.parametrize('graph', [
+    nx.path_graph(2000),
+    nx.balanced_tree(3, 6),
+    nx.grid_2d_graph(30, 30),
+], ids=['polymer', 'dendrimer', 'grid'])
+def test_multilevel_layout(graph):
+    embedding = multilevel_layout(graph)
+    assert len(embedding) == len(graph)
+    assert set(embedding) == set(graph)
+    assert np.all(np.isfinite(embedding.positions))
+    lengths = bond_lengths(graph, embedding)
+    assert lengths.std() < lengths.mean()
+    # No atoms on top of each other
+    distances, _ = cKDTree(embedding.positions).query(embedding.positions, 2)
+    assert distances[:, 1].min() > 0.2 * lengths.mean()
+
+
+def test_multilevel_layout_seed():
+    graph = nx.balanced_tree(3, 5)
+    first = multilevel_layout(graph, seed=1)
+    second = multilevel_layout(graph, seed=1)
+    assert np.array_equal(first.positions, second.positions)
+
+
+def test_multilevel_layout_small():
+    # Fewer atoms than the coarsest level
+    graph = nx.cycle_graph(6)
+    embedding = multilevel_layout(graph)
+    assert set(embedding) == set(graph)
+    assert len(multilevel_layout(nx.Graph())) == 0
+
+
+def test_multilevel_layout_callback():
+    graph = nx.path_graph(500)
+    seen = []
+    multilevel_layout(graph, callback=seen.append)
+    assert seen
+    assert all(len(embedding) == len(graph) for embedding in seen)
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+from vermouth.pdb import read_pdb
+
+from pycgbuilder.pdb_reader import read_pdb_molecule
+
+ATOM = '{:6}{:5d} {:<4}{:1}{:<4}{:1}{:4d}    {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}          {:>2}{:2}'
+RESIDUE = [('N', 'N'), ('CA', ''), ('C', 'C'), ('O', 'O'), ('H', 'H')]
+
+
+def atom_line(atomid, name, resname, chain, resid, position, element='', altloc=' ',
+              charge='', record='ATOM'):
+    return ATOM.format(record, atomid, name, altloc, resname, chain, resid, *position,
+                       1.0, 0.0, element, charge)
+
+
+def write_pdb(path, n_models=2, chains='ABC', n_residues=5, solvent=True,
+              leading_ter=False, linked_chains=False, seed=0):
+    """
+    Writes a PDB file with `n_models` models of `chains` of alanines, each
+    ending with TER, with alternative locations, HETATM records, charges,
+    atoms without element, water, and CONECT records. If `linked_chains`,
+    CONECT records also join each chain to the next one.
+    """
+    rng = np.random.default_rng(seed)
+    lines = ['HEADER    TEST', 'REMARK   1 TEST']
+    conects = []
+    for model in range(1, n_models + 1):
+        if n_models > 1:
+            lines.append('MODEL     {:4d}'.format(model))
+        atomid = 1
+        if leading_ter:
+            # Excluded atoms do not end the first molecule
+            lines.append(atom_line(atomid, 'OW', 'SOL', 'W', 1, rng.random(3) * 10, 'O'))
+            lines.append('TER')
+            atomid += 1
+        previous = None
+        for chain in chains:
+            if not linked_chains:
+                previous = None
+            for resid in range(1, n_residues + 1):
+                for name, element in RESIDUE:
+                    charge = '1+' if name == 'N' and resid == 1 else ''
+                    record = 'ATOM' if resid % 2 else 'HETATM'
+                    lines.append(atom_line(atomid, name, 'ALA', chain, resid,
+                                           rng.random(3) * 30, element, charge=charge,
+                                           record=record))
+                    linked = linked_chains and resid == 1 and name == RESIDUE[0][0]
+                    if model == 1 and previous is not None and (rng.random() < 0.9 or linked):
+                        conects.append((previous, atomid))
+                    previous = atomid
+                    atomid += 1
+                lines.append(atom_line(atomid, 'CB', 'ALA', chain, resid, rng.random(3) * 30,
+                                       'C', altloc='B'))
+                atomid += 1
+            lines.append('TER')
+        if solvent:
+            for resid in range(3):
+                lines.append(atom_line(atomid, 'OW', 'SOL', 'W', resid, rng.random(3) * 30, 'O'))
+                atomid += 1
+        if n_models > 1:
+            lines.append('ENDMDL')
+    lines.extend('CONECT{:5d}{:5d}'.format(*conect) for conect in conects)
+    lines.append('END')
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'n_models': 1},
+    {'n_models': 1, 'leading_ter': True},
+    {'chains': 'A', 'solvent': False},
+    {'chains': 'AB', 'linked_chains': True},
+    {'n_models': 1, 'linked_chains': True},
+], ids=['models', 'single model', 'leading TER', 'single chain', 'TER joined by CONECT',
+        'TERs joined by CONECT'])
+def test_same_as_vermouth(tmp_path, kwargs):
+    path = str(write_pdb(tmp_path / 'test.pdb', **kwargs))
+    expected = read_pdb(path)[0]
+    molecule = read_pdb_molecule(path)
+    assert list(molecule.nodes) == list(expected.nodes)
+    for node in expected:
+        attrs = molecule.nodes[node]
+        assert attrs.keys() == expected.nodes[node].keys()
+        for key, value in expected.nodes[node].items():
+            if key == 'position':
+                assert np.allclose(attrs[key], value)
+            else:
+                assert attrs[key] == value
+                assert type(attrs[key]) == type(value)
+    bonds = {frozenset(edge): distance for *edge, distance in molecule.edges(data='distance')}
+    expected_bonds = {frozenset(edge): distance
+                      for *edge, distance in expected.edges(data='distance')}
+    assert expected_bonds
+    if kwargs.get('linked_chains'):
+        # vermouth bonds the wrong atoms for the CONECT records that join two
+        # molecules, since it keeps the node keys from before the merge.
+        links = {bond for bond in bonds
+                 if len({molecule.nodes[idx]['chain'] for idx in bond}) > 1}
+        assert links
+        assert len(links) == len(set(expected_bonds) - set(bonds))
+        bonds = {bond: distance for bond, distance in bonds.items() if bond not in links}
+        expected_bonds = {bond: distance for bond, distance in expected_bonds.items()
+                          if bond in bonds}
+    assert bonds.keys() == expected_bonds.keys()
+    for bond, distance in expected_bonds.items():
+        assert bonds[bond] == pytest.approx(distance)
+
+
+def test_first_molecule_only(tmp_path):
+    path = write_pdb(tmp_path / 'test.pdb')
+    molecule = read_pdb_molecule(path)
+    assert {attrs['chain'] for attrs in molecule.nodes.values()} == {'A'}
+    # Alternative location B is left out
+    assert 'CB' not in {attrs['atomname'] for attrs in molecule.nodes.values()}
+
+
+def test_molecules_joined_by_conect(tmp_path):
+    path = write_pdb(tmp_path / 'test.pdb', chains='AB', linked_chains=True)
+    molecule = read_pdb_molecule(path)
+    assert {attrs['chain'] for attrs in molecule.nodes.values()} == {'A', 'B'}
+    assert len(molecule) == len(read_pdb(str(path))[0])
+
+
+def test_select(tmp_path):
+    path = write_pdb(tmp_path / 'test.pdb')
+    molecule = read_pdb_molecule(path, chain='B', resids=(2, 3))
+    assert {(attrs['chain'], attrs['resid']) for attrs in molecule.nodes.values()} == {
+        ('B', 2), ('B', 3)}
+    assert len(molecule) == 2 * len(RESIDUE)
+    # Only bonds between selected atoms
+    assert molecule.edges
+    molecule = read_pdb_molecule(path, resids=(5, 5))
+    assert {(attrs['chain'], attrs['resid']) for attrs in molecule.nodes.values()} == {
+        ('A', 5), ('B', 5), ('C', 5)}
+
+
+def test_empty(tmp_path):
+    path = tmp_path / 'empty.pdb'
+    path.write_text('')
+    assert len(read_pdb_molecule(path)) == 0
+
+
+def test_select_blank_chain(tmp_path):
+    path = write_pdb(tmp_path / 'test.pdb', n_models=1, chains='A ')
+    molecule = read_pdb_molecule(path, chain='')
+    assert len(molecule) == 5 * len(RESIDUE)
+    assert {attrs['chain'] for attrs in molecule.nodes.values()} == {''}
+    assert len(read_pdb_molecule(path, chain=' ')) == len(molecule)
+
+
+def test_select_negative_resids(tmp_path):
+    path = tmp_path / 'test.pdb'
+    path.write_text('\n'.join(atom_line(idx + 1, 'C', 'RES', 'A', resid, (idx, 0, 0), 'C')
+                              for idx, resid in enumerate(range(-3, 3))) + '\nEND\n')
+    molecule = read_pdb_molecule(path, resids=(-2, -1))
+    assert sorted(attrs['resid'] for attrs in molecule.nodes.values()) == [-2, -1]
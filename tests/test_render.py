@@ -0,0 +1,53 @@
+import json
+
+from pycgbuilder.render import main, run_render, write_contact_sheet
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def entry(index, name=None, **kwargs):
+    return dict(kwargs, index=index, name=name)
+
+
+def test_run_render(tmp_path):
+    entries = [entry(0, 'ethanol #1', smiles='CCO', beads=[{'atoms': 'C0 C1'}, {'atoms': 'O2'}]),
+               entry(1, 'acetic acid', smiles='CC(=O)O', beads=[{'atoms': 'C0 C1 O2 O3'}],
+                     layout='Multilevel'),
+               entry(2, 'bad', smiles='CCO', beads=[{'atoms': 'X9'}])]
+    results = run_render(entries, tmp_path / 'images', formats=['png', 'svg'], jobs=1,
+                         size=(2, 2), dpi=50)
+    assert [result['status'] for result in results] == ['ok', 'ok', 'failed']
+    assert [result['layout'] for result in results] == ['VSEPR', 'Multilevel', 'VSEPR']
+    assert results[0]['files'] == [str(tmp_path / 'images' / 'ethanol #1.{}'.format(ext))
+                                   for ext in ('png', 'svg')]
+    for result in results[:2]:
+        png, svg = result['files']
+        with open(png, 'rb') as file_in:
+            assert file_in.read(len(PNG_SIGNATURE)) == PNG_SIGNATURE
+        with open(svg) as file_in:
+            assert '<svg' in file_in.read()
+    assert set(results[0]['timings']) == {'read', 'map', 'layout', 'draw', 'write', 'total'}
+
+    sheet = tmp_path / 'sheet.html'
+    write_contact_sheet(results, sheet, title='Test & check')
+    text = sheet.read_text()
+    assert '<title>Test &amp; check</title>' in text
+    # Links are relative to the sheet, and quoted
+    assert '<a href="images/ethanol%20%231.png"><img src="images/ethanol%20%231.png"' in text
+    assert 'images/acetic%20acid.png' in text
+    assert '<li>bad: map: KeyError' in text
+
+
+def test_main(tmp_path, capsys, monkeypatch):
+    monkeypatch.setenv('PYCGBUILDER_CACHE', str(tmp_path / 'cache'))
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps([{'smiles': 'CCO', 'beads': [{'atoms': 'C0 C1 O2'}]},
+                                    {'smiles': 'CCN', 'beads': [{'atoms': 'N2'}]}]))
+    sheet = tmp_path / 'out' / 'index.html'
+    assert main([str(manifest), '-o', str(tmp_path / 'out'), '-j', '1', '--size', '2', '2',
+                 '--html', str(sheet)]) == 0
+    capsys.readouterr()
+    assert sorted(path.name for path in (tmp_path / 'out').iterdir()) == [
+        'CCN.png', 'CCO.png', 'index.html']
+    text = sheet.read_text()
+    assert 'src="CCO.png"' in text and 'src="CCN.png"' in text
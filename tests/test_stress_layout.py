@@ -0,0 +1,72 @@
+import math
+
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from pycgbuilder.stress_layout import (adjacency_matrix, hop_distances, stress_layout,
+                                       vsepr_distances)
+
+
+def bond_lengths(graph, embedding):
+    edges = embedding.edge_rows(graph)
+    return np.linalg.norm(embedding.positions[edges[:, 0]] - embedding.positions[edges[:, 1]],
+                          axis=1)
+
+
+def closest_pair(embedding):
+    distances, _ = cKDTree(embedding.positions).query(embedding.positions, 2)
+    return distances[:, 1].min()
+
+
+def test_vsepr_distances():
+    distances = vsepr_distances([0, 1, 2, 3, -1])
+    assert np.allclose(distances[:4], [0, 1, math.sqrt(3), math.sqrt(7)])
+    assert distances[4] == np.inf
+
+
+def test_hop_distances():
+    graph = nx.path_graph(4)
+    graph.add_node(4)
+    hops = hop_distances(adjacency_matrix(graph, list(graph)))
+    assert hops.dtype == np.int32
+    assert hops[0].tolist() == [0, 1, 2, 3, -1]
+    assert hops[4].tolist() == [-1, -1, -1, -1, 0]
+
+
+@pytest.mark.parametrize('graph, dense_limit', [
+    (nx.path_graph(50), 1000),
+    (nx.cycle_graph(6), 1000),
+    # Sparse stress
+    (nx.path_graph(1500), 1000),
+])
+def test_stress_layout(graph, dense_limit):
+    embedding = stress_layout(graph, dense_limit=dense_limit)
+    assert sorted(embedding) == sorted(graph)
+    assert np.all(np.isfinite(embedding.positions))
+    lengths = bond_lengths(graph, embedding)
+    assert lengths.mean() == pytest.approx(1, rel=0.1)
+    assert lengths.std() < 0.1 * lengths.mean()
+    assert closest_pair(embedding) > 0.5
+
+
+def test_stress_layout_disconnected():
+    graph = nx.disjoint_union(nx.path_graph(5), nx.cycle_graph(6))
+    embedding = stress_layout(graph)
+    first = embedding.positions[embedding.rows(range(5))]
+    second = embedding.positions[embedding.rows(range(5, 11))]
+    # Components are put next to each other
+    assert first[:, 0].max() < second[:, 0].min()
+
+
+def test_stress_layout_empty():
+    assert len(stress_layout(nx.Graph())) == 0
+
+
+def test_stress_layout_callback():
+    graph = nx.path_graph(10)
+    seen = []
+    stress_layout(graph, callback=seen.append)
+    assert seen
+    assert all(sorted(embedding) == sorted(graph) for embedding in seen)
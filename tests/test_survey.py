@@ -0,0 +1,65 @@
+import time
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from pycgbuilder.embed_molecule import LayoutCancelled, compute_embedding, survey_embeddings
+from pycgbuilder.embedding_cache import EmbeddingCache
+
+
+def molecule(n_atoms=300):
+    graph = nx.path_graph(n_atoms)
+    nx.set_node_attributes(graph, 'C', 'element')
+    return graph
+
+
+@pytest.mark.parametrize('n_jobs, parallel_threshold', [(1, 0), (2, 0)],
+                         ids=['serial', 'processes'])
+def test_survey(n_jobs, parallel_threshold):
+    graph = molecule()
+    names = ['VSEPR', 'Multilevel']
+    results = list(survey_embeddings(graph, names, n_jobs=n_jobs,
+                                     parallel_threshold=parallel_threshold))
+    assert sorted(name for name, _, _ in results) == sorted(names)
+    for _, embedding, _ in results:
+        assert set(embedding) == set(graph)
+
+
+@pytest.mark.parametrize('n_jobs, parallel_threshold', [(1, 0), (2, 0)],
+                         ids=['serial', 'processes'])
+def test_survey_cancel(n_jobs, parallel_threshold):
+    graph = molecule(20000)
+    start = time.monotonic()
+
+    def cancel():
+        if time.monotonic() - start > 0.5:
+            raise LayoutCancelled
+
+    results = survey_embeddings(graph, ['VSEPR', 'Multilevel'], n_jobs=n_jobs,
+                                parallel_threshold=parallel_threshold, callback=cancel)
+    with pytest.raises(LayoutCancelled):
+        list(results)
+    assert time.monotonic() - start < 5
+
+
+def conformer(positions):
+    graph = nx.path_graph(len(positions))
+    for node, position in zip(graph, positions):
+        graph.nodes[node].update(element='C', position=np.array(position, dtype=float))
+    return graph
+
+
+def test_projection_not_cached(tmp_path):
+    # Two conformers with the same atoms and bonds
+    straight = conformer([(0, 0, 0), (0.15, 0, 0), (0.3, 0, 0), (0.45, 0, 0)])
+    bent = conformer([(0, 0, 0), (0.15, 0, 0), (0.15, 0.15, 0), (0.3, 0.15, 0)])
+    cache = EmbeddingCache(tmp_path)
+    compute_embedding(straight, '3D projection', cache=cache)
+    embedding = compute_embedding(bent, '3D projection', cache=cache)
+    expected = compute_embedding(bent, '3D projection')
+    assert np.allclose(embedding.positions[embedding.rows(bent)],
+                       expected.positions[expected.rows(bent)])
+    names = [name for name, _, _ in survey_embeddings(bent, ['3D projection'], cache=cache)]
+    assert names == ['3D projection']
+    assert not list(tmp_path.glob('*.npz'))